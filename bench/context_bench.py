@@ -0,0 +1,58 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Microbenchmark for Context attribute lookup.  Run from the top of
+# a checkout:  PYTHONPATH=. python bench/context_bench.py
+
+from cStringIO import StringIO
+import timeit
+
+from bigitr import context
+
+LOOKUPS = 100000
+
+def makeContext():
+    appConfig = StringIO('[global]\nlogdir = /logs\ngitdir = /git\n'
+                         '[import]\ncvsdir = /cvsin\n'
+                         '[export]\ncvsdir = /cvsout\n')
+    repConfig = StringIO('[GLOBAL]\ngitroot = git@host\n'
+                         '[dir/repo]\ncvspath = sub/module\n')
+    return context.Context(appConfig, repConfig)
+
+def dirLookup(ctx, attr):
+    'the lookup that Context.__getattr__ used to do on every call'
+    if attr in dir(ctx._ac):
+        return getattr(ctx._ac, attr)
+    if attr in dir(ctx._rm):
+        return getattr(ctx._rm, attr)
+
+def report(name, seconds):
+    print '%-32s %8.3f usec/lookup' %(name, seconds * 1e6 / LOOKUPS)
+
+def main():
+    ctx = makeContext()
+    ac = ctx._ac
+    report('direct AppConfig attribute',
+        timeit.timeit(lambda: ac.getGitDir, number=LOOKUPS))
+    report('Context -> AppConfig',
+        timeit.timeit(lambda: ctx.getGitDir, number=LOOKUPS))
+    report('Context -> RepositoryConfig',
+        timeit.timeit(lambda: ctx.getGitRef, number=LOOKUPS))
+    report('dir() scan -> RepositoryConfig',
+        timeit.timeit(lambda: dirLookup(ctx, 'getGitRef'), number=LOOKUPS))
+
+if __name__ == '__main__':
+    main()
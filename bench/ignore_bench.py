@@ -0,0 +1,83 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Benchmark for filtering a large path set through an ignore file.
+# Run from the top of a checkout:  PYTHONPATH=. python bench/ignore_bench.py
+
+import fnmatch
+import os
+import shutil
+import tempfile
+import time
+
+from bigitr import ignore
+
+PATHS = 100000
+
+PATTERNS = ['*.o', '*.a', '*.so', '*.pyc', '*~', '*.tar.gz', 'core',
+            '.DS_Store', 'Thumbs.db', '*.sw[op]', 'build/*', '/dist/*',
+            'tmp*', '*.log', '*.class', 'target/*', '*.bak']
+
+class Log(object):
+    def __init__(self):
+        self.stderr = os.open(os.devnull, os.O_WRONLY)
+
+    def writeError(self, message):
+        pass
+
+def makePaths():
+    exts = ['c', 'h', 'o', 'py', 'pyc', 'txt', 'java', 'class', 'log']
+    return set('dir%d/sub%d/file%d.%s' %(i % 97, i % 13, i, exts[i % len(exts)])
+               for i in range(PATHS))
+
+def fnmatchFilter(log, patterns, pathSet):
+    'the per-pattern scan that Ignore.filter used to do'
+    filtered = set(pathSet)
+    for exp in patterns:
+        if '/' in exp:
+            ignored = set(fnmatch.filter(pathSet, exp))
+        else:
+            ignored = set(x for x in pathSet
+                          if fnmatch.fnmatch(os.path.basename(x), exp))
+        for path in ignored:
+            os.write(log.stderr, 'ignore: %s ignores file %s\n' %(exp, path))
+        filtered -= ignored
+    return filtered
+
+def report(name, seconds):
+    print '%-32s %8.3f sec/%d paths' %(name, seconds, PATHS)
+
+def main():
+    d = tempfile.mkdtemp(suffix='.bigitr')
+    try:
+        ignoreFile = d + '/.gitignore'
+        file(ignoreFile, 'w').write('\n'.join(PATTERNS) + '\n')
+        log = Log()
+        paths = makePaths()
+
+        start = time.time()
+        old = fnmatchFilter(log, PATTERNS, paths)
+        report('per-pattern fnmatch', time.time() - start)
+
+        start = time.time()
+        new = ignore.Ignore(log, ignoreFile).filter(paths)
+        report('compiled Ignore.filter', time.time() - start)
+        assert old == new
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == '__main__':
+    main()
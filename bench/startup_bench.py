@@ -0,0 +1,85 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Cold start budget for the bigitr command line.  Run from the top of
+# a checkout:  PYTHONPATH=. python bench/startup_bench.py
+#
+# Measures `bigitr help` in a fresh interpreter, net of the time the
+# bare interpreter takes to start, and exits non-zero when it exceeds
+# the budget (milliseconds, BIGITR_STARTUP_BUDGET, default 25) or when
+# any module that should be loaded lazily has been imported.
+
+import os
+import subprocess
+import sys
+import time
+
+RUNS = 20
+BUDGET = float(os.environ.get('BIGITR_STARTUP_BUDGET', '25'))
+
+# modules that bigitr must not import just to parse its arguments
+LAZY = ('ConfigParser', 'email', 'gzip', 'smtplib', 'subprocess',
+        'bigitr.context', 'bigitr.git', 'bigitr.sync')
+
+HELP = '''
+import sys
+sys.stdout = open('/dev/null', 'w')
+import bigitr
+try:
+    bigitr.main(['help'])
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(sorted(sys.modules)))
+'''
+
+def coldStart(code):
+    'return: (seconds, stderr) for the best of RUNS fresh interpreters'
+    best = None
+    for i in range(RUNS):
+        start = time.time()
+        p = subprocess.Popen([sys.executable, '-c', code],
+                             stderr=subprocess.PIPE)
+        _, err = p.communicate()
+        elapsed = time.time() - start
+        if p.returncode:
+            raise SystemExit('%r failed:\n%s' %(code, err))
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, err
+
+def main():
+    bare, _ = coldStart('pass')
+    bigitr, modules = coldStart(HELP)
+    modules = set(modules.split())
+    cost = (bigitr - bare) * 1000
+    print '%-32s %8.1f msec' %('interpreter', bare * 1000)
+    print '%-32s %8.1f msec (budget %0.1f)' %('bigitr help', cost, BUDGET)
+
+    failed = False
+    eager = sorted(x for x in LAZY
+                   if x in modules or [y for y in modules
+                                       if y.startswith(x + '.')])
+    if eager:
+        print 'imported eagerly: %s' %', '.join(eager)
+        failed = True
+    if cost > BUDGET:
+        print 'startup budget exceeded'
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
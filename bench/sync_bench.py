@@ -0,0 +1,388 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# End-to-end scaling benchmark.  Run from the top of a checkout:
+#   PYTHONPATH=. python bench/sync_bench.py [--files N ...] [--output F]
+#
+# Generates a local CVSROOT and bare Git remotes of configurable size,
+# then for each round changes CVS and Git and times the Importer,
+# Merger, Exporter and Synchronizer against them.  Every step records
+# wall clock time, CPU time of bigitr and of the commands it runs,
+# peak RSS, and commands run, as JSON that --compare can read back to
+# show the change between two runs.  Exits non-zero if any step
+# reported an error.  Skipped when cvs is not installed.
+
+import argparse
+from cStringIO import StringIO
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from bigitr import context
+from bigitr import cvsimport
+from bigitr import git
+from bigitr import gitexport
+from bigitr import gitmerge
+from bigitr import metrics
+from bigitr import sync
+from bigitr import util
+
+# change whenever the results change shape
+VERSION = 1
+# subdirectories per directory in the generated trees
+FANOUT = 4
+# the files each side of the benchmark changes, by index, so that
+# changes never conflict: CVS changes even files, while Git changes
+# files on the feature branch and on master separately
+CVS_FILES = lambda i: i % 2 == 0
+FEATURE_FILES = lambda i: i % 4 == 1
+MASTER_FILES = lambda i: i % 4 == 3
+
+APPCONFIG = '''[global]
+logdir = %(workdir)s/log
+gitdir = %(workdir)s/git
+compresslogs = false
+[export]
+cvsdir = %(workdir)s/cvs
+[merge]
+[import]
+cvsdir = %(workdir)s/exp
+'''
+
+def run(*args, **kwargs):
+    devnull = file(os.devnull, 'w')
+    subprocess.check_call(args, stdout=devnull, **kwargs)
+
+def version(*args):
+    'return: first line of output, or None if the program is missing'
+    try:
+        p = subprocess.Popen(args, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    out, _ = p.communicate()
+    lines = [x.strip() for x in out.split('\n') if x.strip()]
+    return lines and lines[0] or None
+
+
+class Generator(object):
+    'synthetic CVS modules and Git remotes in workdir'
+
+    def __init__(self, workdir, args):
+        self.workdir = workdir
+        self.args = args
+        self.cvsroot = workdir + '/cvsroot'
+        self.gitroot = workdir + '/gitroot'
+        self.random = random.Random(args.seed)
+        for d in ('log', 'git', 'cvs', 'exp', 'cvsco', 'gitco', 'gitroot/git'):
+            os.makedirs('/'.join((workdir, d)))
+        self.modules = ['bench%d' %i for i in range(args.repositories)]
+        self.branches = ['b%d' %(i + 1) for i in range(args.branches)]
+
+    def fileName(self, i):
+        dirs = ['d%d' %((i // FANOUT ** k) % FANOUT)
+                for k in range(self.args.depth)]
+        return '/'.join(dirs + ['f%05d.txt' %i])
+
+    def content(self):
+        lines = []
+        size = 0
+        while size < self.args.size:
+            line = ' '.join('%08x' %self.random.getrandbits(32)
+                            for x in range(7)) + '\n'
+            lines.append(line)
+            size += len(line)
+        return ''.join(lines)[:self.args.size]
+
+    def writeTree(self, baseDir):
+        for i in range(self.args.files):
+            name = '/'.join((baseDir, self.fileName(i)))
+            if not os.path.exists(os.path.dirname(name)):
+                os.makedirs(os.path.dirname(name))
+            file(name, 'w').write(self.content())
+
+    def change(self, baseDir, which, tag):
+        'append a line to a sample of the files selected by which'
+        candidates = [i for i in range(self.args.files) if which(i)]
+        count = min(len(candidates),
+                    max(1, int(self.args.files * self.args.changes)))
+        for i in self.random.sample(candidates, count):
+            file('/'.join((baseDir, self.fileName(i))), 'a').write(
+                'changed %s\n' %tag)
+
+    def repoConfig(self, full=True):
+        'full=False configures only the imports that create the branches'
+        text = ['[GLOBAL]\ncvsroot = %s\ngitroot = %s/\n'
+                %(self.cvsroot, self.gitroot)]
+        for module in self.modules:
+            text.append('[git/%s]\ncvspath = %s\n' %(module, module))
+            for branch in self.branches:
+                text.append('cvs.%s = %s\n' %(branch, branch))
+            if full:
+                text.append('git.master = %s\n' %self.branches[0])
+                text.append('merge.cvs-%s = master\n' %self.branches[0])
+                text.append('merge.feature = master\n')
+        return ''.join(text)
+
+    def context(self, full=True):
+        return context.Context(StringIO(APPCONFIG %{'workdir': self.workdir}),
+                               StringIO(self.repoConfig(full)))
+
+    def create(self):
+        run('cvs', '-d', self.cvsroot, 'init')
+        for module in self.modules:
+            tree = '/'.join((self.workdir, 'tree', module))
+            os.makedirs(tree)
+            self.writeTree(tree)
+            run('cvs', '-Q', '-d', self.cvsroot, 'import', '-m', 'initial',
+                module, 'vendor', 'start', cwd=tree)
+            for branch in self.branches:
+                run('cvs', '-Q', '-d', self.cvsroot, 'rtag', '-b', branch,
+                    module)
+            run('git', 'init', '-q', '--bare',
+                '/'.join((self.gitroot, 'git', module)))
+        util.removeRecursive(self.workdir + '/tree')
+
+    def createGitBranches(self):
+        'after the first import: master and feature start from the import'
+        for module in self.modules:
+            remote = '/'.join((self.gitroot, 'git', module))
+            for branch in ('master', 'feature'):
+                run('git', '--git-dir', remote, 'branch', branch,
+                    'cvs-' + self.branches[0])
+
+    def changeCVS(self, tag):
+        for module in self.modules:
+            for branch in self.branches:
+                name = '-'.join((module, branch))
+                co = '/'.join((self.workdir, 'cvsco', name))
+                if not os.path.exists(co):
+                    # cvs checkout -d does not accept absolute paths
+                    run('cvs', '-Q', '-d', self.cvsroot, 'checkout',
+                        '-r', branch, '-d', name, module,
+                        cwd=self.workdir + '/cvsco')
+                else:
+                    run('cvs', '-Q', 'update', '-d', cwd=co)
+                self.change(co, CVS_FILES, tag)
+                run('cvs', '-Q', 'commit', '-m', 'bench change ' + tag,
+                    cwd=co)
+
+    def changeGit(self, branch, which, tag):
+        for module in self.modules:
+            co = '/'.join((self.workdir, 'gitco', module))
+            if not os.path.exists(co):
+                run('git', 'clone', '-q',
+                    '/'.join((self.gitroot, 'git', module)), co)
+            run('git', 'fetch', '-q', 'origin', cwd=co)
+            run('git', 'checkout', '-q', '-B', branch, 'origin/' + branch,
+                cwd=co)
+            self.change(co, which, tag)
+            run('git', 'commit', '-q', '-a', '-m', 'bench change ' + tag,
+                cwd=co)
+            run('git', 'push', '-q', 'origin', branch, cwd=co)
+
+
+class Step(object):
+    'resource use of one timed step'
+
+    def __init__(self, name, roundNumber, ctx):
+        self.name = name
+        self.round = roundNumber
+        self.ctx = ctx
+
+    def __enter__(self):
+        self.ctx.metrics = metrics.Metrics(None)
+        self.self0 = resource.getrusage(resource.RUSAGE_SELF)
+        self.children0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.time() - self.start
+        for l in self.ctx.logs.values():
+            l.close()
+        self1 = resource.getrusage(resource.RUSAGE_SELF)
+        children1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = lambda r: r.ru_utime + r.ru_stime
+        m = self.ctx.metrics
+        self.result = {
+            'step': self.name,
+            'round': self.round,
+            'seconds': round(seconds, 3),
+            'cpuSeconds': round(cpu(self1) - cpu(self.self0), 3),
+            'childCpuSeconds': round(cpu(children1) - cpu(self.children0), 3),
+            # peaks so far in the run, in KiB; ru_maxrss never decreases
+            'maxRSS': self1.ru_maxrss,
+            'childMaxRSS': children1.ru_maxrss,
+            'commands': sum(m.commands.values()),
+            'copiedBytes': sum(m.copied.values()),
+            'errors': sum(m.errors.values()),
+        }
+        self.ctx.metrics = None
+
+
+def benchmark(gen, rounds):
+    'return: [step result, ...]'
+    setup = gen.context(full=False)
+    with Step('initial import', 0, setup) as s:
+        cvsimport.Importer(setup).importAll()
+    results = [s.result]
+    gen.createGitBranches()
+
+    ctx = gen.context()
+    for r in range(1, rounds + 1):
+        gen.changeCVS('%d import' %r)
+        with Step('import', r, ctx) as s:
+            cvsimport.Importer(ctx).importAll()
+        results.append(s.result)
+
+        gen.changeGit('feature', FEATURE_FILES, '%d merge' %r)
+        with Step('merge', r, ctx) as s:
+            merger = gitmerge.Merger(ctx)
+            for repository in ctx.getRepositories():
+                merger.mergeBranches(repository, git.Git(ctx, repository))
+        results.append(s.result)
+
+        with Step('export', r, ctx) as s:
+            gitexport.Exporter(ctx).exportAll()
+        results.append(s.result)
+
+        gen.changeCVS('%d sync' %r)
+        gen.changeGit('master', MASTER_FILES, '%d sync' %r)
+        with Step('sync', r, ctx) as s:
+            sync.Synchronizer(ctx).synchronizeAll()
+        results.append(s.result)
+    return results
+
+def summarize(results):
+    'return: {step: median seconds over the rounds}'
+    times = {}
+    for result in results:
+        times.setdefault(result['step'], []).append(result['seconds'])
+    return dict((step, sorted(t)[len(t) // 2]) for step, t in times.items())
+
+def report(results, out=sys.stdout):
+    out.write('%-16s %5s %9s %9s %9s %10s %9s %6s\n' %(
+        'step', 'round', 'seconds', 'cpu', 'children', 'maxrss KiB',
+        'commands', 'errors'))
+    for r in results:
+        out.write('%-16s %5d %9.3f %9.3f %9.3f %10d %9d %6d\n' %(
+            r['step'], r['round'], r['seconds'], r['cpuSeconds'],
+            r['childCpuSeconds'], max(r['maxRSS'], r['childMaxRSS']),
+            r['commands'], r['errors']))
+
+def compare(old, new, out=sys.stdout):
+    if old['parameters'] != new['parameters']:
+        out.write('warning: parameters differ from %s\n'
+                  %json.dumps(old['parameters'], sort_keys=True))
+    out.write('%-16s %9s %9s %7s\n' %('step', 'before', 'after', 'ratio'))
+    for step in sorted(new['summary']):
+        before = old['summary'].get(step)
+        after = new['summary'][step]
+        if not before:
+            out.write('%-16s %9s %9.3f\n' %(step, '-', after))
+        else:
+            out.write('%-16s %9.3f %9.3f %7.2f\n' %(
+                step, before, after, after / before))
+
+def main(argv):
+    ap = argparse.ArgumentParser(description='Time bigitr on generated'
+                                 ' CVS and Git repositories')
+    ap.add_argument('--repositories', type=int, default=2)
+    ap.add_argument('--files', type=int, default=100,
+                    help='files per repository')
+    ap.add_argument('--size', type=int, default=2048,
+                    help='bytes per file')
+    ap.add_argument('--depth', type=int, default=2,
+                    help='directory depth, with %d subdirectories each'
+                    %FANOUT)
+    ap.add_argument('--branches', type=int, default=2,
+                    help='CVS branches imported per repository')
+    ap.add_argument('--changes', type=float, default=0.1,
+                    help='fraction of files changed on each side per step')
+    ap.add_argument('--rounds', type=int, default=2)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--output', '-o', help='write JSON results to this file')
+    ap.add_argument('--compare', help='JSON results of an earlier run')
+    ap.add_argument('--keep', action='store_true',
+                    help='keep the generated repositories')
+    args = ap.parse_args(argv[1:])
+
+    cvsVersion = version('cvs', '--version')
+    if cvsVersion is None:
+        print 'cvs not found; skipped'
+        return 0
+    parameters = dict((x, getattr(args, x)) for x in (
+        'repositories', 'files', 'size', 'depth', 'branches', 'changes',
+        'rounds', 'seed'))
+
+    for var, value in (('GIT_AUTHOR_NAME', 'bigitr bench'),
+                       ('GIT_AUTHOR_EMAIL', 'bench@localhost'),
+                       ('GIT_COMMITTER_NAME', 'bigitr bench'),
+                       ('GIT_COMMITTER_EMAIL', 'bench@localhost')):
+        os.environ.setdefault(var, value)
+    os.environ.pop('CVSROOT', None)
+
+    oldcwd = os.getcwd()
+    workdir = tempfile.mkdtemp(suffix='.bigitr-bench')
+    try:
+        gen = Generator(workdir, args)
+        start = time.time()
+        gen.create()
+        generated = time.time() - start
+        results = benchmark(gen, args.rounds)
+    finally:
+        os.chdir(oldcwd)
+        if args.keep:
+            print 'repositories kept in %s' %workdir
+        else:
+            util.removeRecursive(workdir)
+
+    new = {
+        'version': VERSION,
+        'time': int(time.time()),
+        'parameters': parameters,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'git': version('git', '--version'),
+            'cvs': cvsVersion,
+        },
+        'generateSeconds': round(generated, 3),
+        'steps': results,
+        'summary': summarize([x for x in results if x['round']]),
+    }
+    report(results)
+    if args.output:
+        f = file(args.output, 'w')
+        json.dump(new, f, indent=1, sort_keys=True)
+        f.close()
+    if args.compare:
+        compare(json.load(file(args.compare)), new)
+    errors = sum(x['errors'] for x in results)
+    if errors:
+        print '%d errors; rerun with --keep to read the logs' %errors
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -18,16 +18,21 @@ import argparse
 import os
 import sys
 
-from bigitr import context
-from bigitr import cvsimport
-from bigitr import git
-from bigitr import gitexport
-from bigitr import gitmerge
-from bigitr import shell
-from bigitr import sync
+# Subsystems are imported where they are first used, so that the
+# bin/bigitr cold start (argument parsing, help) does not pay for
+# email, smtplib, gzip and ConfigParser.  Keep it that way: see
+# bench/startup_bench.py
 from bigitr import util
 
+# Those imports follow the package path, which is relative when bigitr
+# was found through a relative sys.path entry (PYTHONPATH=. in the
+# Makefile); make it absolute so that they still work after a chdir
+__path__ = [os.path.abspath(x) for x in __path__]
+
 class _Runner(object):
+    # name of the phase profiled around each repository
+    phase = None
+
     def __init__(self, appconfig, config, repos):
         self.appconfig = appconfig
         self.config = config
@@ -38,6 +43,7 @@ class _Runner(object):
     def getContext(self):
         appconfig = self.expandFilenameIfString(self.appconfig)
         config = self.expandFilenameIfString(self.config)
+        from bigitr import context
         return context.Context(appconfig, config)
 
     def _init_runner(self):
@@ -61,19 +67,32 @@ class _Runner(object):
             raise KeyError('repository %s not found' %e.args[0])
 
     def process(self):
+        from bigitr import backoff
+        from bigitr import git
+        from bigitr import profiler
+        from bigitr import shell
         for repository, branch in self.getBranchMaps():
+            if not backoff.ready(self.ctx, repository):
+                continue
             Git = git.Git(self.ctx, repository)
             try:
                 if not branch:
                     # empty branch is unspecified
                     branch = None
-                self.do(repository, Git, requestedBranch=branch)
+                with profiler.phase(self.ctx, repository, self.phase):
+                    self.do(repository, Git, requestedBranch=branch)
+                    Git.pushDeferred()
+                backoff.succeeded(self.ctx, repository)
             except shell.ErrorExitCode, e:
                 # report errors from commands that fail
+                backoff.failed(self.ctx, repository)
                 Git.log.mailLastOutput(str(e))
                 self.runner.err.report(repository)
+                Git.pushDeferredAfterError(self.runner.err)
             except:
+                backoff.failed(self.ctx, repository)
                 self.runner.err.report(repository)
+                Git.pushDeferredAfterError(self.runner.err)
 
     def close(self):
         for l in self.ctx.logs.values():
@@ -88,6 +107,10 @@ class Synchronize(_Runner):
         _Runner.__init__(self, appconfig, config, repos)
         self.poll = poll
 
+    @property
+    def phase(self):
+        return self.poll and 'poll' or 'sync'
+
     def run(self, poll=None):
         if poll is not None:
             self.poll = poll
@@ -112,23 +135,35 @@ class Synchronize(_Runner):
         Git.fetch()
         if Git.refs() == oldRefs:
             return False
+        from bigitr import pollrate
+        pollrate.changed(self.ctx, Git.repo)
         return True
 
     def _init_runner(self, *args):
+        from bigitr import sync
         self.runner = sync.Synchronizer(self.ctx)
 
 class Import(_Runner):
+    phase = 'import'
+
     def _init_runner(self, *args):
+        from bigitr import cvsimport
         self.runner = cvsimport.Importer(self.ctx)
         self.do = self.runner.importBranches
 
 class Export(_Runner):
+    phase = 'export'
+
     def _init_runner(self, *args):
+        from bigitr import gitexport
         self.runner = gitexport.Exporter(self.ctx)
         self.do = self.runner.exportBranches
 
 class Merge(_Runner):
+    phase = 'merge'
+
     def _init_runner(self, *args):
+        from bigitr import gitmerge
         self.runner = gitmerge.Merger(self.ctx)
         self.do = self.runner.mergeBranches
 
@@ -136,27 +171,40 @@ class Merge(_Runner):
 def main(argv):
     appConfigName = os.environ.get('BIGITR_APP_CONFIG', '~/.bigitr')
     repoConfigName = os.environ.get('BIGITR_REPO_CONFIG', '~/.bigitr-repository')
+    statusFileName = os.environ.get('BIGITR_DAEMON_STATUSFILE',
+                                    '~/.bigitrd-status')
     ap = argparse.ArgumentParser(description='Synchronize Git and CVS')
-    ap.add_argument('subcommand', help='sync|import|export|merge|help')
+    ap.add_argument('subcommand', help='sync|import|export|merge|status|help')
     ap.add_argument('--appconfig', '-a', default=appConfigName,
                     help='bigitr configuration file [%s]' %appConfigName)
     ap.add_argument('--config', '-c', default=repoConfigName,
                     help='repository configuration file [%s]' %repoConfigName)
+    ap.add_argument('--status-file', '--statusfile', '-s',
+                    default=statusFileName,
+                    help='bigitrd status file [%s]' %statusFileName)
+    ap.add_argument('--profile', metavar='DIR',
+                    help='write profiles of each repository to DIR')
     ap.add_argument('repository', action='append', nargs='*',
                     help='repositories to process [all configured repositories]')
     args = ap.parse_args(argv)
 
+    runners = {'sync': Synchronize, 'import': Import, 'export': Export,
+               'merge': Merge}
     if args.subcommand == 'help':
         ap.print_help()
         raise SystemExit(0)
-    elif args.subcommand == 'sync':
-        raise SystemExit(Synchronize(args.appconfig, args.config, args.repository[0]).run())
-    elif args.subcommand == 'import':
-        raise SystemExit(Import(args.appconfig, args.config, args.repository[0]).run())
-    elif args.subcommand == 'export':
-        raise SystemExit(Export(args.appconfig, args.config, args.repository[0]).run())
-    elif args.subcommand == 'merge':
-        raise SystemExit(Merge(args.appconfig, args.config, args.repository[0]).run())
+    elif args.subcommand in runners:
+        runner = runners[args.subcommand](
+            args.appconfig, args.config, args.repository[0])
+        if args.profile:
+            from bigitr import profiler
+            runner.ctx.profiler = profiler.Profiler(
+                util.fileName(args.profile))
+        raise SystemExit(runner.run())
+    elif args.subcommand == 'status':
+        from bigitr import status
+        raise SystemExit(status.main(util.fileName(args.status_file),
+                                     sys.stdout))
 
     # unrecognized subcommand
     ap.print_help()
@@ -32,7 +32,10 @@ onerror = {
 class AppConfig(config.Config):
     def __init__(self, configFileName):
         config.Config.__init__(self, configFileName, {
+            'compresslevel': '6',
             'compresslogs': 'true',
+            'logarchive': 'false',
+            'mailmaxbytes': '1m',
             'onerror': 'abort',
             'preimport': 'true',
             'smarthost': 'localhost'})
@@ -40,6 +43,38 @@ class AppConfig(config.Config):
     def getCompressLogs(self):
         return self.getboolean('global', 'compresslogs')
 
+    def getCompressLevel(self):
+        level = self.getint('global', 'compresslevel')
+        if level < 1 or level > 9:
+            raise ValueError('compresslevel must be between 1 and 9, not %d'
+                             %level)
+        return level
+
+    def getLogMaxAge(self):
+        'remove logs older than [%dd][%dh][%dm][%d[s]], or None'
+        timespec = self.getDefault('global', 'logmaxage', None)
+        if timespec is None:
+            return None
+        return self._parseTimeSpec(timespec)
+
+    def getLogMaxRuns(self):
+        'keep logs for at most this many runs per repository, or None'
+        runs = self.getDefault('global', 'logmaxruns', None)
+        if runs is None:
+            return None
+        return int(runs)
+
+    def getLogMaxBytes(self):
+        'keep at most %d[k|m|g] bytes of logs per repository, or None'
+        bytespec = self.getDefault('global', 'logmaxbytes', None)
+        if bytespec is None:
+            return None
+        return self._parseByteSpec(bytespec)
+
+    def getLogArchive(self):
+        'pack the logs of each earlier day into one archive'
+        return self.getboolean('global', 'logarchive')
+
     def getGitDir(self):
         return self.get('global', 'gitdir')
 
@@ -51,6 +86,14 @@ class AppConfig(config.Config):
             return self.get('global', 'mailfrom')
         return None
 
+    def getMailMaxBytes(self):
+        'attachments are cut to at most %d[k|m|g] bytes'
+        maxBytes = self._parseByteSpec(self.get('global', 'mailmaxbytes'))
+        if maxBytes < 2:
+            raise ValueError('mailmaxbytes must be at least 2, not %d'
+                             %maxBytes)
+        return maxBytes
+
     def getSmartHost(self):
         return self.get('global', 'smarthost')
 
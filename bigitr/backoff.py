@@ -0,0 +1,124 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Exponential backoff for repositories and branches that keep failing.
+# After each consecutive failure, work on the repository (or on one
+# branch of it) is skipped for twice as long as after the previous
+# one, from the minimum delay up to the maximum; one success resets
+# it.  Kept across daemon restarts in a state file.
+
+import os
+import time
+
+from bigitr import repositorymap
+from bigitr import util
+
+def ready(ctx, repository, kind=None, branch=None):
+    'return: False while work on repository (or branch) is backing off'
+    if ctx.backoff is None:
+        return True
+    return ctx.backoff.ready((repository, kind, branch))
+
+def failed(ctx, repository, kind=None, branch=None):
+    if ctx.backoff is not None:
+        ctx.backoff.failed((repository, kind, branch))
+
+def succeeded(ctx, repository, kind=None, branch=None):
+    if ctx.backoff is not None:
+        ctx.backoff.succeeded((repository, kind, branch))
+
+
+class Backoff(object):
+    # change whenever the pickled state changes shape
+    VERSION = 1
+
+    def __init__(self, minimum, maximum, stateFile=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.stateFile = stateFile
+        # {(repository, kind, branch): (consecutive failures, retry time)}
+        # where kind is None for the whole repository, or import,
+        # export or merge for one branch
+        self.failures = {}
+        self.load()
+
+    def ready(self, key, now=None):
+        if key not in self.failures:
+            return True
+        if now is None:
+            now = time.time()
+        return now >= self.failures[key][1]
+
+    def delay(self, count):
+        return min(self.maximum, self.minimum * 2 ** min(count - 1, 32))
+
+    def failed(self, key, now=None):
+        if now is None:
+            now = time.time()
+        count = self.failures.get(key, (0, None))[0] + 1
+        self.failures[key] = (count, now + self.delay(count))
+        self.save()
+
+    def succeeded(self, key):
+        if self.failures.pop(key, None) is not None:
+            self.save()
+
+    def retry(self, pattern='*'):
+        'retry now everything in repositories matching pattern'
+        matches = repositorymap.RepositoryConfig.matchesRepository
+        keys = [x for x in self.failures if matches(x[0], pattern)]
+        for key in keys:
+            del self.failures[key]
+        if keys:
+            self.save()
+
+    def forget(self, repositories):
+        'drop state for repositories no longer configured'
+        repositories = set(repositories)
+        keys = [x for x in self.failures if x[0] in repositories]
+        for key in keys:
+            del self.failures[key]
+        if keys:
+            self.save()
+
+    def load(self):
+        failures = util.loadState(self.stateFile, self.VERSION)
+        if isinstance(failures, dict):
+            self.failures = failures
+
+    def save(self):
+        if self.stateFile:
+            util.saveState(self.stateFile, self.VERSION, self.failures)
+
+
+def requestRetry(requestFile, patterns):
+    'ask bigitrd to retry repositories matching patterns (all if empty)'
+    f = file(requestFile, 'a')
+    try:
+        f.write(''.join('%s\n' %x for x in patterns or ['*']))
+    finally:
+        f.close()
+
+def readRetryRequests(requestFile):
+    'return: patterns requested since the last call, removing the requests'
+    if not os.path.exists(requestFile):
+        return []
+    # renamed first so that requests added meanwhile are kept for next time
+    readName = requestFile + '.read'
+    os.rename(requestFile, readName)
+    patterns = [x.strip() for x in file(readName) if x.strip()]
+    os.remove(readName)
+    return patterns
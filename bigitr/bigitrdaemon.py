@@ -15,37 +15,72 @@
 #
 
 import argparse
+import ConfigParser
+import copy
 import daemon
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import lockfile
 import os
 import signal
-import smtplib
 import sys
 import time
 import traceback
 
 from bigitr import appconfig
+from bigitr import backoff
+from bigitr import configcache
 from bigitr import daemonconfig
+from bigitr import digest
+from bigitr import log
+from bigitr import mail
+from bigitr import mailspool
+from bigitr import metrics
+from bigitr import pollrate
+from bigitr import profiler
 from bigitr import progress
 from bigitr import repositorymap
+from bigitr import status
 from bigitr import Synchronize
 from bigitr import util
 
 class Daemon(object):
-    def __init__(self, execPath, config, detach, pidfile):
-        self.execPath = execPath
+    # seconds to wait at exit for the mail sender to finish a delivery
+    MAILSTOPTIME = 10
+
+    def __init__(self, config, detach, pidfile, statusfile=None,
+                 profile=None):
         self.config = util.fileName(config)
         self.cfg = daemonconfig.DaemonConfig(config)
         self.pidfile = util.fileName(pidfile)
-        self.restart = False
+        self.statusfile = statusfile and util.fileName(statusfile)
+        # live status for `bigitr status`, written once run() has the pid
+        self.status = None
+        # --profile directory, profiling every repository
+        self.profileDir = profile and util.fileName(profile)
+        self.profiler = self.createProfiler(self.cfg)
+        self.backoff = self.createBackoff(self.cfg)
+        self.pollrate = self.createPollRate(self.cfg)
+        self.reload = False
         self.stop = False
+        # set by SIGUSR1 when bigitrd --retry has written requests
+        self.retry = False
+        self.retryFile = self.pidfile + '.retry'
+        # repositories to synchronize fully at their next turn
+        self.retryNow = set()
+        # resumable pass of log retention work done while idle
+        self.logCleaner = None
+        # mail spool and its background sender, started by run()
+        self.spool = None
+        self.mailer = None
+        self.digest = self.createDigest(self.cfg)
+        self.metrics = self.createMetrics(self.cfg)
         if detach:
             self.progress = progress.Progress(outFile=None)
         else:
             self.progress = progress.Progress()
         self.createContext(detach)
+        self.configCache = configcache.ConfigCache(self.cfg.getConfigCache())
         self.createSynchronizers()
 
     def createContext(self, detach):
@@ -64,21 +99,285 @@ class Daemon(object):
         self.context.signal_map[signal.SIGTERM] = self.sigterm
         self.context.signal_map[signal.SIGINT] = self.sigterm
         self.context.signal_map[signal.SIGCHLD] = self.sigchld
+        self.context.signal_map[signal.SIGUSR1] = self.sigusr1
+
+    @staticmethod
+    def parseRepoConfig(repoConfigName, addMail):
+        repoCtx = repositorymap.RepositoryConfig(repoConfigName)
+        for repo in repoCtx.getRepositories():
+            repoCtx.addEmail(repo, addMail)
+        return repoCtx
 
     def createSynchronizers(self):
-        self.synchronizers = []
+        # self.repositories is the schedule of (appconfig, repoconfig,
+        # repository) keys; Synchronize objects are created only when
+        # a repository is first processed
+        self.repositories, self.repositoryConfigs = self.readRepositories(
+            self.cfg)
+        self.configCache.save()
+        self.synchronizers = {}
+
+    def readRepositories(self, cfg):
+        'return: [key, ...], {key: (appCtx, repoCtx), ...}'
+        repositories = []
+        repositoryConfigs = {}
         addMail = None
-        if self.cfg.getMailAll():
-            addMail = self.cfg.getEmail()
-        for appCtxName in self.cfg.getApplicationContexts():
-            appCtx = self.cfg.getAppConfig(appCtxName)
-            appCtx = appconfig.AppConfig(appCtx)
-            for repoCtx in self.cfg.getRepoConfigs(appCtxName):
-                repoCtx = repositorymap.RepositoryConfig(repoCtx)
-                for repo in repoCtx.getRepositories():
-                    repoCtx.addEmail(repo, addMail)
-                    self.synchronizers.append(
-                        Synchronize(appCtx, repoCtx, [repo]))
+        if cfg.getMailAll():
+            addMail = cfg.getEmail()
+        parseRepoConfig = lambda x: self.parseRepoConfig(x, addMail)
+        configPaths = []
+        for appCtxName in sorted(cfg.getApplicationContexts()):
+            appPath = cfg.getAppConfig(appCtxName)
+            appCtx = self.configCache.get(appPath, appconfig.AppConfig)
+            configPaths.append(appPath)
+            for repoPath in cfg.getRepoConfigs(appCtxName):
+                repoCtx = self.configCache.get(repoPath, parseRepoConfig,
+                                               addMail or ())
+                configPaths.append(repoPath)
+                for repo in sorted(repoCtx.getRepositories()):
+                    key = (appPath, repoPath, repo)
+                    repositories.append(key)
+                    repositoryConfigs[key] = (appCtx, repoCtx)
+        self.configCache.prune(configPaths)
+        return repositories, repositoryConfigs
+
+    @staticmethod
+    def repositoryFingerprint(repoCtx, repo):
+        # raw values: expanding an unset ${VAR} fails only the
+        # repository that uses it, when it runs
+        get = ConfigParser.SafeConfigParser.get
+        return [(section, [(x, get(repoCtx, section, x, raw=True))
+                           for x in sorted(repoCtx.options(section))])
+                for section in ('GLOBAL', repo)
+                if repoCtx.has_section(section)]
+
+    def compareConfigs(self, oldConfigs, repositoryConfigs):
+        '''
+        Keep in repositoryConfigs the old configuration of repositories
+        whose own configuration has not changed.
+        return: (added, removed, changed) sets of repository keys
+        '''
+        added = set(repositoryConfigs) - set(oldConfigs)
+        removed = set(oldConfigs) - set(repositoryConfigs)
+        changed = set()
+        for key in set(repositoryConfigs) & set(oldConfigs):
+            oldApp, oldRepo = oldConfigs[key]
+            newApp, newRepo = repositoryConfigs[key]
+            if oldApp is newApp and oldRepo is newRepo:
+                continue
+            if (oldApp is newApp and
+                self.repositoryFingerprint(oldRepo, key[2]) ==
+                self.repositoryFingerprint(newRepo, key[2])):
+                # another repository in the same file changed; keep
+                # using the configuration this synchronizer already has
+                repositoryConfigs[key] = oldConfigs[key]
+                continue
+            changed.add(key)
+        return added, removed, changed
+
+    def reloadConfig(self):
+        '''
+        Re-read all configuration, replacing synchronizers only for
+        repositories whose configuration has changed.
+        return: (added, removed, changed) sets of repository keys
+        '''
+        self.reload = False
+        try:
+            # nothing in use changes until all of it has been read
+            cfg = daemonconfig.DaemonConfig(self.config)
+            snapshotFile = cfg.getConfigCache()
+            repositories, repositoryConfigs = self.readRepositories(cfg)
+            added, removed, changed = self.compareConfigs(
+                self.repositoryConfigs, repositoryConfigs)
+            newDigest = self.createDigest(cfg, self.digest)
+            newMetrics = self.createMetrics(cfg, self.metrics)
+            newProfiler = self.createProfiler(cfg)
+            newBackoff = self.createBackoff(cfg, self.backoff)
+            newPollRate = self.createPollRate(cfg, self.pollrate)
+            # last, as it replaces the running mail sender
+            self.startMailer(cfg)
+        except:
+            # keep running with the previous configuration
+            self.report()
+            return set(), set(), set()
+        self.cfg = cfg
+        self.digest = newDigest
+        self.metrics = newMetrics
+        self.profiler = newProfiler
+        self.backoff = newBackoff
+        self.pollrate = newPollRate
+        self.configCache.snapshotFile = snapshotFile
+        try:
+            self.configCache.save()
+        except:
+            # costs only re-parsing at the next start
+            self.report()
+
+        for key in removed | changed:
+            self.synchronizers.pop(key, None)
+        self.repositories = repositories
+        self.repositoryConfigs = repositoryConfigs
+        self.logCleaner = None
+        gone = set(x[2] for x in removed) - set(x[2] for x in repositories)
+        try:
+            if self.metrics is not None:
+                self.metrics.forget(gone)
+            if self.backoff is not None:
+                self.backoff.forget(gone)
+            if self.pollrate is not None:
+                self.pollrate.forget(gone)
+        except:
+            # costs only stale state for repositories no longer run
+            self.report()
+        return added, removed, changed
+
+    def getSynchronizer(self, key):
+        s = self.synchronizers.get(key)
+        if s is None:
+            appCtx, repoCtx = self.repositoryConfigs[key]
+            s = Synchronize(appCtx, repoCtx, [key[2]])
+            self.synchronizers[key] = s
+        # follows mailspool and maildigest changes made by reloading
+        s.ctx.spool = self.spool
+        s.ctx.digest = self.digest
+        s.ctx.metrics = self.metrics
+        s.ctx.status = self.status
+        s.ctx.profiler = self.profiler
+        s.ctx.backoff = self.backoff
+        s.ctx.pollrate = self.pollrate
+        return s
+
+    def createDigest(self, cfg, oldDigest=None):
+        '''
+        return: the Digest configured by cfg, or None
+        The create methods change nothing in use, so that a failed
+        reload leaves it all in place; a service kept across a reload
+        is copied with its new settings, sharing the recorded state.
+        '''
+        interval = cfg.getMailDigest()
+        if interval is None:
+            return None
+        stateFile = cfg.getDigestState()
+        if oldDigest is not None and oldDigest.stateFile == stateFile:
+            newDigest = copy.copy(oldDigest)
+            newDigest.interval = interval
+            return newDigest
+        newDigest = digest.Digest(interval, stateFile)
+        if oldDigest is not None:
+            # keep failures recorded earlier in this pass
+            newDigest.pending = oldDigest.pending
+        return newDigest
+
+    def createMetrics(self, cfg, oldMetrics=None):
+        fileName = cfg.getMetricsFile()
+        if fileName is None:
+            return None
+        if oldMetrics is None:
+            return metrics.Metrics(fileName)
+        newMetrics = copy.copy(oldMetrics)
+        newMetrics.fileName = fileName
+        return newMetrics
+
+    def createBackoff(self, cfg, oldBackoff=None):
+        delays = cfg.getBackoff()
+        if delays is None:
+            return None
+        stateFile = cfg.getBackoffState()
+        if oldBackoff is None or oldBackoff.stateFile != stateFile:
+            return backoff.Backoff(delays[0], delays[1], stateFile)
+        newBackoff = copy.copy(oldBackoff)
+        newBackoff.minimum, newBackoff.maximum = delays
+        return newBackoff
+
+    def createPollRate(self, cfg, oldPollRate=None):
+        maximum = cfg.getPollMaximum()
+        if maximum is None:
+            return None
+        minimum = cfg.getPollFrequency()
+        stateFile = cfg.getPollState()
+        if oldPollRate is None or oldPollRate.stateFile != stateFile:
+            return pollrate.PollRate(minimum, maximum, stateFile)
+        newPollRate = copy.copy(oldPollRate)
+        newPollRate.minimum = minimum
+        newPollRate.maximum = maximum
+        return newPollRate
+
+    def savePollRate(self):
+        if self.pollrate is None:
+            return
+        try:
+            self.pollrate.save()
+        except:
+            self.report()
+
+    def applyRetries(self):
+        '''
+        Act on requests from bigitrd --retry: forget the failures of
+        matching repositories and synchronize them fully next.
+        return: True if there were any requests
+        '''
+        self.retry = False
+        try:
+            patterns = backoff.readRetryRequests(self.retryFile)
+        except EnvironmentError:
+            self.report()
+            return False
+        matches = repositorymap.RepositoryConfig.matchesRepository
+        for pattern in patterns:
+            if self.backoff is not None:
+                self.backoff.retry(pattern)
+            self.retryNow.update(x for x in self.repositories
+                                 if matches(x[2], pattern))
+        return bool(patterns)
+
+    def createProfiler(self, cfg):
+        'profile all repositories with --profile, else those configured'
+        if self.profileDir:
+            directory, patterns = self.profileDir, ['*']
+        else:
+            directory = cfg.getProfileDir()
+            patterns = cfg.getProfileRepositories()
+        if directory and patterns:
+            return profiler.Profiler(directory, patterns)
+        return None
+
+    def saveMetrics(self, backlog, force=False):
+        'record the number of repositories still to run in this pass'
+        if self.metrics is None:
+            return
+        self.metrics.setBacklog(backlog, len(self.repositories))
+        try:
+            self.metrics.save(force=force)
+        except:
+            self.report()
+
+    def flushDigest(self):
+        if self.digest is None:
+            return
+        try:
+            self.digest.flush(self.spool)
+        except:
+            self.report()
+
+    def startMailer(self, cfg):
+        'start the background mail sender, restarting it if mailspool changed'
+        spoolDir = cfg.getMailSpool()
+        if self.spool is not None and self.spool.directory == spoolDir:
+            return
+        # the current sender keeps running if the new spool cannot be made
+        spool = spoolDir and mailspool.Spool(spoolDir)
+        self.stopMailer()
+        if spool:
+            self.spool = spool
+            self.mailer = mailspool.SenderThread(self.spool)
+            self.mailer.start()
+
+    def stopMailer(self):
+        'undelivered mail stays in the spool for the next start'
+        if self.mailer is not None:
+            self.mailer.stop(self.MAILSTOPTIME)
+        self.spool = None
+        self.mailer = None
 
     def run(self):
         try:
@@ -94,7 +393,17 @@ class Daemon(object):
         try:
             with self.context:
                 file(self.pidfile, 'w').write(str(os.getpid()))
-                self.mainLoop()
+                if self.statusfile:
+                    self.status = status.Status(self.statusfile)
+                # threads do not survive detaching, so start it here
+                self.startMailer(self.cfg)
+                try:
+                    self.mainLoop()
+                finally:
+                    self.stopMailer()
+                    if self.status is not None:
+                        self.status.remove()
+                        self.status = None
         finally:
             if self.context.pidfile.is_locked():
                 self.context.pidfile.release()
@@ -106,29 +415,83 @@ class Daemon(object):
         self.stop = True
 
     def sighup(self, signo, frame):
-        'reload by re-execing when all child processes have finished'
-        self.restart = True
+        'reload configuration when the current repository has finished'
+        self.reload = True
 
     def sigchld(self, signo, frame):
         pass
 
+    def sigusr1(self, signo, frame):
+        'retry requested repositories now, even while sleeping'
+        self.retry = True
+
+    def setState(self, state, duration=None):
+        if self.status is not None:
+            self.status.setState(state, duration)
+
     def runOnce(self, poll=False):
         if poll:
             self.progress.setPhase('poll')
         else:
             self.progress.setPhase('sync')
-        for s in self.synchronizers:
-            if not self.stop and not self.restart:
-                try:
-                    repoName = s.ctx.getRepositoryName(s.repos[0])
-                    self.progress.add(repoName)
-                    self.progress.report()
-                    s.run(poll=poll)
-                    self.progress.remove(repoName)
-                except:
-                    self.report()
-            else:
+        self.setState(poll and 'poll' or 'sync')
+        if self.reload:
+            self.reloadConfig()
+        self.applyRetries()
+        started = time.time()
+        repositories = list(self.repositories)
+        for i, key in enumerate(repositories):
+            self.saveMetrics(len(repositories) - i)
+            if self.stop:
+                self.flushDigest()
                 raise SystemExit(0)
+            if self.reload:
+                self.reloadConfig()
+                if key not in self.repositoryConfigs:
+                    # removed from the configuration
+                    continue
+            self.runRepository(key, poll, started)
+        self.flushDigest()
+        self.saveMetrics(0, force=True)
+        self.savePollRate()
+
+    def runRepository(self, key, poll, started):
+        'started: start of this pass, from which the next poll is scheduled'
+        if key in self.retryNow:
+            self.retryNow.discard(key)
+            poll = False
+        if (poll and self.pollrate is not None and
+            not self.pollrate.ready(key[2], started)):
+            # not expected to have changed yet
+            return
+        if (self.backoff is not None and
+            not self.backoff.ready((key[2], None, None))):
+            # not a run: metrics keep showing the last one as failed
+            return
+        if self.metrics is not None:
+            self.metrics.startRun(key[2])
+        if self.status is not None:
+            self.status.startJob(key[2])
+        runStarted = time.time()
+        try:
+            repoName = repositorymap.RepositoryConfig.getRepositoryName(
+                key[2])
+            self.progress.add(repoName)
+            self.progress.report()
+            self.getSynchronizer(key).run(poll=poll)
+            self.progress.remove(repoName)
+        except:
+            if self.metrics is not None:
+                self.metrics.error(key[2])
+            self.report()
+        if self.metrics is not None:
+            self.metrics.observe(key[2], poll and 'poll' or 'sync',
+                                 time.time() - runStarted)
+            self.metrics.finishRun(key[2])
+        if self.pollrate is not None:
+            self.pollrate.finished(key[2], started)
+        if self.status is not None:
+            self.status.finishJob(key[2])
 
     def report(self):
         exception = sys.exc_info()
@@ -149,56 +512,105 @@ class Daemon(object):
         tbmsg = MIMEText(''.join(msgText))
         tbmsg.add_header('Content-Disposition', 'inline')
         msg.attach(tbmsg)
-        s = smtplib.SMTP(self.cfg.getSmartHost())
-        s.sendmail(mailfrom, email, msg.as_string())
-        s.quit()
+        mail.deliver(self.spool, self.cfg.getSmartHost(), mailfrom, email,
+                     msg.as_string())
+
+
+    def cleanLogs(self):
+        'generator applying log retention, yielding after each repository'
+        appConfigs = []
+        for appCtx, repoCtx in self.repositoryConfigs.values():
+            if appCtx not in appConfigs:
+                appConfigs.append(appCtx)
+        logDirs = set()
+        for appCtx in appConfigs:
+            retention = log.LogRetention(appCtx)
+            if not retention.active() or retention.logDir in logDirs:
+                continue
+            logDirs.add(retention.logDir)
+            for repoLogDir in retention.repositoryLogDirs():
+                try:
+                    retention.clean(repoLogDir)
+                except:
+                    self.report()
+                yield repoLogDir
 
+    def idle(self, wakeTime):
+        'do background work until wakeTime, resuming where it last stopped'
+        if self.logCleaner is None:
+            self.logCleaner = self.cleanLogs()
+        for repoLogDir in self.logCleaner:
+            if (self.stop or self.reload or self.retry or
+                time.time() >= wakeTime):
+                return
+        # pass complete; start the next one in a later idle period
+        self.logCleaner = None
+
+    def sleep(self, waitTime):
+        '''
+        sleep, reloading configuration whenever SIGHUP interrupts, and
+        waking early when SIGUSR1 brings retry requests
+        '''
+        wakeTime = time.time() + waitTime
+        self.idle(wakeTime)
+        waitTime = wakeTime - time.time()
+        while not self.stop and waitTime > 0:
+            if self.retry and self.applyRetries():
+                return
+            time.sleep(waitTime)
+            if self.reload:
+                self.reloadConfig()
+            waitTime = wakeTime - time.time()
 
     def mainLoop(self):
         # FUTURE: implement self.cfg.parallelConversions() parallelization
-        syncFreq = self.cfg.getFullSyncFrequency()
-        pollFreq = self.cfg.getPollFrequency()
         waitTime = 0
         syncTime = 0
         poll=False
-        try:
-            while not self.stop and not self.restart:
-                if waitTime > 0:
-                    self.progress.clear()
-                    self.progress.setPhase('sleep')
-                    self.progress.add('%0.1f seconds' %waitTime)
-                    self.progress.report()
-                    time.sleep(waitTime)
-                    self.progress.clear()
-                startTime = time.time()
-                if not poll:
-                    syncStartTime = startTime
-
-                self.runOnce(poll=poll)
-
-                now = time.time()
-                duration = now-startTime
-                syncDuration = now-syncStartTime
-                syncTime = max(0, syncFreq - syncDuration)
-                pollTime = max(0, pollFreq - duration)
-                poll = (pollTime < syncTime)
-                waitTime = min(syncTime, pollTime)
+        while not self.stop:
+            if waitTime > 0:
+                self.progress.clear()
+                self.progress.setPhase('sleep')
+                self.progress.add('%0.1f seconds' %waitTime)
+                self.progress.report()
+                self.setState('sleep', waitTime)
+                self.sleep(waitTime)
+                self.progress.clear()
+                if self.stop:
+                    break
+            startTime = time.time()
+            if not poll:
+                syncStartTime = startTime
 
-        finally:
-            if self.restart:
-                execArgs = [self.execPath,
-                            '--config', self.config,
-                            '--pid-file', self.pidfile]
-                if not self.context.detach_process:
-                    execArgs.append('--no-daemon')
-                os.execl(self.execPath, *execArgs)
+            self.runOnce(poll=poll)
+
+            # frequencies may have been changed by reloading
+            syncFreq = self.cfg.getFullSyncFrequency()
+            pollFreq = self.cfg.getPollFrequency()
+            now = time.time()
+            duration = now-startTime
+            syncDuration = now-syncStartTime
+            syncTime = max(0, syncFreq - syncDuration)
+            pollTime = max(0, pollFreq - duration)
+            poll = (pollTime < syncTime)
+            waitTime = min(syncTime, pollTime)
 
         raise SystemExit(0)
 
 
+def requestRetry(pidfile, patterns):
+    'ask a running (or the next) bigitrd to retry repositories now'
+    pidfile = util.fileName(pidfile)
+    backoff.requestRetry(pidfile + '.retry', patterns)
+    if os.path.exists(pidfile):
+        util.kill(int(file(pidfile).read().strip()), signal.SIGUSR1)
+
+
 def main(argv):
     daemonConfig = os.environ.get('BIGITR_DAEMON_CONFIG', '~/.bigitrd')
     daemonPidFile = os.environ.get('BIGITR_DAEMON_PIDFILE', '~/.bigitrd-pid')
+    daemonStatusFile = os.environ.get('BIGITR_DAEMON_STATUSFILE',
+                                      '~/.bigitrd-status')
     ap = argparse.ArgumentParser(description='Daemon to synchronize Git and CVS')
     ap.add_argument('--config', '-c', default=daemonConfig,
                     help='daemon configuration file [%s]' %daemonConfig)
@@ -206,7 +618,19 @@ def main(argv):
                     help='run in the foreground')
     ap.add_argument('--pidfile', '--pid-file', '-p', default=daemonPidFile,
                     help='daemon pid file path [%s]' %daemonPidFile)
+    ap.add_argument('--status-file', '--statusfile', '-s',
+                    default=daemonStatusFile,
+                    help='daemon status file path [%s]' %daemonStatusFile)
+    ap.add_argument('--profile', metavar='DIR',
+                    help='write profiles of every repository to DIR')
+    ap.add_argument('--retry', nargs='*', metavar='REPOSITORY',
+                    help='make the running daemon retry repositories'
+                         ' (all if none named) now, ignoring backoff')
 
     args = ap.parse_args(argv[1:])
 
-    Daemon(argv[0], args.config, not args.nodaemon, args.pidfile).run()
+    if args.retry is not None:
+        requestRetry(args.pidfile, args.retry)
+        return
+    Daemon(args.config, not args.nodaemon, args.pidfile,
+           args.status_file, args.profile).run()
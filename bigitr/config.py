@@ -15,10 +15,18 @@
 #
 
 import os
+import re
 import string
 import ConfigParser
 
 class Config(ConfigParser.SafeConfigParser):
+    timeRE = re.compile(
+        r'\s*((?P<d>\d+)d\s*)?'
+        r'((?P<h>\d+)h\s*)?'
+        r'((?P<m>\d+)m\s*)?'
+        r'((?P<s>\d+)s?)?', re.I)
+    byteRE = re.compile(r'\s*(?P<n>\d+)\s*(?P<unit>[kmg]?)b?\s*$', re.I)
+
     def __init__(self, configFile, defaults={}):
         ConfigParser.SafeConfigParser.__init__(self, defaults)
         if isinstance(configFile, str):
@@ -82,3 +90,18 @@ class Config(ConfigParser.SafeConfigParser):
 
     def readConfig(self, configFile):
         self.readfp(configFile)
+
+    def _parseTimeSpec(self, timespec):
+        '[%dd][%dh][%dm][%d[s]] returns seconds'
+        times = self.timeRE.search(timespec).groupdict()
+        # convert None to 0, strings to integers
+        times = dict((x, int(y) if y else 0) for x, y in times.items())
+        return times['d'] * 86400 + times['h'] * 3600 + times['m'] * 60 + times['s']
+
+    def _parseByteSpec(self, bytespec):
+        '%d[k|m|g] returns bytes'
+        m = self.byteRE.match(bytespec)
+        if m is None:
+            raise ValueError('"%s": not a size' %bytespec)
+        scale = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+        return int(m.group('n')) * scale[m.group('unit').lower()]
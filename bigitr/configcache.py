@@ -0,0 +1,67 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Cache of parsed configuration objects, optionally persisted as a
+# snapshot file so that a restarted daemon need not re-parse unchanged
+# configuration files.
+
+import os
+
+from bigitr import util
+
+class ConfigCache(object):
+    # change whenever the pickled configuration classes change shape
+    VERSION = 1
+
+    def __init__(self, snapshotFile=None):
+        self.snapshotFile = snapshotFile
+        # {path: (key, parsed object), ...}
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def key(path, extra=()):
+        st = os.stat(path)
+        return (st.st_mtime, st.st_size) + tuple(extra)
+
+    def get(self, path, factory, extra=()):
+        'return: object parsed from path by factory(path), cached'
+        key = self.key(path, extra)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        parsed = factory(path)
+        self.entries[path] = (key, parsed)
+        self.dirty = True
+        return parsed
+
+    def prune(self, paths):
+        'forget all cached paths not in paths'
+        for path in set(self.entries) - set(paths):
+            del self.entries[path]
+            self.dirty = True
+
+    def load(self):
+        entries = util.loadState(self.snapshotFile, self.VERSION)
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def save(self):
+        if not self.snapshotFile or not self.dirty:
+            return
+        util.saveState(self.snapshotFile, self.VERSION, self.entries)
+        self.dirty = False
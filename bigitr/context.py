@@ -34,15 +34,40 @@ class Context(object):
             self._rm = repoConfig
         else:
             self._rm = repositorymap.RepositoryConfig(repoConfig)
+        # computed once; AppConfig takes precedence over RepositoryConfig
+        self._dispatch = self._dispatchTable(self._ac, self._rm)
         self.logs = log.LogCache(self)
         self.mails = mail.MailCache(self)
-    
+        # mailspool.Spool through which to send mail, set by bigitrd
+        self.spool = None
+        # digest.Digest collecting failures instead of mailing each
+        # repository's errors, set by bigitrd
+        self.digest = None
+        # metrics.Metrics recording what bigitrd does, set by bigitrd
+        self.metrics = None
+        # status.Status reporting live progress, set by bigitrd
+        self.status = None
+        # profiler.Profiler for --profile runs, set by bigitr and bigitrd
+        self.profiler = None
+        # backoff.Backoff skipping work that keeps failing, set by bigitrd
+        self.backoff = None
+        # pollrate.PollRate learning how often repositories change,
+        # set by bigitrd
+        self.pollrate = None
+
+    @staticmethod
+    def _dispatchTable(*delegates):
+        'return: {attribute: delegate, ...} with earlier delegates winning'
+        table = {}
+        for delegate in reversed(delegates):
+            table.update((attr, delegate) for attr in dir(delegate))
+        return table
+
     def __getattr__(self, attr):
         # fallback: multiplex rather than mixin
-        if attr in dir(self._ac):
-            return getattr(self._ac, attr)
-        if attr in dir(self._rm):
-            return getattr(self._rm, attr)
+        delegate = self.__dict__.get('_dispatch', {}).get(attr)
+        if delegate is not None:
+            return getattr(delegate, attr)
         # this will raise AttributeError with an appropriate message
         return self.__getattribute__(attr)
 
@@ -18,6 +18,7 @@ import os
 import shell
 import tempfile
 
+from bigitr import status
 from bigitr import util
 
 # One CVS checkout per branch, because CVS switches branches slowly/poorly,
@@ -33,6 +34,13 @@ def setCVSROOT(fn):
         fn(self, *args, **kwargs)
     return wrapper
 
+def setReadCVSROOT(fn):
+    'for reading only: the local mirror, if there is one, will do'
+    def wrapper(self, *args, **kwargs):
+        self.setEnvironment(self.readRoot)
+        fn(self, *args, **kwargs)
+    return wrapper
+
 def inCVSPATH(fn):
     def wrapper(self, *args, **kwargs):
         oldDir = os.getcwd()
@@ -75,20 +83,22 @@ class CVS(object):
         self.mapped_branch = self.SYMBOLIC_BRANCH_MAP.get(branch, branch)
         self.log = self.ctx.logs[repo]
         self.root = ctx.getCVSRoot(repo)
-
-    def setEnvironment(self):
-        os.environ['CVSROOT'] = self.root
-
-    def listContentFiles(self):
-        allfiles = []
-        dirlen = len(self.path) + 1
-        for root, dirs, files in os.walk(self.path):
-            if 'CVS' in dirs:
-                dirs.remove('CVS') 
-            allfiles.extend(['/'.join((root, x))[dirlen:] for x in files])
-        return allfiles
-
-    @setCVSROOT
+        self.readRoot = self.root
+        mirror = ctx.getCVSMirror(repo)
+        if mirror:
+            self.readRoot = ':local:' + mirror
+
+    def setEnvironment(self, root=None):
+        os.environ['CVSROOT'] = root or self.root
+
+    def listContentFiles(self, prune=None):
+        def pruneDir(dirName):
+            if os.path.basename(dirName) == 'CVS':
+                return True
+            return prune is not None and prune(dirName)
+        return util.listFiles(self.path, prune=pruneDir)
+
+    @setReadCVSROOT
     def export(self, targetDir):
         cmd = ['cvs', 'export', '-kk', '-d', targetDir, '-D', 'now']
         if self.mapped_branch is not None:
@@ -122,8 +132,11 @@ class CVS(object):
             shell.run(self.log, 'cvs', 'remove', *fileNames)
 
     def copyFiles(self, sourceDir, fileNames):
-        'call addFiles for any files being added rather than updated'
-        util.copyFiles(sourceDir, self.path, fileNames)
+        '''
+        call addFiles for any files being added rather than updated
+        return: number of bytes copied
+        '''
+        return util.copyFiles(sourceDir, self.path, fileNames)
 
     @inCVSPATH
     def addDirectories(self, dirNames):
@@ -158,10 +171,40 @@ class CVS(object):
 
     @inCVSPATH
     def runPreHooks(self):
-        for hook in self.ctx.getCVSPreHooks(self.repo, self.branch):
-            shell.run(self.log, *hook)
+        self.runHooks(self.ctx.getCVSPreHooks(self.repo, self.branch))
 
     @inCVSPATH
     def runPostHooks(self):
-        for hook in self.ctx.getCVSPostHooks(self.repo, self.branch):
-            shell.run(self.log, *hook)
+        self.runHooks(self.ctx.getCVSPostHooks(self.repo, self.branch))
+
+    def runHooks(self, hooks):
+        if not hooks:
+            return
+        with status.phase(self.ctx, self.repo, 'hooks'):
+            for hook in hooks:
+                shell.run(self.log, *hook)
+
+
+def refreshMirror(ctx, repo):
+    '''
+    Bring the local mirror of the ,v files of the CVS module for repo
+    up to date from cvsmirrorsource, if repo has a mirror.  Files
+    that have not changed are not copied again.
+    '''
+    mirror = ctx.getCVSMirror(repo)
+    if not mirror:
+        return
+    log = ctx.logs[repo]
+    location = ctx.getCVSPath(repo)
+    source = '/'.join((ctx.getCVSMirrorSource(repo), location))
+    target = '/'.join((mirror, location))
+    with status.phase(ctx, repo, 'mirror'):
+        if not os.path.exists(mirror + '/CVSROOT'):
+            # cvs will not read a repository without administrative files
+            shell.run(log, 'cvs', '-d', ':local:' + mirror, 'init')
+        if not os.path.exists(target):
+            os.makedirs(target)
+        # skip CVS locks and the temporary files of commits in progress
+        shell.run(log, 'rsync', '--archive', '--delete',
+                  '--exclude=#cvs.*', '--exclude=,*',
+                  source + '/', target + '/')
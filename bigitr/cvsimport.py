@@ -17,11 +17,15 @@
 import os
 import time
 
+from bigitr import backoff
 from bigitr import cvs
 from bigitr import errhandler
 from bigitr import git
 from bigitr import gitmerge
 from bigitr import ignore
+from bigitr import metrics
+from bigitr import pollrate
+from bigitr import status
 from bigitr import util
 
 class Importer(object):
@@ -33,15 +37,32 @@ class Importer(object):
         for repository in self.ctx.getRepositories():
             Git = git.Git(self.ctx, repository)
             self.importBranches(repository, Git)
+            Git.pushDeferred()
 
     def importBranches(self, repository, Git, requestedBranch=None):
         onerror = self.ctx.getImportError()
+        refreshed = False
         for cvsbranch, gitbranch in self.ctx.getImportBranchMaps(repository):
             if requestedBranch is None or cvsbranch == requestedBranch:
+                if not backoff.ready(self.ctx, repository, 'import',
+                                     cvsbranch):
+                    continue
                 CVS = cvs.CVS(self.ctx, repository, cvsbranch)
                 try:
-                    self.importcvs(repository, Git, CVS, cvsbranch, gitbranch)
+                    if not refreshed:
+                        # again for every import, to see what an export
+                        # just committed, but only if a branch is imported
+                        cvs.refreshMirror(self.ctx, repository)
+                        refreshed = True
+                    with status.phase(self.ctx, repository, 'import',
+                                      cvsbranch):
+                        self.importcvs(repository, Git, CVS, cvsbranch,
+                                       gitbranch)
+                    backoff.succeeded(self.ctx, repository, 'import',
+                                      cvsbranch)
                 except Exception as e:
+                    Git.markDirty()
+                    backoff.failed(self.ctx, repository, 'import', cvsbranch)
                     self.err(repository, onerror)
 
     @util.saveDir
@@ -57,7 +78,7 @@ class Importer(object):
         os.makedirs(exportDir)
         os.chdir(os.path.dirname(exportDir))
         CVS.export(os.path.basename(exportDir))
-        cvsignore = ignore.Ignore(Git.log, exportDir + '/.cvsignore')
+        cvsignore = ignore.IgnoreTree(Git.log, exportDir, '.cvsignore')
         exportedFiles = util.listFiles(exportDir)
         if not exportedFiles:
             raise RuntimeError("CVS branch '%s' for location '%s' contains no files"
@@ -89,12 +110,14 @@ class Importer(object):
 
         gitFiles = Git.listContentFiles()
         gitFiles = sorted(list(cvsignore.filter(set(gitFiles))))
+        Git.markDirty()
         for filename in gitFiles:
             os.remove(filename)
 
         os.chdir(gitDir)
 
-        util.copyFiles(exportDir, repoDir, exportedFiles)
+        size = util.copyFiles(exportDir, repoDir, exportedFiles)
+        metrics.copied(self.ctx, repository, 'import', size)
 
         if addSkeleton:
             if skeleton:
@@ -116,6 +139,7 @@ class Importer(object):
         if Git.status():
             # FIXME: try to create a commit message that includes all
             # the CVS commit messages since the previous commit, de-duplicated
+            pollrate.changed(self.ctx, repository)
             Git.commit('import from CVS as of %s' %time.asctime())
             Git.push('origin', gitbranch, gitbranch)
             Git.runImpPostHooks(gitbranch)
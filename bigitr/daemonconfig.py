@@ -17,7 +17,6 @@
 # Read configuration file for Git / CVS synchronization daemon
 
 import glob
-import re
 
 from bigitr import config
 
@@ -26,12 +25,10 @@ class DaemonConfig(config.Config):
         config.Config.__init__(self, configFileName, {
             'mailall': 'false',
             'smarthost': 'localhost'})
-        self.requireAbsolutePaths('repoconfig', 'appconfig')
-        self.timeRE = re.compile(
-            r'\s*((?P<d>\d+)d\s*)?'
-            r'((?P<h>\d+)h\s*)?'
-            r'((?P<m>\d+)m\s*)?'
-            r'((?P<s>\d+)s?)?', re.I)
+        self.requireAbsolutePaths('repoconfig', 'appconfig', 'configcache',
+                                  'mailspool', 'digeststate', 'metricsfile',
+                                  'profiledir', 'backoffstate',
+                                  'pollstate')
 
     def parallelConversions(self):
         'number of repositories to process in parallel'
@@ -43,6 +40,19 @@ class DaemonConfig(config.Config):
         timespec = self.getGlobalDefault('GLOBAL', 'pollfrequency', '5m')
         return self._parseTimeSpec(timespec)
 
+    def getPollMaximum(self):
+        '[%dd][%dh][%dm][%d[s]] longest adaptive poll interval, or None'
+        # with a maximum, each repository is polled between
+        # pollfrequency and pollmaximum, depending on how often it changes
+        timespec = self.getDefault('GLOBAL', 'pollmaximum', None)
+        if timespec is None:
+            return None
+        return self._parseTimeSpec(timespec)
+
+    def getPollState(self):
+        'file in which to remember adaptive poll intervals between restarts'
+        return self.getDefault('GLOBAL', 'pollstate', None)
+
     def getFullSyncFrequency(self):
         '[%dd][%dh][%dm][%d[s]] minimum frequency for unconditional full sync'
         # minimum time to wait to start a full sync, per repository
@@ -66,6 +76,50 @@ class DaemonConfig(config.Config):
     def getSmartHost(self):
         return self.get('GLOBAL', 'smarthost')
 
+    def getMailSpool(self):
+        'directory from which mail is sent in the background, or None'
+        return self.getDefault('GLOBAL', 'mailspool', None)
+
+    def getMailDigest(self):
+        '[%dd][%dh][%dm][%d[s]] interval for repeating digested errors, or None'
+        timespec = self.getDefault('GLOBAL', 'maildigest', None)
+        if timespec is None:
+            return None
+        return self._parseTimeSpec(timespec)
+
+    def getDigestState(self):
+        'file in which to remember digested errors between restarts'
+        return self.getDefault('GLOBAL', 'digeststate', None)
+
+    def getMetricsFile(self):
+        'file in which to write metrics in Prometheus text format, or None'
+        return self.getDefault('GLOBAL', 'metricsfile', None)
+
+    def getBackoff(self):
+        '(minimum, maximum) seconds to skip work that keeps failing, or None'
+        timespecs = self.getDefault('GLOBAL', 'backoff', '').split()
+        if not timespecs:
+            return None
+        if len(timespecs) == 1:
+            timespecs.append('1d')
+        return tuple(self._parseTimeSpec(x) for x in timespecs[:2])
+
+    def getBackoffState(self):
+        'file in which to remember failures between restarts'
+        return self.getDefault('GLOBAL', 'backoffstate', None)
+
+    def getProfileDir(self):
+        'directory in which to write profiles of repositories'
+        return self.getDefault('GLOBAL', 'profiledir', None)
+
+    def getProfileRepositories(self):
+        'repository paths or names, as shell-style patterns, to profile'
+        return self.getDefault('GLOBAL', 'profile', '').split()
+
+    def getConfigCache(self):
+        'file in which to keep parsed configuration between restarts'
+        return self.getDefault('GLOBAL', 'configcache', None)
+
     def getApplicationContexts(self):
         return set(self.sections()) - set(('GLOBAL',))
 
@@ -78,9 +132,3 @@ class DaemonConfig(config.Config):
         for repoGlob in self.getGlobalFallback(section, 'repoconfig').split():
             repoConfig.extend(glob.glob(repoGlob))
         return sorted(repoConfig)
-
-    def _parseTimeSpec(self, timespec):
-        times = self.timeRE.search(timespec).groupdict()
-        # convert None to 0, strings to integers
-        times = dict((x, int(y) if y else 0) for x, y in times.items())
-        return times['d'] * 86000 + times['h'] * 3600 + times['m'] * 60 + times['s']
@@ -0,0 +1,154 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Digest of repository failures.  Instead of one message per failing
+# repository, failures with the same command, exit code and error
+# signature are grouped across repositories and mailed as one message
+# per recipient set.  A failure that has already been mailed is not
+# mailed again until it changes, spreads to another repository, or
+# the suppression interval has passed.
+
+import os
+import re
+import time
+
+from bigitr import mail
+from bigitr import util
+
+digitsRE = re.compile(r'\d+')
+
+def errorSignature(errors, repoName):
+    'return: last line of error output with its variable parts masked'
+    lines = [x.strip() for x in (errors or '').split('\n') if x.strip()]
+    if not lines:
+        return ''
+    line = lines[-1]
+    if repoName:
+        line = line.replace(repoName, '<repository>')
+    return digitsRE.sub('#', line)
+
+
+class Digest(object):
+    # change whenever the pickled state changes shape
+    VERSION = 1
+    # lines of error output shown for each failure
+    DETAIL = 20
+
+    def __init__(self, interval, stateFile=None):
+        self.interval = interval
+        self.stateFile = stateFile
+        # failures recorded since the last flush:
+        # {(smarthost, mailfrom, recipients): {failure: {repo: (errors,
+        #  logNames)}}} where failure is (command, exit code, signature)
+        self.pending = {}
+        # {(mailKey, failure): (time last mailed, frozenset(repos)), ...}
+        self.sent = {}
+        self.load()
+
+    def record(self, smarthost, mailfrom, recipients, repo, failures,
+               logNames):
+        'failures: [(command line, exit code, error output), ...]'
+        mailKey = (smarthost, mailfrom, tuple(sorted(recipients)))
+        groups = self.pending.setdefault(mailKey, {})
+        repoName = os.path.basename(repo)
+        for command, code, errors in failures:
+            key = (util.commandName(command), code,
+                   errorSignature(errors, repoName))
+            errors = '\n'.join((errors or '').rstrip('\n').split('\n')
+                               [-self.DETAIL:])
+            groups.setdefault(key, {})[repo] = (errors, logNames)
+
+    def flush(self, spool=None, now=None):
+        '''
+        Mail each recipient set the failures it has not yet been told
+        about.  A mailed failure stays suppressed until the interval
+        has passed, even across flushes in which it did not occur,
+        such as polling passes that do not synchronize.
+        return: number of messages sent
+        '''
+        if now is None:
+            now = time.time()
+        sent = dict((x, y) for x, y in self.sent.items()
+                    if now - y[0] < self.interval)
+        messages = 0
+        for mailKey, groups in sorted(self.pending.items()):
+            report = []
+            ongoing = 0
+            for key, repos in sorted(groups.items()):
+                repoSet = frozenset(repos)
+                previous = self.sent.get((mailKey, key))
+                if (previous is not None and
+                    now - previous[0] < self.interval and
+                    repoSet <= previous[1]):
+                    sent[(mailKey, key)] = previous
+                    ongoing += 1
+                    continue
+                if previous is not None and now - previous[0] < self.interval:
+                    repoSet |= previous[1]
+                sent[(mailKey, key)] = (now, repoSet)
+                report.append((key, repos))
+            if report:
+                self.send(spool, mailKey, report, ongoing)
+                messages += 1
+        self.sent = sent
+        self.pending = {}
+        self.save()
+        return messages
+
+    @staticmethod
+    def format(report, ongoing):
+        text = []
+        for (command, code, signature), repos in report:
+            text.append('%s exited %s in %d repositor%s:\n    %s\n' %(
+                command, code, len(repos), len(repos) == 1 and 'y' or 'ies',
+                signature))
+            for repo in sorted(repos):
+                errors, logNames = repos[repo]
+                text.append('  %s\n' %repo)
+                for logName in logNames:
+                    text.append('    %s\n' %logName)
+            errors = repos[sorted(repos)[0]][0]
+            text.append('  Error output from %s:\n' %sorted(repos)[0])
+            text.extend('    %s\n' %x for x in errors.split('\n'))
+            text.append('\n')
+        if ongoing:
+            text.append('%d earlier reported failure%s still occurring.\n'
+                        %(ongoing, ongoing != 1 and 's are' or ' is'))
+        return ''.join(text)
+
+    def send(self, spool, mailKey, report, ongoing):
+        from email.mime.text import MIMEText
+        smarthost, mailfrom, recipients = mailKey
+        repos = set()
+        for key, failed in report:
+            repos.update(failed)
+        msg = MIMEText(self.format(report, ongoing))
+        msg['Subject'] = 'bigitr error digest: %d failure%s in %d repositor%s' %(
+            len(report), len(report) != 1 and 's' or '',
+            len(repos), len(repos) == 1 and 'y' or 'ies')
+        msg['From'] = mailfrom
+        msg['To'] = ', '.join(recipients)
+        mail.deliver(spool, smarthost, mailfrom, list(recipients),
+                     msg.as_string())
+
+    def load(self):
+        sent = util.loadState(self.stateFile, self.VERSION)
+        if isinstance(sent, dict):
+            self.sent = sent
+
+    def save(self):
+        if self.stateFile:
+            util.saveState(self.stateFile, self.VERSION, self.sent)
@@ -19,6 +19,7 @@ import traceback
 
 from bigitr import appconfig
 from bigitr import log
+from bigitr import shell
 
 class Errors(object):
     def __init__(self, ctx):
@@ -37,7 +38,19 @@ class Errors(object):
         errmsg = ("Error for repository '%s':\n" %repo) + ''.join(
             traceback.format_exception(*exception))
         self.ctx.logs[repo].writeError(errmsg)
+        if self.ctx.metrics is not None:
+            self.ctx.metrics.error(repo)
         self.ctx.mails[repo].addAttachment(errmsg, 'Traceback')
+        command, code = (None, None)
+        if isinstance(exception[1], shell.ErrorExitCode):
+            command, code = self.ctx.logs[repo].lastCommand
+        if command is None:
+            # not from a command; group by exception instead
+            self.ctx.mails[repo].addFailure(
+                'python', exception[0].__name__, errmsg)
+        else:
+            self.ctx.mails[repo].addFailure(
+                command, code, self.ctx.logs[repo].lastError())
 
         if action == appconfig.WARN:
             # also print error to stderr; ABORT will end up on
@@ -17,61 +17,167 @@
 import os
 import shell
 
+from bigitr import status
 from bigitr import util
 
+def changesRefs(fn):
+    'the ref snapshot is read again after fn, even if it fails'
+    def wrapper(self, *args, **kwargs):
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            self.snapshot = None
+    return wrapper
+
+
 class Git(object):
+    # bigitr owns its clones, so it may tune them for repeated status scans
+    CLONE_CONFIG = ['--config', 'core.untrackedCache=true',
+                    '--config', 'index.version=4']
+
     def __init__(self, ctx, repo):
         self.ctx = ctx
         self.repo = repo
         self.log = self.ctx.logs[repo]
-
+        # [(remote, localbranch, remotebranch), ...] for pushDeferred
+        self.deferred = []
+        # nothing new to fetch until bigitr itself pushes; one Git
+        # object lives for one run on the repository
+        self.fetched = False
+        # [(sha, refname), ...] from for-each-ref until refs change
+        self.snapshot = None
+
+    @changesRefs
     def clone(self, uri):
-        return shell.run(self.log, 'git', 'clone', uri)
+        args = (self.CLONE_CONFIG +
+                self.ctx.getCloneArguments(self.repo) + [uri])
+        rc = shell.run(self.log, 'git', 'clone', *args)
+        self.fetched = True
+        return rc
+
+    def fetchRefspecs(self):
+        'refspecs for the branches configured for this repository'
+        branches = set(x[1] for x in self.ctx.getImportBranchMaps(self.repo))
+        for gitbranch, _, exportbranch in self.ctx.getExportBranchMaps(
+                self.repo):
+            branches.update((gitbranch, exportbranch))
+        for source, targets in self.ctx.getMergeBranchMaps(self.repo).items():
+            branches.add(source)
+            branches.update(targets)
+        # the trailing * keeps a branch not yet created on the remote
+        # from failing the fetch
+        return ['+refs/heads/%s*:refs/remotes/origin/%s*' %(x, x)
+                for x in sorted(branches)]
 
     def fetch(self):
-        return shell.run(self.log, 'git', 'fetch', '--all')
-
+        if self.fetched:
+            return 0
+        rc = shell.run(self.log, 'git', 'fetch', 'origin',
+                       *self.fetchRefspecs())
+        self.fetched = True
+        self.snapshot = None
+        return rc
+
+    @changesRefs
     def reset(self, ref='HEAD'):
         shell.run(self.log, 'git', 'reset', '--hard', ref)
 
     def clean(self):
         shell.run(self.log, 'git', 'clean', '--force', '-x', '-d')
 
+    def gitFile(self, name):
+        return '/'.join((self.ctx.getGitDir(),
+                         self.ctx.getRepositoryName(self.repo),
+                         '.git', name))
+
+    def pristineMarker(self):
+        'present only while the working tree is known to be pristine'
+        return self.gitFile('bigitr-pristine')
+
     def pristine(self):
+        if os.path.exists(self.pristineMarker()):
+            # bigitr left the tree clean and has not modified it since
+            return
         if self.statusIgnored():
             self.clean()
             refs = self.refs()
             if refs:
                 if 'HEAD' in (x[1] for x in refs):
                     self.reset()
+        file(self.pristineMarker(), 'w').close()
+
+    def tuneClone(self):
+        '''
+        give a clone made before CLONE_CONFIG existed the same settings,
+        once per clone
+        '''
+        marker = self.gitFile('bigitr-tuned')
+        if os.path.exists(marker):
+            return
+        shell.run(self.log, 'git', 'config', 'core.untrackedCache', 'true')
+        shell.run(self.log, 'git', 'config', 'index.version', '4')
+        shell.run(self.log, 'git', 'update-index', '--index-version', '4')
+        file(marker, 'w').close()
+
+    def markDirty(self):
+        'must be called before anything but git may modify the working tree'
+        marker = self.pristineMarker()
+        if os.path.exists(marker):
+            os.remove(marker)
+
+    def refSnapshot(self):
+        'return: [(sha, refname), ...], read once until bigitr changes refs'
+        if self.snapshot is None:
+            _, refs = shell.read(self.log, 'git', 'for-each-ref',
+                                 '--format=%(objectname) %(refname)')
+            self.snapshot = [tuple(x.split()) for x in refs.split('\n') if x]
+        return self.snapshot
+
+    def head(self):
+        'return: symbolic ref or sha in HEAD, read without running git'
+        head = file(self.gitFile('HEAD')).read().strip()
+        if head.startswith('ref: '):
+            return head[5:]
+        return head
 
     def branches(self):
-        _, branches = shell.read(self.log,
-            'git', 'branch', '-a')
-        if branches:
-            return set(x[2:].split()[0] for x in branches.split('\n') if x)
-        return set()
+        'return: set of local branches and "remotes/<remote>/<branch>"'
+        branches = set()
+        for _, ref in self.refSnapshot():
+            if ref.startswith('refs/heads/'):
+                branches.add(ref[11:])
+            elif ref.startswith('refs/remotes/'):
+                branches.add(ref[5:])
+        return branches
 
     def branch(self):
-        _, branch = shell.read(self.log,
-            'git', 'symbolic-ref', '--short', '-q', 'HEAD')
-        return branch
+        'return: current branch, or "" if HEAD is detached'
+        head = self.head()
+        if head.startswith('refs/heads/'):
+            return head[11:]
+        return ''
 
     def refs(self):
-        # no refs yet returns an error in normal operations
-        rc, refs = shell.read(self.log,
-            'git', 'show-ref', '--head', error=False)
-        if not rc:
-            return [tuple(x.split()) for x in refs.strip().split('\n')]
-        return None
-
+        'return: [(sha, "HEAD"), (sha, refname), ...], or None if no refs'
+        refs = list(self.refSnapshot())
+        head = self.head()
+        if head.startswith('refs/'):
+            head = dict((x[1], x[0]) for x in refs).get(head)
+        if head:
+            refs.insert(0, (head, 'HEAD'))
+        return refs or None
+
+    @changesRefs
     def newBranch(self, branch):
         shell.run(self.log, 'git', 'branch', branch)
         shell.run(self.log, 'git', 'push', '--set-upstream', 'origin', branch)
+        self.fetched = False
 
+    @changesRefs
     def trackBranch(self, branch):
         shell.run(self.log, 'git', 'branch', '--track', branch, 'origin/'+branch)
         
+    @changesRefs
     def checkoutTracking(self, branch):
         shell.run(self.log,
             'git', 'checkout', '-f', '--track', 'origin/'+branch)
@@ -81,6 +187,7 @@ class Git(object):
         # this command will fail for initial checkins with no files
         shell.run(self.log, 'git', 'rm', '-rf', '.', error=False)
 
+    @changesRefs
     def checkout(self, branch):
         # line ending normalization can cause checkout to fail to
         # change branch without -f even though there are no other
@@ -123,23 +230,81 @@ class Git(object):
     def addAll(self):
         shell.run(self.log, 'git', 'add', '-A', '.')
 
+    @changesRefs
     def mergeDefault(self, branch, message):
-        return shell.run(self.log, 'git', 'merge', branch, '-m', message,
-                         error=False)
-
+        rc = shell.run(self.log, 'git', 'merge', branch, '-m', message,
+                       error=False)
+        if rc:
+            # a failed merge leaves conflicts in the working tree
+            self.markDirty()
+        return rc
+
+    @changesRefs
     def mergeFastForward(self, branch):
         shell.run(self.log, 'git', 'merge', '--ff', '--ff-only', branch)
 
+    @changesRefs
     def mergeIgnore(self, branch):
         shell.run(self.log, 'git', 'merge', '--strategy=ours', '--ff',
             '-m', 'branch "%s" closed' %branch, branch)
 
+    @changesRefs
     def commit(self, message):
         shell.run(self.log, 'git', 'commit', '-m', message)
 
     def push(self, remote, localbranch, remotebranch):
+        if self.ctx.getDeferPush(self.repo):
+            # the latest push to a remote branch wins
+            self.deferred = [x for x in self.deferred
+                             if x[0::2] != (remote, remotebranch)]
+            self.deferred.append((remote, localbranch, remotebranch))
+            return
         shell.run(self.log, 'git', 'push', remote,
             ':'.join((localbranch, remotebranch)))
+        self.fetched = False
+        self.snapshot = None
+
+    def isPushDeferred(self, remotebranch):
+        return remotebranch in (x[2] for x in self.deferred)
+
+    @changesRefs
+    def pushDeferred(self):
+        'push deferred branches, all or none per remote, in one push each'
+        deferred, self.deferred = self.deferred, []
+        if deferred:
+            self.fetched = False
+        for remote in sorted(set(x[0] for x in deferred)):
+            refspecs = [':'.join(x[1:]) for x in deferred if x[0] == remote]
+            rc, output = shell.read(self.log, 'git', 'push', '--atomic',
+                '--porcelain', remote, *refspecs, error=False)
+            if rc:
+                failures = self.pushFailures(output) or ['see %s'
+                                                         %self.log.thiserr]
+                raise RuntimeError('push to %s failed:\n%s' %(
+                    remote, '\n'.join(failures)))
+
+    def pushDeferredAfterError(self, err):
+        '''
+        push branches updated before a failure, once that failure has
+        been reported, reporting a failed push separately through err
+        '''
+        try:
+            self.pushDeferred()
+        except:
+            err.report(self.repo)
+
+    @staticmethod
+    def pushFailures(output):
+        'return: ["branch: reason", ...] for refs git push --porcelain rejected'
+        failures = []
+        for line in output.split('\n'):
+            fields = line.split('\t')
+            if len(fields) == 3 and fields[0] == '!':
+                ref = fields[1].split(':')[-1]
+                if ref.startswith('refs/heads/'):
+                    ref = ref[len('refs/heads/'):]
+                failures.append('%s: %s' %(ref, fields[2]))
+        return failures
 
     def logmessages(self, since, until):
         _, messages = shell.read(self.log,
@@ -154,6 +319,7 @@ class Git(object):
 
         if os.path.exists(repoDir):
             os.chdir(repoDir)
+            self.tuneClone()
         else:
             os.chdir(gitDir)
             self.clone(self.ctx.getGitRef(self.repo))
@@ -178,18 +344,25 @@ class Git(object):
                 self.commit('create new empty master branch')
                 self.push('origin', 'master', 'master')
 
+    def runHooks(self, hooks):
+        if not hooks:
+            return
+        # hooks are not supposed to commit, but might
+        self.snapshot = None
+        with status.phase(self.ctx, self.repo, 'hooks'):
+            for hook in hooks:
+                # hooks may leave arbitrary files in the working tree
+                self.markDirty()
+                shell.run(self.log, *hook)
+
     def runImpPreHooks(self, branch):
-        for hook in self.ctx.getGitImpPreHooks(self.repo, branch):
-            shell.run(self.log, *hook)
+        self.runHooks(self.ctx.getGitImpPreHooks(self.repo, branch))
 
     def runImpPostHooks(self, branch):
-        for hook in self.ctx.getGitImpPostHooks(self.repo, branch):
-            shell.run(self.log, *hook)
+        self.runHooks(self.ctx.getGitImpPostHooks(self.repo, branch))
 
     def runExpPreHooks(self, branch):
-        for hook in self.ctx.getGitExpPreHooks(self.repo, branch):
-            shell.run(self.log, *hook)
+        self.runHooks(self.ctx.getGitExpPreHooks(self.repo, branch))
 
     def runExpPostHooks(self, branch):
-        for hook in self.ctx.getGitExpPostHooks(self.repo, branch):
-            shell.run(self.log, *hook)
+        self.runHooks(self.ctx.getGitExpPostHooks(self.repo, branch))
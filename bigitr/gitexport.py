@@ -17,10 +17,14 @@
 import os
 import time
 
+from bigitr import backoff
 from bigitr import errhandler
 from bigitr import cvs
 from bigitr import git
 from bigitr import ignore
+from bigitr import metrics
+from bigitr import pollrate
+from bigitr import status
 from bigitr import util
 
 class Exporter(object):
@@ -32,16 +36,27 @@ class Exporter(object):
         for repository in self.ctx.getRepositories():
             Git = git.Git(self.ctx, repository)
             self.exportBranches(repository, Git)
+            Git.pushDeferred()
 
     def exportBranches(self, repository, Git, requestedBranch=None):
         onerror = self.ctx.getExportError()
         for gitbranch, cvsbranch, exportbranch in self.ctx.getExportBranchMaps(
                 repository):
             if requestedBranch is None or gitbranch == requestedBranch:
+                if not backoff.ready(self.ctx, repository, 'export',
+                                     gitbranch):
+                    continue
                 CVS = cvs.CVS(self.ctx, repository, cvsbranch)
                 try:
-                    self.exportgit(repository, Git, CVS, gitbranch, exportbranch)
+                    with status.phase(self.ctx, repository, 'export',
+                                      gitbranch):
+                        self.exportgit(repository, Git, CVS, gitbranch,
+                                       exportbranch)
+                    backoff.succeeded(self.ctx, repository, 'export',
+                                      gitbranch)
                 except Exception as e:
+                    Git.markDirty()
+                    backoff.failed(self.ctx, repository, 'export', gitbranch)
                     self.err(repository, onerror)
 
     @util.saveDir
@@ -63,6 +78,7 @@ class Exporter(object):
             # the changes should be due to normalization such as
             # populated CVS keywords checked into Git.)
             return
+        pollrate.changed(self.ctx, repository)
 
         # it is not recommended that hooks commit, but if they do, they will
         # have commit messages that are automated and should not show up in
@@ -106,7 +122,9 @@ class Exporter(object):
             Git.infoDiff(originExportBranch, gitbranch)
 
         CVS.deleteFiles(sorted(list(DeletedFiles)))
-        CVS.copyFiles(repoDir, sorted(list(CommonFiles.union(AddedFiles))))
+        size = CVS.copyFiles(repoDir,
+                             sorted(list(CommonFiles.union(AddedFiles))))
+        metrics.copied(self.ctx, repository, 'export', size)
         # directories need to be added first, and here sorted order
         # causes directories to be specified in top-down order
         CVS.addDirectories(sorted(list(AddedDirs)))
@@ -141,9 +159,12 @@ class Exporter(object):
                                ' '.join(CVSMetaData))
 
     def cloneGit(self, repository, Git, repoDir):
-        if not os.path.exists(repoDir):
-            os.chdir(self.ctx.getGitDir())
-            Git.clone(self.ctx.getGitRef(repository))
+        if os.path.exists(repoDir):
+            os.chdir(repoDir)
+            Git.tuneClone()
+            return
+        os.chdir(self.ctx.getGitDir())
+        Git.clone(self.ctx.getGitRef(repository))
         os.chdir(repoDir)
 
     def checkoutCVS(self, CVS):
@@ -160,6 +181,9 @@ class Exporter(object):
 
 
     def prepareGitClone(self, repository, Git, gitbranch):
+        if Git.isPushDeferred(gitbranch):
+            # the reset below would discard the commits waiting to be pushed
+            Git.pushDeferred()
         Git.fetch()
         # clean up after any garbage left over from previous runs so
         # that we do not copy files not managed, at least on this branch,
@@ -173,11 +197,20 @@ class Exporter(object):
         return branches
 
     def calculateFileSets(self, CVS, Git):
-        gitignore = ignore.Ignore(Git.log, '.gitignore')
-        CVSList = CVS.listContentFiles()
-        CVSFileSet = set(CVSList)
+        gitignore = ignore.IgnoreTree(Git.log, '.', '.gitignore')
         GitList = Git.listContentFiles()
         GitFileSet = set(GitList)
+        # skip CVS directories that .gitignore ignores, unless Git
+        # has content at or below them anyway
+        GitPaths = set(GitFileSet)
+        for x in GitFileSet:
+            x = os.path.dirname(x)
+            while x and x not in GitPaths:
+                GitPaths.add(x)
+                x = os.path.dirname(x)
+        CVSList = CVS.listContentFiles(
+            prune=lambda x: x not in GitPaths and gitignore.prune(x))
+        CVSFileSet = set(CVSList)
         DeletedFiles = CVSFileSet - GitFileSet
         # even if .cvsignore files are deleted in git, do not remove them in CVS
         DeletedFiles -= set(x for x in DeletedFiles
@@ -14,7 +14,9 @@
 #  limitations under the License.
 #
 
+from bigitr import backoff
 from bigitr import errhandler
+from bigitr import status
 from bigitr import util
 
 class Merger(object):
@@ -24,11 +26,21 @@ class Merger(object):
 
     def mergeBranches(self, repository, Git, requestedBranch=None):
         onerror = self.ctx.getMergeError()
+        gitbranch = None
         try:
             for gitbranch in sorted(self.ctx.getMergeBranchMaps(repository).keys()):
                 if requestedBranch is None or gitbranch == requestedBranch:
-                    self.mergeBranch(repository, Git, gitbranch)
+                    if not backoff.ready(self.ctx, repository, 'merge',
+                                         gitbranch):
+                        continue
+                    with status.phase(self.ctx, repository, 'merge',
+                                      gitbranch):
+                        self.mergeBranch(repository, Git, gitbranch)
+                    backoff.succeeded(self.ctx, repository, 'merge',
+                                      gitbranch)
         except Exception as e:
+            Git.markDirty()
+            backoff.failed(self.ctx, repository, 'merge', gitbranch)
             self.err(repository, onerror)
 
     @util.saveDir
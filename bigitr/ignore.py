@@ -16,47 +16,225 @@
 
 import fnmatch
 import os
+import re
+
+def isLiteral(exp):
+    'return: True if exp contains no fnmatch wildcards'
+    return not [x for x in '*?[' if x in exp]
 
 class Ignore(object):
-    def __init__(self, log, ignorePath):
+    def __init__(self, log, ignorePath, fileName=None):
         self.log = log
         self.ignores = None
-        self.fileName = os.path.basename(ignorePath)
+        self.fileName = fileName or os.path.basename(ignorePath)
         self.parse(ignorePath)
+        self.compile()
 
     def parse(self, ignorePath):
         if os.path.exists(ignorePath):
             self.ignores = [
                 x.strip()
                 for x in file(ignorePath).readlines()
-                if not x.startswith('#')
+                if not x.startswith('#') and x.strip()
             ]
 
-    def match(self, exp, pathSet):
-        'Returns paths to be filtered out'
-        # ignored files will be the exception, no excessive optimization
-        if '/' in exp:
-            filtered = set(fnmatch.filter(pathSet, exp))
-        else:
-            filtered = set()
-            for path in pathSet:
-                if fnmatch.fnmatch(os.path.basename(path), exp):
-                    filtered.add(path)
-        if filtered:
-            for path in filtered:
-                os.write(self.log.stderr,
-                    '%s: %s ignores file %s\n' %(self.fileName, exp, path))
-        return filtered
+    def compile(self):
+        '''
+        Sort the patterns into lookup tables that filter can consult
+        in one pass over the paths: exact basenames, "*.ext" basename
+        suffixes, and exact paths are dictionary lookups; all other
+        patterns are combined into one regular expression each for
+        basenames and for whole paths.  Each table maps to the index
+        of the pattern in the file, so that the first pattern in the
+        file is reported for a path that several patterns match.
+        Patterns ending in "/" match only directories.
+        '''
+        self.basenames = {}
+        self.extensions = {}
+        self.paths = {}
+        basenameExps = []
+        pathExps = []
+        directoryBasenameExps = []
+        directoryPathExps = []
+        for index, exp in enumerate(self.ignores or ()):
+            if exp.endswith('/'):
+                exp = exp.rstrip('/')
+                if '/' in exp:
+                    directoryPathExps.append((index, exp))
+                elif exp:
+                    directoryBasenameExps.append((index, exp))
+            elif '/' in exp:
+                if isLiteral(exp):
+                    self.paths.setdefault(exp, index)
+                else:
+                    pathExps.append((index, exp))
+            elif isLiteral(exp):
+                self.basenames.setdefault(exp, index)
+            elif (exp.startswith('*.') and isLiteral(exp[1:])
+                  and '.' not in exp[2:]):
+                self.extensions.setdefault(exp[1:], index)
+            else:
+                basenameExps.append((index, exp))
+        self.basenameRE = self.compileExps(basenameExps)
+        self.pathRE = self.compileExps(pathExps)
+        self.directoryBasenameRE = self.compileExps(directoryBasenameExps)
+        self.directoryPathRE = self.compileExps(directoryPathExps)
+
+    @staticmethod
+    def compileExps(exps):
+        '''
+        return: (combined regular expression matching any of exps,
+                 [(index, regular expression), ...]) or None
+        '''
+        if not exps:
+            return None
+        translated = [(index, fnmatch.translate(exp)) for index, exp in exps]
+        return (re.compile('|'.join('(?:%s)' %x for _, x in translated)),
+                [(index, re.compile(x)) for index, x in translated])
+
+    @staticmethod
+    def searchExps(compiled, name):
+        'return: index of the first pattern in compiled matching name'
+        if compiled is None:
+            return None
+        combined, exps = compiled
+        if not combined.match(name):
+            return None
+        for index, exp in exps:
+            if exp.match(name):
+                return index
+
+    def match(self, path, directory=False):
+        'return: the first pattern that ignores path, or None'
+        basename = path.rsplit('/', 1)[-1]
+        extension = None
+        dot = basename.rfind('.')
+        if dot >= 0:
+            extension = basename[dot:]
+        indexes = [x for x in (
+            self.basenames.get(basename),
+            self.extensions.get(extension),
+            self.paths.get(path),
+            self.searchExps(self.basenameRE, basename),
+            self.searchExps(self.pathRE, path),
+        ) if x is not None]
+        if directory:
+            indexes.extend(x for x in (
+                self.searchExps(self.directoryBasenameRE, basename),
+                self.searchExps(self.directoryPathRE, path),
+            ) if x is not None)
+        if indexes:
+            return self.ignores[min(indexes)]
+        return None
 
     def filter(self, pathSet):
         'Returns paths not ignored'
         if self.ignores is None:
             return pathSet
 
-        filtered = set(pathSet)
+        filtered = set()
+        messages = []
+        for path in sorted(pathSet):
+            exp = self.match(path)
+            if exp is None:
+                filtered.add(path)
+            else:
+                messages.append('%s: %s ignores file %s\n'
+                                %(self.fileName, exp, path))
+        if messages:
+            self.log.writeError(''.join(messages))
 
-        for exp in self.ignores:
-            ignored = self.match(exp, pathSet)
-            filtered -= ignored
+        return filtered
+
+
+class IgnoreTree(object):
+    '''
+    Ignore files named fileName in root and in any of its subdirectories.
+    Each ignore file applies to everything below the directory that
+    contains it, and its patterns that contain "/" are matched against
+    paths relative to that directory.  Ignore files are read when first
+    needed and the decision for each directory is remembered, so that
+    walkers can prune ignored subtrees without reading them.
+    '''
+    def __init__(self, log, root, fileName):
+        self.log = log
+        self.root = os.path.abspath(root)
+        self.fileName = fileName
+        # {directory: Ignore or None, ...}
+        self.ignores = {}
+        # {directory: (ignore file, pattern) or None, ...}
+        self.directories = {}
+
+    def getIgnore(self, directory):
+        'return: Ignore for the ignore file in directory, or None'
+        if directory not in self.ignores:
+            ignoreName = '/'.join(x for x in (directory, self.fileName) if x)
+            ignorePath = '/'.join((self.root, ignoreName))
+            i = None
+            if os.path.exists(ignorePath):
+                i = Ignore(self.log, ignorePath, ignoreName)
+                if i.ignores is None:
+                    i = None
+            self.ignores[directory] = i
+        return self.ignores[directory]
+
+    def matchPath(self, path, directory=False):
+        '''
+        return: (ignore file, pattern) for the first ignore file, from
+        the root down, that ignores path itself, or None
+        '''
+        parts = path.split('/')
+        for depth in range(len(parts)):
+            i = self.getIgnore('/'.join(parts[:depth]))
+            if i is None:
+                continue
+            subPath = '/'.join(parts[depth:])
+            # a leading "/" anchors a pattern to the ignore file directory
+            exp = (i.match(subPath, directory) or
+                   i.match('/' + subPath, directory))
+            if exp is not None:
+                return i.fileName, exp
+        return None
+
+    def ignoredDirectory(self, directory):
+        '''
+        return: (ignore file, pattern) that ignores directory or one
+        of its parents, or None
+        '''
+        if not directory:
+            return None
+        if directory not in self.directories:
+            self.directories[directory] = (
+                self.ignoredDirectory(directory.rpartition('/')[0]) or
+                self.matchPath(directory, directory=True))
+        return self.directories[directory]
+
+    def match(self, path):
+        'return: (ignore file, pattern) that ignores path, or None'
+        return (self.ignoredDirectory(path.rpartition('/')[0]) or
+                self.matchPath(path))
+
+    def prune(self, directory):
+        'return: True if a walker should not descend into directory'
+        ignored = self.ignoredDirectory(directory)
+        if ignored is None:
+            return False
+        self.log.writeError('%s: %s ignores directory %s\n'
+                            %(ignored + (directory,)))
+        return True
+
+    def filter(self, pathSet):
+        'Returns paths not ignored'
+        filtered = set()
+        messages = []
+        for path in sorted(pathSet):
+            ignored = self.match(path)
+            if ignored is None:
+                filtered.add(path)
+            else:
+                messages.append('%s: %s ignores file %s\n'
+                                %(ignored + (path,)))
+        if messages:
+            self.log.writeError(''.join(messages))
 
         return filtered
@@ -14,12 +14,52 @@
 #  limitations under the License.
 #
 
-import gzip
+import collections
 import os
+import re
 import stat
 import time
 import weakref
 
+from bigitr import status
+
+STDOUT = 0
+STDERR = 1
+
+# bytes of each stream of one command kept for error reports
+TAIL_LIMIT = 1024 * 1024
+
+class RingBuffer(object):
+    'keeps the last limit bytes written to it'
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = collections.deque()
+        self.size = 0
+        self.dropped = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size - len(self.chunks[0]) >= self.limit:
+            chunk = self.chunks.popleft()
+            self.size -= len(chunk)
+            self.dropped += len(chunk)
+
+    def omitted(self):
+        'return: number of bytes written but not kept'
+        return self.dropped + max(0, self.size - self.limit)
+
+    def value(self):
+        'return: the bytes kept, without any mark of omission'
+        return ''.join(self.chunks)[-self.limit:]
+
+    def getvalue(self):
+        data = self.value()
+        omitted = self.omitted()
+        if omitted:
+            data = '[%d bytes omitted]\n%s' %(omitted, data)
+        return data
+
 class Log(object):
     def __init__(self, ctx, repo, cache):
         self.ctx = ctx
@@ -28,78 +68,138 @@ class Log(object):
             self.cache = weakref.ref(cache)
         self.repo = repo
         logDir = ctx.getLogDir()
-        repoLogDir = '/'.join((logDir, ctx.getRepositoryName(repo)))
-        basename = time.strftime('%Y%m%d-%H:%M:%S')
+        now = time.localtime()
+        # sharded by date so that no directory grows without bound
+        repoLogDir = '/'.join((logDir, ctx.getRepositoryName(repo),
+                               time.strftime('%Y/%m/%d', now)))
+        basename = time.strftime('%Y%m%d-%H:%M:%S', now)
         if not os.path.exists(repoLogDir):
             os.makedirs(repoLogDir)
         self.thislog = '%s/%s.log' %(repoLogDir, basename)
         self.thiserr = '%s/%s.err' %(repoLogDir, basename)
-        self.stdout = os.open(self.thislog, os.O_CREAT|os.O_RDWR, 0700)
-        self.stderr = os.open(self.thiserr, os.O_CREAT|os.O_RDWR, 0700)
+        self.compressLevel = None
+        if ctx.getCompressLogs():
+            # written through a streaming compressor, opened on first write
+            self.compressLevel = ctx.getCompressLevel()
+            self.thislog += '.gz'
+            self.thiserr += '.gz'
+            self.stdout = None
+            self.stderr = None
+        else:
+            self.stdout = os.open(self.thislog, os.O_CREAT|os.O_RDWR, 0700)
+            self.stderr = os.open(self.thiserr, os.O_CREAT|os.O_RDWR, 0700)
+        # (GzipFile, file) for each compressed stream once opened
+        self.streams = [None, None]
+        self.sizes = [0, 0]
+        # LoggingShell pipes all child output through writeOutput and
+        # writeError; the output of the current command is also kept
+        # in memory for error reports, up to TAIL_LIMIT bytes per stream
+        self.tail = None
+        self.lastTail = (None, None)
         self.start_mark = (None, None)
         self.stop_mark = (None, None)
+        # (command line, exit code) of the last command run
+        self.command = None
+        self.commandStarted = None
+        self.lastCommand = (None, None)
 
-    @staticmethod
-    def tell(fd):
-        return os.lseek(fd, 0, os.SEEK_CUR)
+    def openStream(self, stream):
+        import gzip
+        fileName = (self.thislog, self.thiserr)[stream]
+        f = os.fdopen(os.open(fileName, os.O_CREAT|os.O_WRONLY, 0700), 'wb')
+        gzo = gzip.GzipFile(fileName, 'wb', self.compressLevel, f)
+        self.streams[stream] = (gzo, f)
+        return gzo
+
+    def write(self, stream, message):
+        if self.compressLevel is None:
+            os.write((self.stdout, self.stderr)[stream], message)
+        elif self.streams[stream] is None:
+            self.openStream(stream).write(message)
+        else:
+            self.streams[stream][0].write(message)
+        self.sizes[stream] += len(message)
+        if self.tail is not None:
+            self.tail[stream].write(message)
+
+    def writeOutput(self, message):
+        self.write(STDOUT, message)
 
     def writeError(self, message):
-        os.write(self.stderr, message)
+        self.write(STDERR, message)
 
     def currentMark(self):
-        return (self.tell(self.stdout),
-                self.tell(self.stderr))
+        return tuple(self.sizes)
 
-    def markStart(self):
+    def markStart(self, command=None):
+        self.command = command
+        self.commandStarted = time.time()
         self.start_mark = self.currentMark()
         self.stop_mark = (None, None)
+        self.tail = (RingBuffer(TAIL_LIMIT), RingBuffer(TAIL_LIMIT))
 
-    def markStop(self):
+    def markRunning(self, pid):
+        'the command passed to markStart is running as process pid'
+        status.command(self.ctx, self.repo, self.command, pid)
+
+    def markStop(self, returnCode=None):
         self.stop_mark = self.currentMark()
+        status.command(self.ctx, self.repo, None, None)
+        self.lastCommand = (self.command, returnCode)
+        if self.command is not None and self.ctx.metrics is not None:
+            self.ctx.metrics.command(self.repo, self.command)
+        if self.command is not None and self.ctx.profiler is not None:
+            self.ctx.profiler.command(self.repo, self.command,
+                                      time.time() - self.commandStarted)
+        self.lastTail = tuple(x.getvalue() for x in self.tail)
+        self.tail = None
 
     @staticmethod
-    def read(filename, start, stop):
-        f = file(filename)
-        f.seek(start)
-        return f.read(stop - start)
+    def openRead(filename):
+        'return: file object reading the uncompressed log, or None'
+        if not os.path.exists(filename):
+            return None
+        if filename.endswith('.gz'):
+            import gzip
+            return gzip.GzipFile(filename)
+        return file(filename)
 
     def lastError(self):
         if None in (self.start_mark + self.stop_mark):
             return None
-        return self.read(self.thiserr, self.start_mark[1], self.stop_mark[1])
+        return self.lastTail[STDERR]
 
     def lastOutput(self):
         if None in (self.start_mark + self.stop_mark):
             return (None, None)
-        return (self.read(self.thislog, self.start_mark[0], self.stop_mark[0]),
-                self.read(self.thiserr, self.start_mark[1], self.stop_mark[1]))
+        return self.lastTail
 
     def mailLastOutput(self, command):
-        self.ctx.mails[self.repo].addOutput(command, *self.lastOutput())
-
-    def _compress(self, filename):
-        if not self.ctx.getCompressLogs():
-            return
-        gzo = gzip.GzipFile(filename + '.gz', 'w', 9)
-        gzo.writelines(open(filename))
-        gzo.close()
-        os.remove(filename)
+        stdout, stderr = self.lastOutput()
+        mail = self.ctx.mails[self.repo]
+        mail.addOutput(command, stdout, stderr)
+        if self.lastCommand[0] is not None:
+            mail.addFailure(self.lastCommand[0], self.lastCommand[1], stderr)
 
     def close(self):
-        outstat = os.fstat(self.stdout)
-        errstat = os.fstat(self.stderr)
-        os.close(self.stdout)
-        os.close(self.stderr)
+        for stream in self.streams:
+            if stream is not None:
+                gzo, f = stream
+                gzo.close()
+                f.close()
+        self.streams = [None, None]
+        if self.compressLevel is None:
+            os.close(self.stdout)
+            os.close(self.stderr)
 
-        if errstat.st_size:
+        if self.sizes[STDERR]:
             # errors have been written
-            self.ctx.mails[self.repo].send(
-                file(self.thislog).read(),
-                file(self.thiserr).read())
-            self._compress(self.thiserr)
-
-        if outstat.st_size:
-            self._compress(self.thislog)
+            mail = self.ctx.mails[self.repo]
+            if self.ctx.digest is not None and mail.failures:
+                mail.addToDigest(self.ctx.digest,
+                                 (self.thislog, self.thiserr))
+            else:
+                mail.send(self.thislog, self.thiserr)
 
         if self.cache and self.cache():
             del self.cache()[self.repo]
@@ -112,3 +212,145 @@ class LogCache(dict):
         if not self.has_key(name):
             self.__setitem__(name, Log(self.ctx, name, self))
         return dict.__getitem__(self, name)
+
+
+class LogRetention(object):
+    '''
+    Applies the log retention policy of one application configuration
+    to the per-repository directories in its logdir.  Each repository
+    directory holds the logs of each run in a YYYY/MM/DD directory
+    and, when archiving is enabled, earlier days packed into
+    YYYY/MM/DD-<runs>.tar archives.
+    '''
+    runRE = re.compile(r'^(\d{4})(\d\d)(\d\d)-[^.]*')
+    archiveRE = re.compile(r'^(\d\d)-(\d+)\.tar$')
+
+    def __init__(self, appConfig):
+        self.logDir = appConfig.getLogDir()
+        self.maxAge = appConfig.getLogMaxAge()
+        self.maxRuns = appConfig.getLogMaxRuns()
+        self.maxBytes = appConfig.getLogMaxBytes()
+        self.archive = appConfig.getLogArchive()
+
+    def active(self):
+        return (self.archive or self.maxAge is not None or
+                self.maxRuns is not None or self.maxBytes is not None)
+
+    def repositoryLogDirs(self):
+        if not os.path.isdir(self.logDir):
+            return []
+        dirs = ('/'.join((self.logDir, x)) for x in os.listdir(self.logDir))
+        return sorted(x for x in dirs if os.path.isdir(x))
+
+    def shardLegacy(self, repoLogDir):
+        'move logs from before date sharding into their day directories'
+        for fileName in os.listdir(repoLogDir):
+            m = self.runRE.match(fileName)
+            path = '/'.join((repoLogDir, fileName))
+            if m is None or not os.path.isfile(path):
+                continue
+            dayDir = '/'.join((repoLogDir,) + m.groups())
+            if not os.path.exists(dayDir):
+                os.makedirs(dayDir)
+            os.rename(path, '/'.join((dayDir, fileName)))
+
+    def runs(self, dayDir):
+        'return: {run: [path, ...], ...} for the loose logs in dayDir'
+        runs = {}
+        for fileName in os.listdir(dayDir):
+            m = self.runRE.match(fileName)
+            if m is not None:
+                runs.setdefault(m.group(0), []).append(
+                    '/'.join((dayDir, fileName)))
+        return runs
+
+    def units(self, repoLogDir):
+        '''
+        return: [(mtime, runs, bytes, [path, ...]), ...], oldest first,
+        for each loose run and each archive
+        '''
+        units = []
+        for root, dirs, files in os.walk(repoLogDir):
+            for fileName in files:
+                m = self.archiveRE.match(fileName)
+                if m is None:
+                    continue
+                path = '/'.join((root, fileName))
+                st = os.stat(path)
+                units.append((st.st_mtime, int(m.group(2)), st.st_size,
+                              [path]))
+            for paths in self.runs(root).values():
+                stats = [os.stat(x) for x in paths]
+                units.append((max(x.st_mtime for x in stats), 1,
+                              sum(x.st_size for x in stats), paths))
+        units.sort()
+        return units
+
+    def archiveDays(self, repoLogDir, now):
+        'pack the loose logs of each day before today into an archive'
+        import tarfile
+        today = time.strftime('%Y/%m/%d', time.localtime(now))
+        for root, dirs, files in os.walk(repoLogDir):
+            day = root[len(repoLogDir) + 1:]
+            if len(day) != 10 or day >= today:
+                continue
+            runs = self.runs(root)
+            if not runs:
+                continue
+            monthDir, dayName = os.path.split(root)
+            archives = [x for x in os.listdir(monthDir)
+                        if x.startswith(dayName + '-') and
+                           self.archiveRE.match(x)]
+            count = len(runs)
+            tmpName = '%s.tmp' %root
+            if archives:
+                # runs were added to a day that was already packed
+                oldName = '/'.join((monthDir, archives[0]))
+                count += int(self.archiveRE.match(archives[0]).group(2))
+                os.rename(oldName, tmpName)
+                tar = tarfile.open(tmpName, 'a')
+            else:
+                tar = tarfile.open(tmpName, 'w')
+            paths = sorted(sum(runs.values(), []))
+            try:
+                for path in paths:
+                    tar.add(path, os.path.basename(path))
+            finally:
+                tar.close()
+            mtime = max(os.stat(x).st_mtime for x in paths)
+            os.utime(tmpName, (mtime, mtime))
+            os.rename(tmpName, '%s-%d.tar' %(root, count))
+            for path in paths:
+                os.remove(path)
+
+    @staticmethod
+    def removeEmptyDirs(repoLogDir):
+        for root, dirs, files in os.walk(repoLogDir, topdown=False):
+            if root != repoLogDir and not os.listdir(root):
+                os.rmdir(root)
+
+    def clean(self, repoLogDir, now=None):
+        '''
+        Apply the retention policy to one repository log directory.
+        return: number of log files removed
+        '''
+        if now is None:
+            now = time.time()
+        self.shardLegacy(repoLogDir)
+        if self.archive:
+            self.archiveDays(repoLogDir, now)
+        removed = 0
+        runs = 0
+        size = 0
+        for mtime, unitRuns, unitSize, paths in reversed(self.units(repoLogDir)):
+            runs += unitRuns
+            size += unitSize
+            if ((self.maxAge is not None and mtime < now - self.maxAge) or
+                (self.maxRuns is not None and runs > self.maxRuns) or
+                (self.maxBytes is not None and size > self.maxBytes)):
+                for path in paths:
+                    os.remove(path)
+                removed += len(paths)
+        self.removeEmptyDirs(repoLogDir)
+        return removed
+
@@ -14,11 +14,43 @@
 #  limitations under the License.
 #
 
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import smtplib
+from cStringIO import StringIO
 import weakref
 
+from bigitr import log
+
+# email and smtplib are imported only when a report is actually
+# composed; most runs never need them
+
+# attachments larger than this are sent gzip-compressed
+COMPRESS_THRESHOLD = 64 * 1024
+# bytes read at a time from logs being attached
+CHUNK = 64 * 1024
+
+def truncate(stream, limit):
+    '''
+    return: contents of stream cut to at most limit bytes by omitting
+    the middle, never holding much more than limit bytes in memory
+    '''
+    head = stream.read(limit // 2)
+    tail = log.RingBuffer(limit - len(head))
+    for data in iter(lambda: stream.read(CHUNK), ''):
+        tail.write(data)
+    omitted = tail.omitted()
+    if omitted:
+        return '%s\n[%d bytes omitted]\n%s' %(head, omitted, tail.value())
+    return head + tail.value()
+
+def deliver(spool, smarthost, mailfrom, recipients, text):
+    'queue text in spool if there is one, otherwise send it at once'
+    if spool is not None:
+        spool.add(smarthost, mailfrom, recipients, text)
+        return
+    import smtplib
+    s = smtplib.SMTP(smarthost)
+    s.sendmail(mailfrom, recipients, text)
+    s.quit()
+
 def ifEmail(fn):
     def wrapper(self, *args, **kwargs):
         if self.ignore is True:
@@ -32,6 +64,8 @@ class Email(object):
         self.recipients = ctx.getEmail(repo)
         self.mailfrom = ctx.getMailFrom()
         self.ignore = False
+        # [(command line, exit code, error output), ...] for digests
+        self.failures = []
         if self.recipients is None or self.mailfrom is None:
             self.ignore = True
             return
@@ -41,6 +75,8 @@ class Email(object):
         if cache is not None:
             self.cache = weakref.ref(cache)
         self.repo = repo
+        self.maxBytes = ctx.getMailMaxBytes()
+        from email.mime.multipart import MIMEMultipart
         self.msg = MIMEMultipart()
         self.msg['Subject'] = '%s: bigitr error report' % repo
         self.msg['From'] = self.mailfrom
@@ -53,35 +89,77 @@ class Email(object):
         desc = ''.join(x for x in desc if x.isalnum() or x == '_')
         return desc + '.txt'
 
-    @ifEmail
-    def addAttachment(self, text, desc):
-        msg = MIMEText(text)
+    def _attach(self, text, desc):
+        filename = self._filename(desc)
+        if len(text) > COMPRESS_THRESHOLD:
+            import gzip
+            from email.mime.application import MIMEApplication
+            compressed = StringIO()
+            gzo = gzip.GzipFile(filename, 'wb', fileobj=compressed)
+            gzo.write(text)
+            gzo.close()
+            msg = MIMEApplication(compressed.getvalue(), 'gzip')
+            filename += '.gz'
+        else:
+            from email.mime.text import MIMEText
+            msg = MIMEText(text)
         msg.add_header('Content-Disposition', 'attachment',
-                       filename=self._filename(desc))
+                       filename=filename)
         self.msg.attach(msg)
 
+    @ifEmail
+    def addAttachment(self, text, desc):
+        if len(text) > self.maxBytes:
+            text = truncate(StringIO(text), self.maxBytes)
+        self._attach(text, desc)
+
+    @ifEmail
+    def addLogAttachment(self, fileName, desc):
+        'attach a log file, read as a stream so that its size does not matter'
+        f = log.Log.openRead(fileName)
+        if f is None:
+            text = ''
+        else:
+            try:
+                text = truncate(f, self.maxBytes)
+            finally:
+                f.close()
+        self._attach(text, desc)
+
     @ifEmail
     def addOutput(self, command, stdout, stderr):
         self.addAttachment(stderr, 'errors from ' + command)
         self.addAttachment(stdout, 'output from ' + command)
 
     @ifEmail
-    def send(self, allout, allerr):
+    def addFailure(self, command, code, errors):
+        self.failures.append((command, code, errors))
+
+    @ifEmail
+    def addToDigest(self, digest, logNames):
+        'record failures in digest instead of sending a message now'
+        digest.record(self.ctx.getSmartHost(), self.mailfrom,
+                      self.recipients, self.repo, self.failures, logNames)
+        self._uncache()
+
+    @ifEmail
+    def send(self, logName, errName):
         # send email only if an error has been attached
         if self.msg.get_payload():
             # First, attach the entire repository log; the individual
             # command messages will be embedded in it
-            self.addAttachment(allerr, 'all errors')
-            self.addAttachment(allout, 'all output')
+            self.addLogAttachment(errName, 'all errors')
+            self.addLogAttachment(logName, 'all output')
             self._send()
+        self._uncache()
+
+    def _uncache(self):
         if self.cache and self.cache():
             del self.cache()[self.repo]
 
     def _send(self):
-        s = smtplib.SMTP(self.ctx.getSmartHost())
-        s.sendmail(self.ctx.getMailFrom(),
-                   self.recipients, self.msg.as_string())
-        s.quit()
+        deliver(self.ctx.spool, self.ctx.getSmartHost(),
+                self.ctx.getMailFrom(), self.recipients, self.msg.as_string())
 
 class MailCache(dict):
     def __init__(self, ctx):
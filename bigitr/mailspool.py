@@ -0,0 +1,215 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Outgoing mail spool.  Messages are written to a directory and
+# delivered by a background thread that keeps one SMTP session open
+# per smarthost, so that a slow or unreachable smarthost never stalls
+# synchronization and a burst of errors does not open a connection
+# per message.
+
+import cPickle
+import os
+import smtplib
+import socket
+import threading
+import time
+
+from bigitr import util
+
+class Spool(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.failedDir = directory + '/failed'
+        for d in (self.directory, self.failedDir):
+            if not os.path.exists(d):
+                os.makedirs(d, 0700)
+        self.queued = threading.Event()
+        self.counter = 0
+
+    def add(self, smarthost, mailfrom, recipients, text):
+        'queue a message for delivery'
+        self.counter += 1
+        name = '%s/%017.6f-%d-%d' %(self.directory, time.time(),
+                                    os.getpid(), self.counter)
+        # the sender skips the .tmp file while it is being written
+        util.replaceFile(name, cPickle.dumps(
+            (smarthost, mailfrom, list(recipients), text),
+            cPickle.HIGHEST_PROTOCOL))
+        self.queued.set()
+        return name
+
+    def entries(self):
+        'return: sorted list of paths of queued messages, oldest first'
+        return sorted('/'.join((self.directory, x))
+                      for x in os.listdir(self.directory)
+                      if not x.endswith('.tmp') and x != 'failed')
+
+    @staticmethod
+    def load(path):
+        'return: (smarthost, mailfrom, recipients, text)'
+        return cPickle.load(file(path, 'rb'))
+
+    @staticmethod
+    def remove(path):
+        os.remove(path)
+
+    def fail(self, path):
+        'keep an undeliverable message for inspection'
+        os.rename(path, '/'.join((self.failedDir, os.path.basename(path))))
+
+
+class Sender(object):
+    # seconds of delay after the first failure to reach a smarthost,
+    # doubling with each further failure up to MAXDELAY
+    MINDELAY = 1
+    MAXDELAY = 600
+    # close sessions idle this long; servers time them out anyway
+    IDLE = 60
+
+    def __init__(self, spool):
+        self.spool = spool
+        # {smarthost: smtplib.SMTP, ...}
+        self.sessions = {}
+        # {smarthost: time last used, ...}
+        self.lastUsed = {}
+        # {smarthost: (time of next attempt, current delay), ...}
+        self.backoff = {}
+
+    def session(self, smarthost):
+        s = self.sessions.get(smarthost)
+        if s is None:
+            s = smtplib.SMTP(smarthost)
+            self.sessions[smarthost] = s
+        return s
+
+    def closeSession(self, smarthost):
+        s = self.sessions.pop(smarthost, None)
+        self.lastUsed.pop(smarthost, None)
+        if s is None:
+            return
+        try:
+            s.quit()
+        except (smtplib.SMTPException, socket.error):
+            s.close()
+
+    def close(self):
+        for smarthost in self.sessions.keys():
+            self.closeSession(smarthost)
+
+    def closeIdle(self, now):
+        for smarthost, lastUsed in self.lastUsed.items():
+            if now - lastUsed >= self.IDLE:
+                self.closeSession(smarthost)
+
+    def deferred(self, smarthost, now):
+        retry = self.backoff.get(smarthost)
+        return retry is not None and retry[0] > now
+
+    def delay(self, smarthost, now):
+        'back off from a smarthost that cannot currently take mail'
+        self.closeSession(smarthost)
+        retry = self.backoff.get(smarthost)
+        if retry is None:
+            delay = self.MINDELAY
+        else:
+            delay = min(retry[1] * 2, self.MAXDELAY)
+        self.backoff[smarthost] = (now + delay, delay)
+
+    def sendmail(self, smarthost, mailfrom, recipients, text):
+        try:
+            self.session(smarthost).sendmail(mailfrom, recipients, text)
+        except smtplib.SMTPServerDisconnected:
+            # the reused session timed out; try once on a new session
+            self.closeSession(smarthost)
+            self.session(smarthost).sendmail(mailfrom, recipients, text)
+
+    def deliver(self, now=None):
+        '''
+        Send every queued message whose smarthost is not backed off.
+        return: time at which deferred messages should be retried,
+        or None if nothing is deferred
+        '''
+        if now is None:
+            now = time.time()
+        for path in self.spool.entries():
+            try:
+                smarthost, mailfrom, recipients, text = self.spool.load(path)
+            except Exception:
+                self.spool.fail(path)
+                continue
+            if self.deferred(smarthost, now):
+                continue
+            try:
+                self.sendmail(smarthost, mailfrom, recipients, text)
+            except (smtplib.SMTPRecipientsRefused,
+                    smtplib.SMTPSenderRefused,
+                    smtplib.SMTPDataError), e:
+                if isinstance(e, smtplib.SMTPRecipientsRefused):
+                    codes = [x[0] for x in e.recipients.values()]
+                else:
+                    codes = [e.smtp_code]
+                if min(codes) >= 500:
+                    # permanent failure; retrying cannot help
+                    self.spool.fail(path)
+                else:
+                    self.delay(smarthost, now)
+                continue
+            except (smtplib.SMTPException, socket.error):
+                self.delay(smarthost, now)
+                continue
+            self.backoff.pop(smarthost, None)
+            self.lastUsed[smarthost] = now
+            self.spool.remove(path)
+        if self.backoff:
+            return min(x[0] for x in self.backoff.values())
+        return None
+
+
+class SenderThread(threading.Thread):
+    # seconds between scans of the spool when nothing has been queued;
+    # picks up messages left by an earlier process
+    POLL = 30
+
+    def __init__(self, spool):
+        threading.Thread.__init__(self, name='bigitr mail sender')
+        self.daemon = True
+        self.spool = spool
+        self.sender = Sender(spool)
+        self.stopping = False
+
+    def run(self):
+        while not self.stopping:
+            self.spool.queued.clear()
+            try:
+                retry = self.sender.deliver()
+            except Exception:
+                # never let an unexpected error stop delivery for good
+                retry = None
+            now = time.time()
+            self.sender.closeIdle(now)
+            timeout = self.POLL
+            if retry is not None:
+                timeout = max(0, min(timeout, retry - now))
+            if self.sender.sessions:
+                timeout = min(timeout, self.sender.IDLE)
+            self.spool.queued.wait(timeout)
+        self.sender.close()
+
+    def stop(self, timeout=None):
+        'stop after the current delivery pass; undelivered mail stays queued'
+        self.stopping = True
+        self.spool.queued.set()
+        self.join(timeout)
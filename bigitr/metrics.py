@@ -0,0 +1,176 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Runtime metrics for bigitrd, written as a file in the Prometheus text
+# exposition format for the node_exporter textfile collector (or any
+# other scraper) to pick up.
+
+import contextlib
+import time
+
+from bigitr import util
+
+@contextlib.contextmanager
+def timed(ctx, repository, phase):
+    'record the duration of a phase of work on repository, if measured'
+    m = ctx.metrics
+    if m is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        m.observe(repository, phase, time.time() - start)
+
+def copied(ctx, repository, direction, size):
+    if ctx.metrics is not None:
+        ctx.metrics.copy(repository, direction, size)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+def labels(**kw):
+    return '{%s}' %','.join('%s="%s"' %(x, escape(kw[x])) for x in sorted(kw))
+
+
+class Metrics(object):
+    # upper bounds, in seconds, of the duration histogram buckets
+    BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 14400)
+    # minimum seconds between writes of the metrics file while busy
+    INTERVAL = 15
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        # {(repository, phase): [count per bucket..., +Inf, sum], ...}
+        self.durations = {}
+        # {repository: time of the last run without errors, ...}
+        self.lastSuccess = {}
+        # {repository: consecutive runs with errors, ...}
+        self.failures = {}
+        # {repository: errors so far in the current run, ...}
+        self.errors = {}
+        # {(repository, command): times run, ...}
+        self.commands = {}
+        # {(repository, direction): bytes, ...}
+        self.copied = {}
+        self.repositories = 0
+        self.backlog = 0
+        self.written = 0
+
+    def observe(self, repository, phase, seconds):
+        h = self.durations.get((repository, phase))
+        if h is None:
+            h = [0] * (len(self.BUCKETS) + 1) + [0.0]
+            self.durations[(repository, phase)] = h
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += 1
+        h[-1] += seconds
+
+    def startRun(self, repository):
+        self.errors[repository] = 0
+
+    def error(self, repository):
+        self.errors[repository] = self.errors.get(repository, 0) + 1
+
+    def finishRun(self, repository, now=None):
+        if now is None:
+            now = time.time()
+        if self.errors.pop(repository, 0):
+            self.failures[repository] = self.failures.get(repository, 0) + 1
+        else:
+            self.failures[repository] = 0
+            self.lastSuccess[repository] = now
+
+    def command(self, repository, command):
+        key = (repository, util.commandName(command))
+        self.commands[key] = self.commands.get(key, 0) + 1
+
+    def copy(self, repository, direction, size):
+        key = (repository, direction)
+        self.copied[key] = self.copied.get(key, 0) + size
+
+    def setBacklog(self, backlog, repositories):
+        self.backlog = backlog
+        self.repositories = repositories
+
+    def forget(self, repositories):
+        'drop all metrics for repositories no longer configured'
+        repositories = set(repositories)
+        for d in (self.lastSuccess, self.failures, self.errors):
+            for repository in repositories & set(d):
+                del d[repository]
+        for d in (self.durations, self.commands, self.copied):
+            for key in [x for x in d if x[0] in repositories]:
+                del d[key]
+
+    def format(self):
+        lines = []
+        def header(name, kind, text):
+            lines.append('# HELP %s %s\n# TYPE %s %s\n' %(name, text, name, kind))
+
+        name = 'bigitr_repository_duration_seconds'
+        header(name, 'histogram', 'Time spent on a repository, by phase.')
+        for (repository, phase), h in sorted(self.durations.items()):
+            for bound, count in zip(self.BUCKETS + ('+Inf',), h[:-1]):
+                lines.append('%s_bucket%s %d\n' %(name, labels(
+                    repository=repository, phase=phase, le=bound), count))
+            l = labels(repository=repository, phase=phase)
+            lines.append('%s_sum%s %.3f\n' %(name, l, h[-1]))
+            lines.append('%s_count%s %d\n' %(name, l, h[-2]))
+
+        name = 'bigitr_repository_last_success_timestamp_seconds'
+        header(name, 'gauge', 'When a repository last ran without errors.')
+        for repository, t in sorted(self.lastSuccess.items()):
+            lines.append('%s%s %.3f\n' %(name, labels(repository=repository), t))
+
+        name = 'bigitr_repository_consecutive_failures'
+        header(name, 'gauge', 'Runs with errors since the last clean run.')
+        for repository, n in sorted(self.failures.items()):
+            lines.append('%s%s %d\n' %(name, labels(repository=repository), n))
+
+        name = 'bigitr_commands_total'
+        header(name, 'counter', 'Commands run, by program and subcommand.')
+        for (repository, command), n in sorted(self.commands.items()):
+            lines.append('%s%s %d\n' %(name, labels(
+                repository=repository, command=command), n))
+
+        name = 'bigitr_copied_bytes_total'
+        header(name, 'counter', 'Bytes of files copied between CVS and Git.')
+        for (repository, direction), n in sorted(self.copied.items()):
+            lines.append('%s%s %d\n' %(name, labels(
+                repository=repository, direction=direction), n))
+
+        name = 'bigitr_repositories'
+        header(name, 'gauge', 'Repositories configured.')
+        lines.append('%s %d\n' %(name, self.repositories))
+
+        name = 'bigitr_backlog_repositories'
+        header(name, 'gauge', 'Repositories waiting in the current pass.')
+        lines.append('%s %d\n' %(name, self.backlog))
+        return ''.join(lines)
+
+    def save(self, now=None, force=False):
+        'write the metrics file, at most every INTERVAL seconds unless forced'
+        if now is None:
+            now = time.time()
+        if not force and now - self.written < self.INTERVAL:
+            return
+        util.replaceFile(self.fileName, self.format())
+        self.written = now
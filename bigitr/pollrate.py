@@ -0,0 +1,96 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Adaptive poll intervals.  Each repository is polled at a fraction of
+# the time since a change was last seen in it, on either the Git or
+# the CVS side, within the minimum and maximum intervals: a repository
+# changed an hour ago is polled every quarter hour, one dormant for
+# months only at the maximum.  Kept across daemon restarts in a state
+# file.
+
+import time
+
+from bigitr import util
+
+def changed(ctx, repository):
+    'record that new content was seen in repository'
+    if ctx.pollrate is not None:
+        ctx.pollrate.changed(repository)
+
+
+class PollRate(object):
+    # change whenever the pickled state changes shape
+    VERSION = 2
+    # poll at this fraction of the time since the last change
+    FRACTION = 0.25
+
+    def __init__(self, minimum, maximum, stateFile=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.stateFile = stateFile
+        # {repository: time a change was last seen, or first polled}
+        self.lastChange = {}
+        # {repository: time at or after which to poll it next}
+        self.nextPoll = {}
+        self.load()
+
+    def interval(self, repository, now):
+        last = self.lastChange.get(repository)
+        if last is None:
+            return self.minimum
+        return max(self.minimum,
+                   min(self.maximum, (now - last) * self.FRACTION))
+
+    def ready(self, repository, now=None):
+        if now is None:
+            now = time.time()
+        return now >= self.nextPoll.get(repository, 0)
+
+    def changed(self, repository, now=None):
+        if now is None:
+            now = time.time()
+        self.lastChange[repository] = now
+
+    def finished(self, repository, started):
+        '''
+        schedule the next poll of repository after a poll or sync
+        started: start of the pass in which it ran, so that passes
+        starting a minimum interval apart are not skipped
+        '''
+        # a repository never seen to change is new to us, not dormant
+        self.lastChange.setdefault(repository, started)
+        self.nextPoll[repository] = started + self.interval(repository,
+                                                            started)
+
+    def forget(self, repositories):
+        'drop state for repositories no longer configured'
+        repositories = set(repositories) & set(self.nextPoll)
+        for repository in repositories:
+            self.lastChange.pop(repository, None)
+            del self.nextPoll[repository]
+        if repositories:
+            self.save()
+
+    def load(self):
+        state = util.loadState(self.stateFile, self.VERSION)
+        if (isinstance(state, tuple) and len(state) == 2 and
+            isinstance(state[0], dict) and isinstance(state[1], dict)):
+            self.lastChange, self.nextPoll = state
+
+    def save(self):
+        if self.stateFile:
+            util.saveState(self.stateFile, self.VERSION,
+                           (self.lastChange, self.nextPoll))
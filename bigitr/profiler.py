@@ -0,0 +1,158 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Per-repository, per-phase profiles.  Each phase of work on a profiled
+# repository writes a cProfile file (for pstats or any viewer that
+# reads it) and a text report of wall clock time, Python and child
+# process CPU time, the commands run with their durations, and the
+# functions with the most cumulative time.  Phases nest; time spent in
+# an inner phase is not included in the outer one.
+
+import contextlib
+import cProfile
+import os
+import pstats
+import resource
+import time
+
+from bigitr import repositorymap
+from bigitr import util
+
+@contextlib.contextmanager
+def phase(ctx, repository, phaseName):
+    'profile a phase of work on repository, if it is being profiled'
+    p = ctx.profiler
+    if p is None or not p.wanted(repository):
+        yield
+        return
+    p.start(repository, phaseName)
+    try:
+        yield
+    finally:
+        p.stop()
+
+
+class Phase(object):
+    def __init__(self, repository, phaseName):
+        self.repository = repository
+        self.name = phaseName
+        self.started = time.localtime()
+        self.profile = cProfile.Profile()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.childCpu = 0.0
+        # {command name: [count, total seconds, longest seconds], ...}
+        self.commands = {}
+        self.running = None
+
+    @staticmethod
+    def usage():
+        s = resource.getrusage(resource.RUSAGE_SELF)
+        c = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return (time.time(), s.ru_utime + s.ru_stime, c.ru_utime + c.ru_stime)
+
+    def resume(self):
+        self.running = self.usage()
+        self.profile.enable()
+
+    def pause(self):
+        self.profile.disable()
+        wall, cpu, childCpu = [y - x for x, y in
+                               zip(self.running, self.usage())]
+        self.wall += wall
+        self.cpu += cpu
+        self.childCpu += childCpu
+        self.running = None
+
+    def command(self, commandLine, seconds):
+        c = self.commands.setdefault(util.commandName(commandLine),
+                                     [0, 0.0, 0.0])
+        c[0] += 1
+        c[1] += seconds
+        c[2] = max(c[2], seconds)
+
+    def report(self, f, top):
+        f.write('repository: %s\nphase: %s\nstarted: %s\n' %(
+            self.repository, self.name,
+            time.strftime('%Y-%m-%d %H:%M:%S', self.started)))
+        f.write('wall clock seconds: %.3f\n' %self.wall)
+        f.write('python cpu seconds: %.3f\n' %self.cpu)
+        f.write('child process cpu seconds: %.3f\n' %self.childCpu)
+        if self.commands:
+            f.write('\n%7s %10s %10s  %s\n' %(
+                'count', 'seconds', 'longest', 'command'))
+            for name, (count, seconds, longest) in sorted(
+                    self.commands.items(), key=lambda x: -x[1][1]):
+                f.write('%7d %10.3f %10.3f  %s\n' %(
+                    count, seconds, longest, name))
+        f.write('\n')
+        stats = pstats.Stats(self.profile, stream=f)
+        stats.sort_stats('cumulative').print_stats(top)
+
+
+class Profiler(object):
+    # functions listed in each text report
+    TOP = 40
+
+    def __init__(self, directory, patterns=('*',)):
+        self.directory = directory
+        # repository paths or names, as shell-style patterns
+        self.patterns = patterns
+        # phases being profiled; only the innermost is enabled
+        self.stack = []
+
+    def wanted(self, repository):
+        matches = repositorymap.RepositoryConfig.matchesRepository
+        return any(matches(repository, x) for x in self.patterns)
+
+    def start(self, repository, phaseName):
+        if self.stack:
+            self.stack[-1].pause()
+        p = Phase(repository, phaseName)
+        self.stack.append(p)
+        p.resume()
+
+    def stop(self):
+        p = self.stack.pop()
+        p.pause()
+        try:
+            self.write(p)
+        finally:
+            if self.stack:
+                self.stack[-1].resume()
+
+    def command(self, repository, commandLine, seconds):
+        'count a command toward the innermost phase for repository'
+        for p in reversed(self.stack):
+            if p.repository == repository:
+                p.command(commandLine, seconds)
+                return
+
+    def write(self, p):
+        'return: base name of the .prof and .txt files written'
+        repoDir = '/'.join((self.directory,
+            repositorymap.RepositoryConfig.getRepositoryName(p.repository)))
+        if not os.path.exists(repoDir):
+            os.makedirs(repoDir)
+        baseName = '%s/%s.%s' %(
+            repoDir, time.strftime('%Y%m%d-%H:%M:%S', p.started), p.name)
+        p.profile.dump_stats(baseName + '.prof')
+        f = file(baseName + '.txt', 'w')
+        try:
+            p.report(f, self.TOP)
+        finally:
+            f.close()
+        return baseName
@@ -19,11 +19,33 @@
 # basename of git repositories must be unique
 
 import config
+import fnmatch
 import os
 import shlex
 
+class RepositorySpec(object):
+    '''
+    Configuration for one repository, compiled once from a
+    RepositoryConfig with GLOBAL fallbacks resolved and environment
+    variables expanded.  Treat as read-only; RepositoryConfig compiles
+    a new one whenever its configuration changes.
+    '''
+    __slots__ = ('cvsRoot', 'gitRef', 'cvsPath', 'skeleton', 'branchFrom',
+                 'cloneArguments', 'prefixes', 'importBranchMaps',
+                 'exportBranchMaps', 'mergeBranchMaps', 'cvsVariables',
+                 'hooks', 'email', 'deferPush', 'cvsMirror',
+                 'cvsMirrorSource')
+
+    def __init__(self, **kwargs):
+        for slot in self.__slots__:
+            setattr(self, slot, kwargs.pop(slot))
+        if kwargs:
+            raise TypeError('unexpected fields: %s' %', '.join(sorted(kwargs)))
+
+
 class RepositoryConfig(config.Config):
     def __init__(self, configFileName):
+        self.specs = {}
         config.Config.__init__(self, configFileName)
         # enforce uniqueness
         self.repos = {}
@@ -33,7 +55,107 @@ class RepositoryConfig(config.Config):
                 raise KeyError('Duplicate repository name %s: %s and %s'
                                %(name, self.repos[name], r))
             self.repos[name] = r
-        self.requireAbsolutePaths('skeleton')
+        self.requireAbsolutePaths('skeleton', 'cvsmirror')
+
+    def __getstate__(self):
+        # specs hold environment-expanded values, which must not
+        # outlive this process
+        state = self.__dict__.copy()
+        state['specs'] = {}
+        return state
+
+    def set(self, section, option, value=None):
+        config.Config.set(self, section, option, value)
+        self.invalidateSpecs(section)
+
+    def remove_option(self, section, option):
+        removed = config.Config.remove_option(self, section, option)
+        self.invalidateSpecs(section)
+        return removed
+
+    def invalidateSpecs(self, section):
+        if section == 'GLOBAL':
+            self.specs.clear()
+        else:
+            self.specs.pop(section, None)
+
+    def getSpec(self, repository):
+        spec = self.specs.get(repository)
+        if spec is None:
+            spec = self.compileSpec(repository)
+            self.specs[repository] = spec
+        return spec
+
+    def compileSpec(self, repository):
+        # one pass over the options, GLOBAL first so that the
+        # repository section overrides it
+        options = {}
+        for section in ('GLOBAL', repository):
+            if self.has_section(section):
+                for option in self.options(section):
+                    options[option] = self.get(section, option)
+        local = set()
+        if self.has_section(repository):
+            local = set(self.options(repository))
+
+        def localOptions(prefix):
+            return [(x[len(prefix):], options[x]) for x in sorted(local)
+                    if x.startswith(prefix)]
+
+        gitRef = None
+        gitroot = options.get('gitroot')
+        if gitroot is not None:
+            # this test needs to handle more cases
+            if gitroot.startswith('/') or '://' in gitroot:
+                # directory paths, http/s
+                gitRef = '/'.join((gitroot, repository))
+            else:
+                # username@host:path
+                gitRef = ':'.join((gitroot, repository))
+
+        cloneArguments = []
+        if options.get('clonefilter'):
+            cloneArguments.append('--filter=' + options['clonefilter'])
+        if options.get('cloneshallowsince'):
+            cloneArguments.append(
+                '--shallow-since=' + options['cloneshallowsince'])
+
+        email = options.get('email')
+        if email:
+            email = tuple(email.split())
+        else:
+            email = None
+
+        deferPush = options.get('deferpush', 'false').lower()
+        if deferPush not in self._boolean_states:
+            raise ValueError('"deferpush = %s": Not a boolean' %deferPush)
+
+        return RepositorySpec(
+            cvsRoot=options.get('cvsroot'),
+            gitRef=gitRef,
+            cvsPath=options.get('cvspath') if 'cvspath' in local else None,
+            skeleton=options.get('skeleton'),
+            branchFrom=options.get('branchfrom') if 'branchfrom' in local else None,
+            cloneArguments=tuple(cloneArguments),
+            prefixes=dict(localOptions('prefix.')),
+            importBranchMaps=tuple((x, 'cvs-' + y)
+                                   for x, y in localOptions('cvs.')),
+            exportBranchMaps=tuple((x, y, 'export-' + x)
+                                   for x, y in localOptions('git.')),
+            mergeBranchMaps=dict((x, frozenset(y.strip().split()))
+                                 for x, y in localOptions('merge.')),
+            cvsVariables=tuple('='.join((x[7:], options[x]))
+                               for x in sorted(options)
+                               if x.startswith('cvsvar.')),
+            hooks=dict((x, tuple(shlex.split(y)))
+                       for x, y in options.items()
+                       if (x.startswith('prehook.') or
+                           x.startswith('posthook.')) and y),
+            email=email,
+            deferPush=self._boolean_states[deferPush],
+            cvsMirror=options.get('cvsmirror'),
+            cvsMirrorSource=options.get('cvsmirrorsource'),
+        )
 
     def getRepositories(self):
         return set(self.sections()) - set(('GLOBAL',))
@@ -42,87 +164,94 @@ class RepositoryConfig(config.Config):
     def getRepositoryName(repository):
         return os.path.basename(repository)
 
+    @staticmethod
+    def matchesRepository(repository, pattern):
+        'pattern matches the repository path or its name'
+        name = RepositoryConfig.getRepositoryName(repository)
+        return (fnmatch.fnmatchcase(repository, pattern) or
+                fnmatch.fnmatchcase(name, pattern))
+
     def getRepositoryByName(self, repositoryName):
         if self.has_section(repositoryName):
             return repositoryName
         return self.repos[repositoryName]
 
     def getCVSRoot(self, repository):
-        return self.getGlobalFallback(repository, 'cvsroot')
+        cvsRoot = self.getSpec(repository).cvsRoot
+        if cvsRoot is None:
+            # raise contextually meaningful NoOptionError
+            return self.getGlobalFallback(repository, 'cvsroot')
+        return cvsRoot
 
     def getGitRef(self, repository):
-        gitroot = self.getGlobalFallback(repository, 'gitroot')
-        # this test needs to handle more cases
-        if gitroot.startswith('/') or '://' in gitroot:
-            # directory paths, http/s
-            return '/'.join((gitroot, repository))
-        # username@host:path
-        return ':'.join((gitroot, repository))
+        gitRef = self.getSpec(repository).gitRef
+        if gitRef is None:
+            # raise contextually meaningful NoOptionError
+            return self.getGlobalFallback(repository, 'gitroot')
+        return gitRef
+
+    def getCloneArguments(self, repository):
+        'return: ["--filter=<filter>", "--shallow-since=<date>"]'
+        return list(self.getSpec(repository).cloneArguments)
+
+    def getCVSMirror(self, repository):
+        'local directory mirroring the CVS repository for reading, or None'
+        return self.getSpec(repository).cvsMirror
+
+    def getCVSMirrorSource(self, repository):
+        'rsync source for the CVS repository that cvsmirror mirrors'
+        source = self.getSpec(repository).cvsMirrorSource
+        if source is None:
+            # raise contextually meaningful NoOptionError
+            return self.getGlobalFallback(repository, 'cvsmirrorsource')
+        return source
 
     def getCVSPath(self, repository):
-        return self.get(repository, 'cvspath')
+        cvsPath = self.getSpec(repository).cvsPath
+        if cvsPath is None:
+            # raise contextually meaningful NoOptionError
+            return self.get(repository, 'cvspath')
+        return cvsPath
 
     def getSkeleton(self, repository):
-        return self.getGlobalFallback(repository, 'skeleton', error=False)
+        return self.getSpec(repository).skeleton
 
     def getBranchFrom(self, repository):
-        return self.getOptional(repository, 'branchfrom')
+        return self.getSpec(repository).branchFrom
 
     def getBranchPrefix(self, repository, branch):
-        optname = 'prefix.'+branch
-        return self.getOptional(repository, optname)
+        return self.getSpec(repository).prefixes.get(branch)
+
+    def getDeferPush(self, repository):
+        'push the branches updated in a run together, at its end'
+        return self.getSpec(repository).deferPush
 
     def getImportBranchMaps(self, repository):
         'return: [(cvsbranch, gitbranch), ...]'
-        return [(x[4:], 'cvs-' + self.get(repository, x))
-                 for x in sorted(self.options(repository))
-                 if x.startswith('cvs.')]
+        return list(self.getSpec(repository).importBranchMaps)
 
     def getCVSVariables(self, repository):
         'return: ["VARIABLE=value", ...]'
-        return ['='.join((x[7:], '' + self.getGlobalFallback(repository, x)))
-                for x in sorted(set(self.options(repository) +
-                                    self.options('GLOBAL')))
-                if x.startswith('cvsvar.')]
+        return list(self.getSpec(repository).cvsVariables)
 
     def getExportBranchMaps(self, repository):
         'return: [(gitbranch, cvsbranch, exportbranch), ...]'
-        return [(x[4:], self.get(repository, x), 'export-' + x[4:])
-                 for x in sorted(self.options(repository))
-                 if x.startswith('git.')]
+        return list(self.getSpec(repository).exportBranchMaps)
 
     def getMergeBranchMaps(self, repository):
         'return: {sourcebranch, set(targetbranch, targetbranch, ...), ...}'
-        return dict((x[6:], set(self.get(repository, x).strip().split()))
-                    for x in sorted(self.options(repository))
-                    if x.startswith('merge.'))
-
-    def getHook(self, type, when, repository):
-        return self.getGlobalFallback(repository, when+'hook.'+type, error=False)
+        return dict((x, set(y)) for x, y in
+                    self.getSpec(repository).mergeBranchMaps.items())
 
-    def getHookDir(self, direction, type, when, repository):
+    def getHooksBranch(self, type, direction, when, repository, branch):
+        hooks = self.getSpec(repository).hooks
+        names = [when+'hook.'+type]
         if direction:
-            return self.getGlobalFallback(repository, when+'hook.'+direction+'.'+type,
-                                   error=False)
-        return None
-
-    def getHookBranch(self, type, when, repository, branch):
-        return self.getGlobalFallback(repository, when+'hook.'+type+'.'+branch,
-                               error=False)
-
-    def getHookDirBranch(self, direction, type, when, repository, branch):
+            names.append(when+'hook.'+direction+'.'+type)
+        names.append(when+'hook.'+type+'.'+branch)
         if direction:
-            return self.getGlobalFallback(repository, when+'hook.'+direction+'.'+type+'.'+branch,
-                                   error=False)
-        return None
-
-    def getHooksBranch(self, type, direction, when, repository, branch):
-        return [shlex.split(x) for x in
-                (self.getHook(type, when, repository),
-                 self.getHookDir(direction, type, when, repository),
-                 self.getHookBranch(type, when, repository, branch),
-                 self.getHookDirBranch(direction, type, when, repository, branch))
-                if x]
+            names.append(when+'hook.'+direction+'.'+type+'.'+branch)
+        return [list(hooks[x]) for x in names if x in hooks]
 
     def getGitImpPreHooks(self, repository, branch):
         return self.getHooksBranch('git', 'imp', 'pre', repository, branch)
@@ -143,9 +272,9 @@ class RepositoryConfig(config.Config):
         return self.getHooksBranch('cvs', None, 'post', repository, branch)
 
     def getEmail(self, repository):
-        email = self.getGlobalFallback(repository, 'email', error=False)
+        email = self.getSpec(repository).email
         if email:
-            return email.split()
+            return list(email)
         return None
 
     def addEmail(self, repository, addresses):
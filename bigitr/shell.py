@@ -14,8 +14,10 @@
 #  limitations under the License.
 #
 
+import errno
 import logging
 import os
+import select
 import subprocess
 import time
 
@@ -29,15 +31,22 @@ class LoggingShell(subprocess.Popen):
     def __init__(self, log, *args, **kwargs):
         self.log = log
         self.error = kwargs.pop('error', True)
-        kwargs.setdefault('stderr', log.stderr)
-        kwargs.setdefault('stdout', log.stdout)
+        # {name: log writer} for streams that pump() copies into the log
+        self.logStreams = {}
+        self.pumped = None
+        for name, writer in (('stdout', log.writeOutput),
+                             ('stderr', log.writeError)):
+            if name not in kwargs:
+                kwargs[name] = subprocess.PIPE
+                self.logStreams[name] = writer
         ts = self.timestamp()
         cmd = ' '.join(args)
         start = ' '.join((ts, 'START:', cmd, '\n'))
-        os.write(log.stderr, start)
-        os.write(log.stdout, start)
-        self.log.markStart()
+        log.writeError(start)
+        log.writeOutput(start)
+        self.log.markStart(cmd)
         self.p = subprocess.Popen.__init__(self, args, **kwargs)
+        self.log.markRunning(self.pid)
 
     def timestamp(self):
         now = time.time()
@@ -47,13 +56,58 @@ class LoggingShell(subprocess.Popen):
         return time.strftime('[%a %b %d %H:%m:%S.'
                              + frac[2:] + ' ' + tzname + ' %Y]')
 
+    def pump(self):
+        '''
+        Copy piped child output into the log until the child closes
+        its end of every pipe.
+        return: {name: output} for streams piped to the caller instead
+        '''
+        if self.pumped is not None:
+            return self.pumped
+        readers = {}
+        output = {}
+        for name in ('stdout', 'stderr'):
+            pipe = getattr(self, name)
+            if pipe is None:
+                continue
+            if name in self.logStreams:
+                writer = self.logStreams[name]
+            else:
+                output[name] = []
+                writer = output[name].append
+            readers[pipe.fileno()] = (pipe, writer)
+        while readers:
+            try:
+                ready, _, _ = select.select(list(readers), [], [])
+                for fd in ready:
+                    data = os.read(fd, 65536)
+                    if data:
+                        readers[fd][1](data)
+                    else:
+                        readers.pop(fd)[0].close()
+            except (select.error, OSError), e:
+                # the daemon handles SIGCHLD
+                if e.args[0] != errno.EINTR:
+                    raise
+        self.pumped = dict((x, ''.join(y)) for x, y in output.items())
+        return self.pumped
+
+    def communicate(self, input=None):
+        if not self.logStreams:
+            return subprocess.Popen.communicate(self, input)
+        output = self.pump()
+        self.wait()
+        return output.get('stdout'), output.get('stderr')
+
     def finish(self):
+        if self.logStreams:
+            self.pump()
         retcode = subprocess.Popen.wait(self)
-        self.log.markStop()
+        self.log.markStop(retcode)
         ts = self.timestamp()
         finish = '%s COMPLETE with return code: %d\n' %(ts, retcode)
-        os.write(self.log.stderr, finish)
-        os.write(self.log.stdout, finish)
+        self.log.writeError(finish)
+        self.log.writeOutput(finish)
         if retcode and self.error:
             for line in self.log.lastError().split('\n'):
                 logging.error(line)
@@ -0,0 +1,184 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Live status of bigitrd as a JSON file: what the daemon is doing and,
+# for each active job, the repository, branch, phase, current command,
+# elapsed time and process ID.  Read by `bigitr status`.
+
+import contextlib
+import json
+import os
+import time
+
+from bigitr import util
+
+VERSION = 1
+
+@contextlib.contextmanager
+def phase(ctx, repository, phaseName, branch=None):
+    'report phaseName (and branch, if given) for repository while inside'
+    s = ctx.status
+    if s is None:
+        yield
+        return
+    previous = s.setPhase(repository, phaseName, branch)
+    try:
+        yield
+    finally:
+        s.restorePhase(repository, previous)
+
+def command(ctx, repository, commandLine, pid):
+    if ctx.status is not None:
+        ctx.status.setCommand(repository, commandLine, pid)
+
+
+class Status(object):
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.state = 'starting'
+        self.stateStarted = self.started
+        self.wake = None
+        # {repository: {field: value, ...}, ...}
+        self.jobs = {}
+
+    def setState(self, state, duration=None):
+        'what the daemon as a whole is doing (sync, poll, sleep) and how long'
+        self.state = state
+        self.stateStarted = time.time()
+        self.wake = None
+        if duration is not None:
+            self.wake = self.stateStarted + duration
+        self.save()
+
+    def job(self, repository):
+        job = self.jobs.get(repository)
+        if job is None:
+            now = time.time()
+            job = {'repository': repository, 'branch': None, 'phase': None,
+                   'phaseStarted': now, 'started': now, 'command': None,
+                   'commandStarted': None, 'pid': self.pid}
+            self.jobs[repository] = job
+        return job
+
+    def startJob(self, repository):
+        self.jobs.pop(repository, None)
+        self.job(repository)
+        self.save()
+
+    def finishJob(self, repository):
+        self.jobs.pop(repository, None)
+        self.save()
+
+    def setPhase(self, repository, phaseName, branch=None):
+        'return: previous (phase, branch, phaseStarted) for restorePhase'
+        job = self.job(repository)
+        previous = (job['phase'], job['branch'], job['phaseStarted'])
+        job['phase'] = phaseName
+        if branch is not None:
+            job['branch'] = branch
+        job['phaseStarted'] = time.time()
+        self.save()
+        return previous
+
+    def restorePhase(self, repository, previous):
+        job = self.jobs.get(repository)
+        if job is None:
+            return
+        job['phase'], job['branch'], job['phaseStarted'] = previous
+        self.save()
+
+    def setCommand(self, repository, commandLine, pid):
+        'commandLine and pid are None when the command has finished'
+        job = self.job(repository)
+        job['command'] = commandLine
+        job['commandStarted'] = commandLine and time.time() or None
+        job['pid'] = pid or self.pid
+        self.save()
+
+    def asDict(self):
+        return {'version': VERSION, 'pid': self.pid,
+                'started': self.started, 'updated': time.time(),
+                'state': self.state, 'stateStarted': self.stateStarted,
+                'wake': self.wake,
+                'jobs': [self.jobs[x] for x in sorted(self.jobs)]}
+
+    def save(self):
+        try:
+            util.replaceFile(self.fileName, json.dumps(self.asDict()))
+        except EnvironmentError:
+            # status is advisory; failing to write it must not stop work
+            pass
+
+    def remove(self):
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+
+def read(fileName):
+    'return: status dictionary, or None if bigitrd has written none'
+    if not os.path.exists(fileName):
+        return None
+    return json.load(file(fileName))
+
+def elapsed(seconds):
+    seconds = max(0, int(seconds))
+    h, m, s = seconds // 3600, seconds // 60 % 60, seconds % 60
+    if h:
+        return '%dh%02dm%02ds' %(h, m, s)
+    if m:
+        return '%dm%02ds' %(m, s)
+    return '%ds' %s
+
+def format(status, now=None):
+    if now is None:
+        now = time.time()
+    lines = ['bigitrd pid %d: %s for %s' %(
+        status['pid'], status['state'],
+        elapsed(now - status['stateStarted']))]
+    if status['wake']:
+        lines[0] += ', next pass in %s' %elapsed(status['wake'] - now)
+    if not util.kill(status['pid'], 0):
+        lines.append('(not running; status last updated %s ago)'
+                     %elapsed(now - status['updated']))
+    rows = [('REPOSITORY', 'BRANCH', 'PHASE', 'ELAPSED', 'PID', 'COMMAND')]
+    for job in status['jobs']:
+        phaseName = job['phase'] or '-'
+        if job['phase']:
+            phaseName += ' ' + elapsed(now - job['phaseStarted'])
+        commandLine = job['command'] or '-'
+        if job['command']:
+            commandLine = '%s (%s)' %(
+                commandLine, elapsed(now - job['commandStarted']))
+        rows.append((job['repository'], job['branch'] or '-', phaseName,
+                     elapsed(now - job['started']), str(job['pid']),
+                     commandLine))
+    if len(rows) > 1:
+        widths = [max(len(x[i]) for x in rows) for i in range(5)]
+        for row in rows:
+            lines.append('  '.join(
+                [x.ljust(w) for x, w in zip(row, widths)] + [row[5]]).rstrip())
+    return '\n'.join(lines) + '\n'
+
+def main(fileName, out):
+    'write the status of bigitrd to out; return: exit code'
+    status = read(fileName)
+    if status is None:
+        out.write('bigitrd is not running: no status in %s\n' %fileName)
+        return 1
+    out.write(format(status))
+    return 0
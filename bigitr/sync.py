@@ -22,6 +22,8 @@ from bigitr import cvsimport
 from bigitr import errhandler
 from bigitr import gitexport
 from bigitr import git
+from bigitr import metrics
+from bigitr import profiler
 from bigitr import shell
 
 class Synchronizer(object):
@@ -36,17 +38,26 @@ class Synchronizer(object):
             Git = git.Git(self.ctx, repository)
             try:
                 self.synchronize(repository, Git)
+                Git.pushDeferred()
             except shell.ErrorExitCode, e:
                 # report errors from commands that fail
                 Git.log.mailLastOutput(str(e))
                 self.err.report(repository)
+                Git.pushDeferredAfterError(self.err)
             except:
                 # report and keep going; no reason for one
                 # repository to keep other repositories from synchronizing
                 self.err.report(repository)
+                Git.pushDeferredAfterError(self.err)
 
     def synchronize(self, repository, Git):
         if self.ctx.getExportPreImport():
+            with metrics.timed(self.ctx, repository, 'preimport'), \
+                 profiler.phase(self.ctx, repository, 'preimport'):
+                self.imp.importBranches(repository, Git)
+        with metrics.timed(self.ctx, repository, 'export'), \
+             profiler.phase(self.ctx, repository, 'export'):
+            self.exp.exportBranches(repository, Git)
+        with metrics.timed(self.ctx, repository, 'import'), \
+             profiler.phase(self.ctx, repository, 'import'):
             self.imp.importBranches(repository, Git)
-        self.exp.exportBranches(repository, Git)
-        self.imp.importBranches(repository, Git)
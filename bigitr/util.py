@@ -14,24 +14,38 @@
 #  limitations under the License.
 #
 
+import cPickle
 import os
 
-def listFiles(path):
+def listFiles(path, prune=None):
+    '''
+    return: names of all files below path, relative to path, not
+    descending into directories for whose relative names prune
+    returns True
+    '''
     allfiles = []
     dirlen = len(path) + 1
     for root, dirs, files in os.walk(path):
         allfiles.extend(['/'.join((root, x))[dirlen:] for x in files])
+        if prune is not None:
+            dirs[:] = [x for x in dirs
+                       if not prune('/'.join((root, x))[dirlen:])]
     return allfiles
 
 def copyFiles(sourceDir, baseDir, fileNames):
+    'return: number of bytes copied'
+    size = 0
     for fileName in fileNames:
         sourceFile = '/'.join((sourceDir, fileName))
         targetFile = '/'.join((baseDir, fileName))
         targetDir = os.path.dirname(targetFile)
         if not os.path.exists(targetDir):
             os.makedirs(targetDir)
-        file(targetFile, 'w').write(file(sourceFile).read())
+        data = file(sourceFile).read()
+        file(targetFile, 'w').write(data)
         os.chmod(targetFile, os.stat(sourceFile).st_mode)
+        size += len(data)
+    return size
 
 def removeRecursive(dir):
     for b, dirs, files in os.walk(dir, topdown=False):
@@ -56,6 +70,22 @@ def saveDir(fn):
 def fileName(name):
     return os.path.abspath(os.path.expandvars(os.path.expanduser(name)))
 
+def commandName(command):
+    'return: program and subcommand of a command line, e.g. "cvs export"'
+    words = command.split()
+    if not words:
+        return ''
+    name = [os.path.basename(words[0])]
+    for word in words[1:]:
+        # the first plain lower-case word names what the program was
+        # asked to do; this skips options and their values such as
+        # CVSROOT specifications
+        if word[0].isalpha() and word.islower() and (
+                word.replace('-', '').isalpha()):
+            name.append(word)
+            break
+    return ' '.join(name)
+
 def kill(pid, sig):
     # convert exception into True/False
     try:
@@ -63,3 +93,37 @@ def kill(pid, sig):
         return True
     except OSError:
         return False
+
+def loadState(fileName, version):
+    '''
+    return: the data written by saveState with the same version, or
+    None; a missing, damaged or older state file costs only what it
+    recorded, never the caller
+    '''
+    if not fileName or not os.path.exists(fileName):
+        return None
+    try:
+        savedVersion, data = cPickle.load(file(fileName, 'rb'))
+    except Exception:
+        return None
+    if savedVersion != version:
+        return None
+    return data
+
+def saveState(fileName, version, data):
+    'pickle data with version, replacing fileName only when complete'
+    replaceFile(fileName,
+                cPickle.dumps((version, data), cPickle.HIGHEST_PROTOCOL))
+
+def replaceFile(fileName, data):
+    '''
+    write data to fileName through a temporary file renamed into place,
+    so that readers never see a partial file
+    '''
+    tmpName = fileName + '.tmp'
+    f = file(tmpName, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    os.rename(tmpName, fileName)
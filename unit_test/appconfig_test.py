@@ -75,6 +75,34 @@ cvsdir = /path/to/directory/for/cvs/checkouts/for/branch/imports
         self.assertEqual(self.cfgdef.getMailFrom(),
             None)
 
+    def test_getCompressLevel(self):
+        self.assertEqual(self.cfgdef.getCompressLevel(), 6)
+        self.cfgdef.set('global', 'compresslevel', '1')
+        self.assertEqual(self.cfgdef.getCompressLevel(), 1)
+        self.cfgdef.set('global', 'compresslevel', '10')
+        self.assertRaises(ValueError, self.cfgdef.getCompressLevel)
+
+    def test_getMailMaxBytes(self):
+        self.assertEqual(self.cfgdef.getMailMaxBytes(), 1024 * 1024)
+        self.cfgdef.set('global', 'mailmaxbytes', '64k')
+        self.assertEqual(self.cfgdef.getMailMaxBytes(), 65536)
+        self.cfgdef.set('global', 'mailmaxbytes', '1')
+        self.assertRaises(ValueError, self.cfgdef.getMailMaxBytes)
+
+    def test_getLogRetention(self):
+        self.assertEqual(self.cfgdef.getLogMaxAge(), None)
+        self.assertEqual(self.cfgdef.getLogMaxRuns(), None)
+        self.assertEqual(self.cfgdef.getLogMaxBytes(), None)
+        self.assertEqual(self.cfgdef.getLogArchive(), False)
+        self.cfgdef.set('global', 'logmaxage', '2h')
+        self.cfgdef.set('global', 'logmaxruns', '100')
+        self.cfgdef.set('global', 'logmaxbytes', '10m')
+        self.cfgdef.set('global', 'logarchive', 'true')
+        self.assertEqual(self.cfgdef.getLogMaxAge(), 7200)
+        self.assertEqual(self.cfgdef.getLogMaxRuns(), 100)
+        self.assertEqual(self.cfgdef.getLogMaxBytes(), 10 * 1024 * 1024)
+        self.assertEqual(self.cfgdef.getLogArchive(), True)
+
     def test_getSmartHost(self):
         self.assertEqual(self.cfg.getSmartHost(),
             'smtp.smarthost.name')
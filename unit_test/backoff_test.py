@@ -0,0 +1,114 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+import tempfile
+
+import testutils
+
+from bigitr import backoff
+
+class TestFunctions(testutils.TestCase):
+    def test_noBackoff(self):
+        ctx = mock.Mock()
+        ctx.backoff = None
+        self.assertTrue(backoff.ready(ctx, 'repo'))
+        backoff.failed(ctx, 'repo', 'import', 'b1')
+        backoff.succeeded(ctx, 'repo', 'import', 'b1')
+
+    def test_helpers(self):
+        ctx = mock.Mock()
+        ctx.backoff.ready.return_value = False
+        self.assertFalse(backoff.ready(ctx, 'repo', 'export', 'master'))
+        ctx.backoff.ready.assert_called_once_with(('repo', 'export', 'master'))
+        backoff.failed(ctx, 'repo')
+        ctx.backoff.failed.assert_called_once_with(('repo', None, None))
+        backoff.succeeded(ctx, 'repo', 'merge', 'cvs-b1')
+        ctx.backoff.succeeded.assert_called_once_with(
+            ('repo', 'merge', 'cvs-b1'))
+
+
+class TestBackoff(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.stateFile = self.dir + '/state'
+        self.b = backoff.Backoff(60, 1000, self.stateFile)
+        self.key = ('path/repo', 'import', 'b1')
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def test_exponential(self):
+        self.assertTrue(self.b.ready(self.key, now=0))
+        for count, delay in ((1, 60), (2, 120), (3, 240), (4, 480),
+                             (5, 960), (6, 1000), (100, 1000)):
+            self.b.failures[self.key] = (count - 1, 0)
+            self.b.failed(self.key, now=10)
+            self.assertEqual(self.b.failures[self.key], (count, 10 + delay))
+            self.assertFalse(self.b.ready(self.key, now=9 + delay))
+            self.assertTrue(self.b.ready(self.key, now=10 + delay))
+        # other branches are not affected
+        self.assertTrue(self.b.ready(('path/repo', 'import', 'b2'), now=10))
+        self.b.succeeded(self.key)
+        self.assertTrue(self.b.ready(self.key, now=10))
+        self.b.failed(self.key, now=10)
+        self.assertEqual(self.b.failures[self.key], (1, 70))
+
+    def test_retry(self):
+        other = ('other/two', None, None)
+        self.b.failed(self.key, now=0)
+        self.b.failed(other, now=0)
+        self.b.retry('nomatch')
+        self.assertEqual(len(self.b.failures), 2)
+        self.b.retry('repo')
+        self.assertEqual(self.b.failures.keys(), [other])
+        self.b.retry()
+        self.assertEqual(self.b.failures, {})
+
+    def test_forget(self):
+        self.b.failed(self.key, now=0)
+        self.b.failed(('other/two', None, None), now=0)
+        self.b.forget(['path/repo'])
+        self.assertEqual(self.b.failures.keys(), [('other/two', None, None)])
+
+    def test_statePersisted(self):
+        self.b.failed(self.key, now=0)
+        self.assertFalse(os.path.exists(self.stateFile + '.tmp'))
+        b = backoff.Backoff(60, 1000, self.stateFile)
+        self.assertEqual(b.failures, {self.key: (1, 60)})
+        b.succeeded(self.key)
+        self.assertEqual(backoff.Backoff(60, 1000, self.stateFile).failures,
+                         {})
+
+    def test_loadDamaged(self):
+        file(self.stateFile, 'w').write('garbage')
+        self.assertEqual(backoff.Backoff(60, 1000, self.stateFile).failures,
+                         {})
+
+    def test_noStateFile(self):
+        b = backoff.Backoff(60, 1000)
+        b.failed(self.key, now=0)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_retryRequests(self):
+        requestFile = self.dir + '/pid.retry'
+        self.assertEqual(backoff.readRetryRequests(requestFile), [])
+        backoff.requestRetry(requestFile, ['one', 'path/two'])
+        backoff.requestRetry(requestFile, [])
+        self.assertEqual(backoff.readRetryRequests(requestFile),
+                         ['one', 'path/two', '*'])
+        self.assertEqual(os.listdir(self.dir), [])
@@ -16,6 +16,9 @@
 
 import mock
 import os
+import subprocess
+import sys
+import tempfile
 from cStringIO import StringIO
 
 import testutils
@@ -120,7 +123,7 @@ class TestRunner(testutils.TestCase):
                 mock.call('repo2'),
                 mock.call('repo::3')])
 
-    def runProcessWithSideEffect(self, side_effect=None):
+    def runProcessWithSideEffect(self, side_effect=None, pushError=None):
         with mock.patch('bigitr.git.Git') as G:
             with mock.patch('bigitr._Runner.__init__') as I:
                 I.return_value = None
@@ -128,11 +131,13 @@ class TestRunner(testutils.TestCase):
                     R.return_value = [['repo', None]]
                     r = bigitr._Runner(mock.Mock(), mock.Mock(), mock.Mock())
                     r.ctx = mock.Mock()
+                    self.ctx = r.ctx
                     r.runner = mock.Mock()
                     r.do = mock.Mock()
                     g = G(r.ctx, 'repo')
                     if side_effect is not None:
                         r.do.side_effect = side_effect
+                    g.pushDeferred.side_effect = pushError
                     r.process()
                     r.do.assert_called_once_with('repo', g, requestedBranch=None)
                     return r.runner, g
@@ -142,6 +147,9 @@ class TestRunner(testutils.TestCase):
         c, g = self.runProcessWithSideEffect()
         c.err.report.assert_not_called()
         g.log.mailLastOutput.assert_not_called()
+        self.ctx.backoff.succeeded.assert_called_once_with(('repo', None, None))
+        self.ctx.backoff.failed.assert_not_called()
+        g.pushDeferred.assert_called_once_with()
 
     @mock.patch('bigitr._Runner._init_runner')
     def test_processShellError(self, IR):
@@ -157,6 +165,41 @@ class TestRunner(testutils.TestCase):
         c, g = self.runProcessWithSideEffect(lambda *x, **z: {}[1])
         c.err.report.assert_called_once_with('repo')
         g.log.mailLastOutput.assert_not_called()
+        self.ctx.backoff.failed.assert_called_once_with(('repo', None, None))
+        # branches updated before the failure are still pushed
+        g.pushDeferred.assert_not_called()
+        g.pushDeferredAfterError.assert_called_once_with(c.err)
+
+    @mock.patch('bigitr._Runner._init_runner')
+    def test_processPushAfterShellError(self, IR):
+        def raiseShellError():
+            raise shell.ErrorExitCode(1)
+        c, g = self.runProcessWithSideEffect(lambda *x, **z: raiseShellError())
+        g.log.mailLastOutput.assert_called_once_with(mock.ANY)
+        c.err.report.assert_called_once_with('repo')
+        g.pushDeferredAfterError.assert_called_once_with(c.err)
+
+    @mock.patch('bigitr._Runner._init_runner')
+    def test_processPushError(self, IR):
+        c, g = self.runProcessWithSideEffect(pushError=RuntimeError)
+        c.err.report.assert_called_once_with('repo')
+        # finds nothing left to push
+        g.pushDeferredAfterError.assert_called_once_with(c.err)
+        self.ctx.backoff.succeeded.assert_not_called()
+        self.ctx.backoff.failed.assert_called_once_with(('repo', None, None))
+
+    @mock.patch('bigitr._Runner.getBranchMaps')
+    @mock.patch('bigitr._Runner.__init__')
+    def test_processBackoff(self, I, R):
+        I.return_value = None
+        R.return_value = [['repo', None]]
+        r = bigitr._Runner(mock.Mock(), mock.Mock(), mock.Mock())
+        r.ctx = mock.Mock()
+        r.ctx.backoff.ready.return_value = False
+        r.do = mock.Mock()
+        r.process()
+        r.ctx.backoff.ready.assert_called_once_with(('repo', None, None))
+        r.do.assert_not_called()
 
 
     @mock.patch('bigitr._Runner.getContext')
@@ -168,6 +211,41 @@ class TestRunner(testutils.TestCase):
         r.close()
         l.close.assert_called_once_with()
 
+    def test_lazyImports(self):
+        # a fresh interpreter, since this one has imported everything
+        p = subprocess.Popen([sys.executable, '-c',
+            'import sys, bigitr; print " ".join(sys.modules)'],
+            stdout=subprocess.PIPE)
+        modules = set(p.communicate()[0].split())
+        for m in ('ConfigParser', 'email', 'smtplib', 'gzip',
+                  'bigitr.context', 'bigitr.git', 'bigitr.shell'):
+            self.assertFalse(m in modules, m)
+
+    def test_lazyImportsAfterChdir(self):
+        # as in make story: a relative PYTHONPATH, and bigitr run from
+        # another directory, where the subsystems are imported
+        d = tempfile.mkdtemp(suffix='.bigitr')
+        try:
+            file(d + '/app', 'w').write('[global]\n'
+                                        'logdir = %s/log\n'
+                                        'gitdir = %s/git\n'
+                                        '[import]\n'
+                                        '[export]\n' %(d, d))
+            file(d + '/repo', 'w').write('[GLOBAL]\n')
+            env = dict(os.environ)
+            env['PYTHONPATH'] = '.'
+            top = os.path.dirname(os.path.dirname(
+                os.path.abspath(bigitr.__file__)))
+            p = subprocess.Popen([sys.executable, '-c',
+                'import os, sys, bigitr\n'
+                'os.chdir(sys.argv[1])\n'
+                'bigitr.main(["sync", "-a", "app", "-c", "repo"])\n', d],
+                cwd=top, env=env, stderr=subprocess.PIPE)
+            stderr = p.communicate()[1]
+            self.assertEqual(p.returncode, 0, stderr)
+        finally:
+            self.removeRecursive(d)
+
 
 @mock.patch('bigitr.sync.Synchronizer')
 @mock.patch('bigitr._Runner.__init__')
@@ -283,6 +361,7 @@ class TestSynchronize(testutils.TestCase):
         G().fetch.assert_called_once_with()
         S.assert_called_once_with(s.ctx)
         S().synchronize.assert_called_once_with(mock.ANY, mock.ANY)
+        s.ctx.pollrate.changed.assert_called_once_with('foo')
         s.close.assert_called_once_with()
 
 
@@ -397,3 +476,19 @@ class TestMain(testutils.TestCase):
             M.reset_mock()
             self.assertRaises(SystemExit, bigitr.main, ['merge', 'r1::branch'])
             M('r1::branch').run.assert_called_once_with()
+
+    def test_profileOption(self):
+        with mock.patch('bigitr.Export') as E:
+            E().ctx.profiler = None
+            self.assertRaises(SystemExit, bigitr.main,
+                              ['--profile', '/prof', 'export', 'r1'])
+            self.assertEqual(E().ctx.profiler.directory, '/prof')
+            self.assertEqual(E().ctx.profiler.patterns, ('*',))
+
+    def test_statusCommand(self):
+        with mock.patch('bigitr.status.main') as S:
+            S.return_value = 1
+            with self.assertRaises(SystemExit) as e:
+                bigitr.main(['status', '--status-file', '/b-s'])
+            self.assertEqual(e.exception.code, 1)
+            S.assert_called_once_with('/b-s', sys.stdout)
@@ -23,7 +23,10 @@ import tempfile
 
 import testutils
 
+from bigitr import backoff
 from bigitr import bigitrdaemon
+from bigitr import pollrate
+from bigitr import status
 from bigitr import Synchronize
 
 
@@ -74,12 +77,11 @@ repoconfig = ${DDIR}/bar
     @mock.patch('bigitr.progress.Progress')
     @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
     def test_initDetach(self, cC, P):
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, True, '${DDIR}/pid')
+        d = bigitrdaemon.Daemon(self.daemonConfig, True, '${DDIR}/pid')
         self.assertFalse(os.path.exists(self.pidFile))
-        self.assertEquals(d.execPath, '/foo')
         self.assertEquals(d.config, self.daemonConfig)
         self.assertEquals(d.pidfile, self.pidFile)
-        self.assertFalse(d.restart)
+        self.assertFalse(d.reload)
         self.assertFalse(d.stop)
         cC.assert_called_once_with(True)
         P.assert_called_once_with(outFile=None)
@@ -87,12 +89,11 @@ repoconfig = ${DDIR}/bar
     @mock.patch('bigitr.progress.Progress')
     @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
     def test_initNoDetach(self, cC, P):
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, '${DDIR}/pid')
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, '${DDIR}/pid')
         self.assertFalse(os.path.exists(self.pidFile))
-        self.assertEquals(d.execPath, '/foo')
         self.assertEquals(d.config, self.daemonConfig)
         self.assertEquals(d.pidfile, self.pidFile)
-        self.assertFalse(d.restart)
+        self.assertFalse(d.reload)
         self.assertFalse(d.stop)
         cC.assert_called_once_with(False)
         P.assert_called_once_with()
@@ -105,7 +106,7 @@ repoconfig = ${DDIR}/bar
         set_signal_handlers=mock.DEFAULT
         )
     def test_Context(self, **patches):
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         self.assertFalse(os.path.exists(self.pidFile))
         self.assertFalse(d.context.pidfile.is_locked())
         with d.context:
@@ -121,15 +122,44 @@ repoconfig = ${DDIR}/bar
 
     @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
     def test_createSynchronizers(self, cC):
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
-        self.assertEqual(len(d.synchronizers), 4)
-        for s in d.synchronizers:
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(d.repositories, [
+            (self.dir + '/app2', self.dir + '/bar', 'bar'),
+            (self.dir + '/app1', self.dir + '/foo1.1', 'foo1.1'),
+            (self.dir + '/app1', self.dir + '/foo1.2', 'foo1.2'),
+            (self.dir + '/app1', self.dir + '/foo2.1', 'foo2.1'),
+        ])
+        # created lazily
+        self.assertEqual(d.synchronizers, {})
+        for key in d.repositories:
+            s = d.getSynchronizer(key)
+            self.assertTrue(s is d.getSynchronizer(key))
             self.assertTrue(isinstance(s, Synchronize))
             self.assertTrue(isinstance(s.repos, list))
+            self.assertEqual(s.repos, [key[2]])
             for repo in s.ctx.getRepositories():
                 email = s.ctx.getEmail(repo)
                 if email is not None:
                     self.assertFalse('a@b' in email)
+        self.assertEqual(len(d.synchronizers), 4)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_createSynchronizersConfigCache(self, cC):
+        cfg = file(self.daemonConfig).read()
+        cfg = cfg.replace('[GLOBAL]', '[GLOBAL]\nconfigcache = ${DDIR}/cache')
+        file(self.daemonConfig, 'w').write(cfg)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertTrue(os.path.exists(self.dir + '/cache'))
+        with mock.patch('bigitr.config.Config.openConfig') as oC:
+            oC.side_effect = open
+            d = bigitrdaemon.Daemon(self.daemonConfig, False,
+                                    self.pidFile)
+            # only the daemon configuration itself was parsed
+            oC.assert_called_once_with(self.daemonConfig)
+        self.assertEqual(len(d.repositories), 4)
+        file(self.dir + '/bar', 'w').write('[bar]\n[baz]\n')
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(len(d.repositories), 5)
 
     @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
     def test_createSynchronizersAddEmail(self, cC):
@@ -137,9 +167,10 @@ repoconfig = ${DDIR}/bar
         cfg = cfg.replace('email = other@other blah@blah\n', '')
         cfg = cfg.replace('[GLOBAL]', '[GLOBAL]\nmailall = true\nemail = a@b')
         file(self.daemonConfig, 'w').write(cfg)
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
-        self.assertEqual(len(d.synchronizers), 4)
-        for s in d.synchronizers:
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(len(d.repositories), 4)
+        for key in d.repositories:
+            s = d.getSynchronizer(key)
             self.assertTrue(isinstance(s, Synchronize))
             for repo in s.ctx.getRepositories():
                 self.assertTrue('a@b' in s.ctx.getEmail(repo))
@@ -157,13 +188,34 @@ repoconfig = ${DDIR}/bar
             self.assertEqual(os.getpid(), int(file(d.pidfile).read()))
             self.assertTrue(d.context.pidfile.is_locked())
         mainLoop.side_effect = assertPidFileContents
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         self.assertFalse(os.path.exists(self.pidFile))
         self.assertFalse(d.context.pidfile.is_locked())
         d.run()
         self.assertFalse(os.path.exists(self.pidFile))
         self.assertFalse(d.context.pidfile.is_locked())
 
+    @mock.patch('bigitr.bigitrdaemon.Daemon.mainLoop')
+    @mock.patch.multiple('daemon.daemon',
+        close_all_open_files=mock.DEFAULT,
+        redirect_stream=mock.DEFAULT,
+        register_atexit_function=mock.DEFAULT,
+        change_working_directory=mock.DEFAULT,
+        set_signal_handlers=mock.DEFAULT
+        )
+    def test_runStatusFile(self, mainLoop, **patches):
+        statusFile = self.dir + '/status'
+        def assertStatus():
+            d.setState('sync')
+            self.assertEqual(status.read(statusFile)['pid'], os.getpid())
+        mainLoop.side_effect = assertStatus
+        d = bigitrdaemon.Daemon(self.daemonConfig, False,
+                                self.pidFile, statusFile)
+        d.run()
+        self.assertEqual(mainLoop.call_count, 1)
+        self.assertFalse(os.path.exists(statusFile))
+        self.assertEqual(d.status, None)
+
     @mock.patch('bigitr.bigitrdaemon.Daemon.mainLoop')
     @mock.patch.multiple('daemon.daemon',
         close_all_open_files=mock.DEFAULT,
@@ -179,7 +231,7 @@ repoconfig = ${DDIR}/bar
             if len(i) > 1:
                 return
             raise lockfile.AlreadyLocked
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         d.context.pidfile.acquire = mock.Mock()
         d.context.pidfile.break_lock = mock.Mock()
         d.context.pidfile.is_locked = mock.Mock()
@@ -201,7 +253,7 @@ repoconfig = ${DDIR}/bar
         set_signal_handlers=mock.DEFAULT
         )
     def test_runLockFail(self, mainLoop, **patches):
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         d.context.pidfile.acquire = mock.Mock()
         d.context.pidfile.break_lock = mock.Mock()
         d.context.pidfile.is_locked = mock.Mock()
@@ -226,9 +278,9 @@ repoconfig = ${DDIR}/bar
     def test_sighup(self, I):
         I.return_value = None
         d = bigitrdaemon.Daemon()
-        d.restart = False
+        d.reload = False
         d.sighup(signal.SIGHUP, None)
-        self.assertEqual(d.restart, True)
+        self.assertEqual(d.reload, True)
 
     @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
     def test_sigchld(self, I):
@@ -242,11 +294,20 @@ repoconfig = ${DDIR}/bar
         d = bigitrdaemon.Daemon()
         d.progress = mock.Mock()
         s = mock.Mock()
-        s.repos = ['foo']
-        s.ctx.getRepositoryName.return_value = 'foo'
         d.stop = False
-        d.restart = False
-        d.synchronizers = [s]
+        d.reload = False
+        d.repositories = [('/app', '/repo', 'path/foo')]
+        d.synchronizers = {('/app', '/repo', 'path/foo'): s}
+        d.spool = None
+        d.digest = None
+        d.metrics = None
+        d.status = None
+        d.profiler = None
+        d.backoff = None
+        d.pollrate = None
+        d.retry = False
+        d.retryNow = set()
+        d.retryFile = self.dir + '/pid.retry'
         d.runOnce()
         s.run.assert_called_once_with(poll=False)
         d.progress.setPhase.assert_called_once_with('sync')
@@ -268,14 +329,8 @@ repoconfig = ${DDIR}/bar
         self.assertRaises(SystemExit, d.runOnce)
         d.progress.setPhase.assert_called_once_with('sync')
 
-        d.progress.reset_mock()
-        d.stop = False
-        d.restart = True
-        self.assertRaises(SystemExit, d.runOnce)
-        d.progress.setPhase.assert_called_once_with('sync')
-
         s.run.reset_mock()
-        d.restart = False
+        d.stop = False
         s.run.side_effect = lambda **x: [][1]
         d.report = mock.Mock()
         d.runOnce()
@@ -284,7 +339,7 @@ repoconfig = ${DDIR}/bar
     @mock.patch('smtplib.SMTP')
     @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
     def test_report(self, cC, S):
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         try:
             [][1]
         except:
@@ -295,13 +350,193 @@ repoconfig = ${DDIR}/bar
         msg = conn.call_args[0][2]
         self.assertTrue('\nIndexError: list index out of range\n' in msg)
 
+    @mock.patch('smtplib.SMTP')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reportSpool(self, cC, S):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.spool = mock.Mock()
+        try:
+            [][1]
+        except:
+            d.report()
+        S.assert_not_called()
+        d.spool.add.assert_called_once_with(
+            'localhost', 'sender@here', ['other@other', 'blah@blah'],
+            mock.ANY)
+        msg = d.spool.add.call_args[0][3]
+        self.assertTrue('\nIndexError: list index out of range\n' in msg)
+
+    @mock.patch('bigitr.mailspool.SenderThread')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_startMailer(self, cC, T):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.startMailer(d.cfg)
+        self.assertEqual(d.spool, None)
+        T.assert_not_called()
+
+        spoolDir = self.dir + '/spool'
+        d.cfg.set('GLOBAL', 'mailspool', spoolDir)
+        d.startMailer(d.cfg)
+        self.assertEqual(d.spool.directory, spoolDir)
+        T.assert_called_once_with(d.spool)
+        T().start.assert_called_once_with()
+        self.assertTrue(os.path.isdir(spoolDir))
+
+        # unchanged
+        d.startMailer(d.cfg)
+        T().stop.assert_not_called()
+
+        d.cfg.set('GLOBAL', 'mailspool', spoolDir + '2')
+        d.startMailer(d.cfg)
+        T().stop.assert_called_once_with(d.MAILSTOPTIME)
+        self.assertEqual(d.spool.directory, spoolDir + '2')
+
+        d.stopMailer()
+        self.assertEqual(d.spool, None)
+        self.assertEqual(d.mailer, None)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_createDigest(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(d.digest, None)
+        d.cfg.set('GLOBAL', 'maildigest', '1h')
+        d.digest = d.createDigest(d.cfg, d.digest)
+        self.assertEqual(d.digest.interval, 3600)
+        self.assertEqual(d.digest.stateFile, None)
+
+        first = d.digest
+        first.pending = {'pending': 1}
+        d.cfg.set('GLOBAL', 'maildigest', '2h')
+        d.digest = d.createDigest(d.cfg, d.digest)
+        self.assertTrue(d.digest.pending is first.pending)
+        self.assertEqual(d.digest.interval, 7200)
+        self.assertEqual(first.interval, 3600)
+
+        d.cfg.set('GLOBAL', 'digeststate', self.dir + '/digest')
+        d.digest = d.createDigest(d.cfg, d.digest)
+        self.assertFalse(d.digest is first)
+        self.assertEqual(d.digest.stateFile, self.dir + '/digest')
+        self.assertEqual(d.digest.pending, {'pending': 1})
+
+        d.cfg.remove_option('GLOBAL', 'maildigest')
+        d.digest = d.createDigest(d.cfg, d.digest)
+        self.assertEqual(d.digest, None)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_createMetrics(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(d.metrics, None)
+        d.cfg.set('GLOBAL', 'metricsfile', self.dir + '/m')
+        d.metrics = d.createMetrics(d.cfg, d.metrics)
+        m = d.metrics
+        self.assertEqual(m.fileName, self.dir + '/m')
+        d.cfg.set('GLOBAL', 'metricsfile', self.dir + '/n')
+        d.metrics = d.createMetrics(d.cfg, d.metrics)
+        self.assertTrue(d.metrics.durations is m.durations)
+        self.assertEqual(d.metrics.fileName, self.dir + '/n')
+        self.assertEqual(m.fileName, self.dir + '/m')
+        d.cfg.remove_option('GLOBAL', 'metricsfile')
+        d.metrics = d.createMetrics(d.cfg, d.metrics)
+        self.assertEqual(d.metrics, None)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_runOnceMetrics(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.cfg.set('GLOBAL', 'metricsfile', self.dir + '/m')
+        d.metrics = d.createMetrics(d.cfg, d.metrics)
+        d.progress = mock.Mock()
+        d.report = mock.Mock()
+        ok = mock.Mock()
+        bad = mock.Mock()
+        bad.run.side_effect = IOError
+        d.repositories = d.repositories[:2]
+        d.synchronizers = {d.repositories[0]: ok, d.repositories[1]: bad}
+        backlogs = []
+        setBacklog = d.metrics.setBacklog
+        d.metrics.setBacklog = lambda b, r: (backlogs.append((b, r)),
+                                             setBacklog(b, r))
+        d.runOnce(poll=True)
+        self.assertEqual(backlogs, [(2, 2), (1, 2), (0, 2)])
+        okName, badName = [x[2] for x in d.repositories]
+        self.assertEqual(d.metrics.failures, {okName: 0, badName: 1})
+        self.assertEqual(d.metrics.lastSuccess.keys(), [okName])
+        self.assertEqual(sorted(d.metrics.durations),
+                         sorted([(badName, 'poll'), (okName, 'poll')]))
+        d.report.assert_called_once_with()
+        text = file(self.dir + '/m').read()
+        self.assertTrue('\nbigitr_backlog_repositories 0\n' in text)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_runOnceMetricsBackoff(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.cfg.set('GLOBAL', 'metricsfile', self.dir + '/m')
+        d.metrics = d.createMetrics(d.cfg, d.metrics)
+        d.backoff = backoff.Backoff(60, 3600)
+        d.progress = mock.Mock()
+        d.report = mock.Mock()
+        badName = d.repositories[0][2]
+        d.repositories = d.repositories[:1]
+        bad = mock.Mock()
+        d.synchronizers = {d.repositories[0]: bad}
+        # as a failing Synchronize records it
+        bad.run.side_effect = lambda poll: (
+            d.metrics.error(badName),
+            d.backoff.failed((badName, None, None)))
+        d.runOnce()
+        self.assertEqual(d.metrics.failures, {badName: 1})
+        # backing off: skipped, not counted as a run without errors
+        d.runOnce()
+        d.runOnce()
+        self.assertEqual(bad.run.call_count, 1)
+        self.assertEqual(d.metrics.failures, {badName: 1})
+        self.assertEqual(d.metrics.lastSuccess, {})
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_saveMetricsError(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.report = mock.Mock()
+        d.saveMetrics(0)
+        d.metrics = mock.Mock()
+        d.metrics.save.side_effect = IOError
+        d.saveMetrics(3, force=True)
+        d.metrics.setBacklog.assert_called_once_with(3, len(d.repositories))
+        d.metrics.save.assert_called_once_with(force=True)
+        d.report.assert_called_once_with()
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_flushDigest(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.flushDigest()
+        d.digest = mock.Mock()
+        d.spool = mock.Mock()
+        d.report = mock.Mock()
+        d.flushDigest()
+        d.digest.flush.assert_called_once_with(d.spool)
+        d.report.assert_not_called()
+        d.digest.flush.side_effect = IOError
+        d.flushDigest()
+        d.report.assert_called_once_with()
+
+    @mock.patch('bigitr.bigitrdaemon.Synchronize')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_getSynchronizerSpool(self, cC, S):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        key = d.repositories[0]
+        self.assertEqual(d.getSynchronizer(key).ctx.spool, None)
+        d.spool = mock.Mock()
+        d.digest = mock.Mock()
+        d.metrics = mock.Mock()
+        self.assertEqual(d.getSynchronizer(key).ctx.spool, d.spool)
+        self.assertEqual(d.getSynchronizer(key).ctx.digest, d.digest)
+        self.assertEqual(d.getSynchronizer(key).ctx.metrics, d.metrics)
+
     @mock.patch('traceback.format_exception')
     @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
     def test_reportNoEmail(self, cC, t):
         cfg = file(self.daemonConfig).read()
         cfg = cfg.replace('email = other@other blah@blah\n', '')
         file(self.daemonConfig, 'w').write(cfg)
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         d.report()
         t.assert_not_called()
 
@@ -311,19 +546,19 @@ repoconfig = ${DDIR}/bar
         cfg = file(self.daemonConfig).read()
         cfg = cfg.replace('mailfrom = sender@here\n', '')
         file(self.daemonConfig, 'w').write(cfg)
-        d = bigitrdaemon.Daemon('/foo', self.daemonConfig, False, self.pidFile)
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
         d.report()
         t.assert_not_called()
 
-    @mock.patch('os.execl')
     @mock.patch('time.time')
-    @mock.patch('time.sleep')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.sleep')
     @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
     @mock.patch('bigitr.bigitrdaemon.Daemon.runOnce')
-    def test_mainLoop(self, rO, I, sleep, Time, execl):
+    def test_mainLoop(self, rO, I, sleep, Time):
         I.return_value = None
         d = bigitrdaemon.Daemon()
         d.progress = mock.Mock()
+        d.status = None
         d.i = 0
         def stop(**kw):
             if 2 == d.i:
@@ -334,9 +569,7 @@ repoconfig = ${DDIR}/bar
         d.cfg.getFullSyncFrequency.return_value = 10
         d.cfg.getPollFrequency.return_value = 5
         d.stop = False
-        d.restart = False
-        d.context = mock.Mock()
-        d.context.detach_process = False
+        d.reload = False
         # first sync is full.  It is shorter than syncfrequency, so the
         # second sync is a poll.  It takes just long enough to exceed the
         # total sync time since last sync, so the
@@ -349,34 +582,496 @@ repoconfig = ${DDIR}/bar
                                     mock.call(poll=True),
                                     mock.call(poll=False)])
         sleep.assert_called_once_with(4.0)
-        execl.assert_not_called()
 
-    @mock.patch('os.execl')
     @mock.patch('time.sleep')
     @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
     @mock.patch('bigitr.bigitrdaemon.Daemon.runOnce')
-    def test_mainLoopSignalHandling(self, rO, I, sleep, execl):
+    def test_mainLoopSignalHandling(self, rO, I, sleep):
         I.return_value = None
         d = bigitrdaemon.Daemon()
         d.progress = mock.Mock()
+        d.status = None
         d.cfg = mock.Mock()
         d.cfg.getFullSyncFrequency.return_value = 1000
         d.cfg.getPollFrequency.return_value = 10000
-        d.context = mock.Mock()
-        d.context.detach_process = False
-        d.stop = False
-        d.restart = True
-        d.execPath = '/foo'
-        d.config = 'b'
-        d.pidfile = 'b-p'
+        d.stop = True
+        d.reload = False
         self.assertRaises(SystemExit, d.mainLoop)
-        execl.assert_called_once_with('/foo', '/foo', '--config', 'b', '--pid-file', 'b-p', '--no-daemon')
+        rO.assert_not_called()
 
-        execl.reset_mock()
-        d.restart = False
-        d.stop = True
+        # SIGTERM while sleeping ends the loop without another cycle
+        def sigterm(**kw):
+            d.stop = False
+            d.sleep = lambda x: setattr(d, 'stop', True)
+        rO.side_effect = sigterm
+        d.stop = False
         self.assertRaises(SystemExit, d.mainLoop)
-        execl.assert_not_called()
+        rO.assert_called_once_with(poll=False)
+
+    @mock.patch('time.time')
+    @mock.patch('time.sleep')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.idle')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.reloadConfig')
+    def test_sleep(self, rC, idle, I, sleep, Time):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.stop = False
+        d.reload = False
+        d.retry = False
+        Time.side_effect = [0, 0, 10]
+        d.sleep(10)
+        idle.assert_called_once_with(10)
+        sleep.assert_called_once_with(10)
+        rC.assert_not_called()
+
+        # SIGHUP interrupts the sleep after 3 seconds
+        sleep.reset_mock()
+        Time.side_effect = [0, 0, 3, 10]
+        def sighup(x):
+            if x == 10:
+                d.reload = True
+        sleep.side_effect = sighup
+        rC.side_effect = lambda: setattr(d, 'reload', False)
+        d.sleep(10)
+        sleep.assert_has_calls([mock.call(10), mock.call(7)])
+        rC.assert_called_once_with()
+
+    @mock.patch('time.time')
+    @mock.patch('time.sleep')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.idle')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.applyRetries')
+    def test_sleepRetry(self, aR, idle, I, sleep, Time):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.stop = False
+        d.reload = False
+        d.retry = False
+        # SIGUSR1 interrupts the sleep after 3 seconds
+        Time.side_effect = [0, 0, 3]
+        sleep.side_effect = lambda x: setattr(d, 'retry', True)
+        aR.return_value = True
+        d.sleep(10)
+        sleep.assert_called_once_with(10)
+        aR.assert_called_once_with()
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_applyRetries(self, I):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.retry = True
+        d.retryNow = set()
+        d.retryFile = self.dir + '/pid.retry'
+        k1 = ('/app', '/repo', 'path/one')
+        k2 = ('/app', '/repo', 'path/two')
+        d.repositories = [k1, k2]
+        d.backoff = backoff.Backoff(60, 3600)
+        d.backoff.failed(('path/one', 'import', 'b1'))
+        d.backoff.failed(('path/two', None, None))
+        self.assertFalse(d.applyRetries())
+        self.assertFalse(d.retry)
+        self.assertEqual(len(d.backoff.failures), 2)
+
+        backoff.requestRetry(d.retryFile, ['one'])
+        self.assertTrue(d.applyRetries())
+        self.assertEqual(d.retryNow, set((k1,)))
+        self.assertEqual(d.backoff.failures.keys(), [('path/two', None, None)])
+        self.assertFalse(os.path.exists(d.retryFile))
+
+        d.backoff = None
+        backoff.requestRetry(d.retryFile, [])
+        self.assertTrue(d.applyRetries())
+        self.assertEqual(d.retryNow, set((k1, k2)))
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_runOnceRetryNow(self, I):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.progress = mock.Mock()
+        d.report = mock.Mock()
+        d.stop = False
+        d.reload = False
+        k1 = ('/app', '/repo', 'one')
+        k2 = ('/app', '/repo', 'two')
+        d.repositories = [k1, k2]
+        d.repositoryConfigs = {k1: None, k2: None}
+        s1 = mock.Mock()
+        s2 = mock.Mock()
+        d.synchronizers = {k1: s1, k2: s2}
+        d.spool = None
+        d.digest = None
+        d.metrics = None
+        d.status = None
+        d.profiler = None
+        d.backoff = None
+        d.pollrate = None
+        d.retry = False
+        d.retryNow = set()
+        d.retryFile = self.dir + '/pid.retry'
+        backoff.requestRetry(d.retryFile, ['two'])
+        d.runOnce(poll=True)
+        s1.run.assert_called_once_with(poll=True)
+        s2.run.assert_called_once_with(poll=False)
+        self.assertEqual(d.retryNow, set())
+        d.runOnce(poll=True)
+        s2.run.assert_called_with(poll=True)
+
+    @mock.patch('time.time')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_runOncePollRate(self, I, Time):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.progress = mock.Mock()
+        d.report = mock.Mock()
+        d.stop = False
+        d.reload = False
+        k1 = ('/app', '/repo', 'one')
+        k2 = ('/app', '/repo', 'two')
+        d.repositories = [k1, k2]
+        d.repositoryConfigs = {k1: None, k2: None}
+        s1 = mock.Mock()
+        s2 = mock.Mock()
+        d.synchronizers = {k1: s1, k2: s2}
+        d.spool = None
+        d.digest = None
+        d.metrics = None
+        d.status = None
+        d.profiler = None
+        d.backoff = None
+        d.retry = False
+        d.retryNow = set()
+        d.retryFile = self.dir + '/pid.retry'
+        d.pollrate = pollrate.PollRate(300, 3600, self.dir + '/pollstate')
+        d.pollrate.changed('one', now=0)
+        d.pollrate.changed('two', now=0)
+        # one has new content; two has not changed since 0
+        s1.run.side_effect = lambda poll: d.pollrate.changed('one')
+        Time.return_value = 10000
+        d.runOnce(poll=True)
+        self.assertEqual(d.pollrate.nextPoll, {'one': 10300, 'two': 12500})
+        self.assertTrue(os.path.exists(self.dir + '/pollstate'))
+        self.assertTrue(s1.ctx.pollrate is d.pollrate)
+
+        Time.return_value = 10300
+        d.runOnce(poll=True)
+        s1.run.assert_called_with(poll=True)
+        self.assertEqual(s1.run.call_count, 2)
+        self.assertEqual(s2.run.call_count, 1)
+        self.assertEqual(d.pollrate.nextPoll, {'one': 10600, 'two': 12500})
+
+        # full synchronization ignores the poll schedule
+        d.runOnce()
+        s2.run.assert_called_with(poll=False)
+        self.assertEqual(d.pollrate.nextPoll['two'], 12875)
+
+    @mock.patch('bigitr.util.kill')
+    def test_requestRetry(self, kill):
+        bigitrdaemon.requestRetry('${DDIR}/pid', ['one'])
+        kill.assert_not_called()
+        file(self.pidFile, 'w').write('12345\n')
+        bigitrdaemon.requestRetry('${DDIR}/pid', [])
+        kill.assert_called_once_with(12345, signal.SIGUSR1)
+        self.assertEqual(backoff.readRetryRequests(self.pidFile + '.retry'),
+                         ['one', '*'])
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_sigusr1(self, I):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.retry = False
+        d.sigusr1(signal.SIGUSR1, None)
+        self.assertTrue(d.retry)
+
+    @mock.patch('time.time')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_idle(self, I, Time):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.stop = False
+        d.reload = False
+        d.retry = False
+        d.logCleaner = None
+        done = []
+        def cleanLogs():
+            for x in ('a', 'b', 'c'):
+                done.append(x)
+                yield x
+        d.cleanLogs = cleanLogs
+        # out of time after the first repository
+        Time.side_effect = [10]
+        d.idle(10)
+        self.assertEqual(done, ['a'])
+        self.assertNotEqual(d.logCleaner, None)
+        # resumed in the next idle period, which completes the pass
+        Time.side_effect = [0, 0]
+        d.idle(10)
+        self.assertEqual(done, ['a', 'b', 'c'])
+        self.assertEqual(d.logCleaner, None)
+
+    @mock.patch('bigitr.log.LogRetention')
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_cleanLogs(self, I, LR):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.report = mock.Mock()
+        app1 = mock.Mock()
+        app2 = mock.Mock()
+        d.repositoryConfigs = {1: (app1, None), 2: (app1, None),
+                               3: (app2, None)}
+        r = LR.return_value
+        r.active.return_value = True
+        r.logDir = '/logs'
+        r.repositoryLogDirs.return_value = ['/logs/a', '/logs/b']
+        r.clean.side_effect = [None, OSError]
+        self.assertEqual(list(d.cleanLogs()), ['/logs/a', '/logs/b'])
+        # two application configurations sharing one logdir
+        self.assertEqual(LR.call_count, 2)
+        r.clean.assert_has_calls([mock.call('/logs/a'), mock.call('/logs/b')])
+        self.assertEqual(r.clean.call_count, 2)
+        d.report.assert_called_once_with()
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_runOnceReload(self, I):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.progress = mock.Mock()
+        d.report = mock.Mock()
+        s1 = mock.Mock()
+        s2 = mock.Mock()
+        d.stop = False
+        d.reload = False
+        k1 = ('/app', '/repo', 'one')
+        k2 = ('/app', '/repo', 'two')
+        d.repositories = [k1, k2]
+        d.repositoryConfigs = {k1: None, k2: None}
+        d.synchronizers = {k1: s1, k2: s2}
+        d.spool = None
+        d.digest = None
+        d.metrics = None
+        d.status = None
+        d.profiler = None
+        d.backoff = None
+        d.pollrate = None
+        d.retry = False
+        d.retryNow = set()
+        d.retryFile = self.dir + '/pid.retry'
+        def removeTwo():
+            d.reload = False
+            del d.repositoryConfigs[k2]
+            d.repositories = [k1]
+        d.reloadConfig = mock.Mock(side_effect=removeTwo)
+        s1.run.side_effect = lambda **x: setattr(d, 'reload', True)
+        d.runOnce()
+        d.reloadConfig.assert_called_once_with()
+        s1.run.assert_called_once_with(poll=False)
+        s2.run.assert_not_called()
+        d.report.assert_not_called()
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.__init__')
+    def test_runOnceStatus(self, I):
+        I.return_value = None
+        d = bigitrdaemon.Daemon()
+        d.progress = mock.Mock()
+        d.report = mock.Mock()
+        d.stop = False
+        d.reload = False
+        k1 = ('/app', '/repo', 'one')
+        d.repositories = [k1]
+        d.repositoryConfigs = {k1: None}
+        s1 = mock.Mock()
+        d.synchronizers = {k1: s1}
+        d.spool = None
+        d.digest = None
+        d.metrics = None
+        d.profiler = None
+        d.backoff = None
+        d.pollrate = None
+        d.retry = False
+        d.retryNow = set()
+        d.retryFile = self.dir + '/pid.retry'
+        d.status = status.Status(self.dir + '/status')
+        def run(**kw):
+            self.assertEqual(s1.ctx.status, d.status)
+            self.assertEqual(
+                [x['repository'] for x in
+                 status.read(self.dir + '/status')['jobs']], ['one'])
+        s1.run.side_effect = run
+        d.runOnce(poll=True)
+        s1.run.assert_called_once_with(poll=True)
+        d.report.assert_not_called()
+        saved = status.read(self.dir + '/status')
+        self.assertEqual(saved['state'], 'poll')
+        self.assertEqual(saved['jobs'], [])
+
+    def writeDaemonRepoConfig(self, name, text):
+        file(self.dir + '/' + name, 'w').write(text)
+        # make sure that the change is visible even within one second
+        st = os.stat(self.dir + '/' + name)
+        os.utime(self.dir + '/' + name, (st.st_atime, st.st_mtime + 10))
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfig(self, cC):
+        file(self.dir + '/foo1.2', 'w').write('[foo1.2]\n[foo1.3]\n')
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        for key in d.repositories:
+            d.getSynchronizer(key)
+        old = dict(d.synchronizers)
+        d.reload = True
+        self.assertEqual(d.reloadConfig(), (set(), set(), set()))
+        self.assertFalse(d.reload)
+        self.assertEqual(d.synchronizers, old)
+
+        k = lambda f, x: (self.dir + '/app1', self.dir + '/' + f, x)
+        # foo1.3 changes, foo1.2 in the same file does not
+        self.writeDaemonRepoConfig('foo1.2', '[foo1.2]\n[foo1.3]\ncvs.a = a\n')
+        # foo1.1 removed, foo1.4 added
+        self.writeDaemonRepoConfig('foo1.1', '[foo1.4]\n')
+        added, removed, changed = d.reloadConfig()
+        self.assertEqual(added, set((k('foo1.1', 'foo1.4'),)))
+        self.assertEqual(removed, set((k('foo1.1', 'foo1.1'),)))
+        self.assertEqual(changed, set((k('foo1.2', 'foo1.3'),)))
+        for key in (k('foo1.2', 'foo1.2'), k('foo2.1', 'foo2.1')):
+            self.assertTrue(d.synchronizers[key] is old[key])
+        self.assertFalse(k('foo1.1', 'foo1.1') in d.synchronizers)
+        self.assertFalse(k('foo1.2', 'foo1.3') in d.synchronizers)
+        s = d.getSynchronizer(k('foo1.2', 'foo1.3'))
+        self.assertEqual(s.ctx.getImportBranchMaps('foo1.3'), [('a', 'cvs-a')])
+        self.assertEqual(len(d.repositories), 5)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigForgetsMetrics(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.metrics = mock.Mock()
+        cfg = file(self.daemonConfig).read()
+        cfg = cfg.replace('[GLOBAL]\n', '[GLOBAL]\nmetricsfile = /m\n')
+        file(self.daemonConfig, 'w').write(cfg)
+        self.writeDaemonRepoConfig('foo1.1', '[foo1.4]\n')
+        d.reloadConfig()
+        d.metrics.forget.assert_called_once_with(set(['foo1.1']))
+        self.assertEqual(d.metrics.fileName, '/m')
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigProfiler(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(d.profiler, None)
+        cfg = file(self.daemonConfig).read()
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\nprofiledir = /prof\nprofile = foo1.1\n'))
+        d.reloadConfig()
+        self.assertEqual(d.profiler.directory, '/prof')
+        self.assertEqual(d.profiler.patterns, ['foo1.1'])
+        key = (self.dir + '/app1', self.dir + '/foo1.1', 'foo1.1')
+        self.assertTrue(d.getSynchronizer(key).ctx.profiler is d.profiler)
+        file(self.daemonConfig, 'w').write(cfg)
+        d.reloadConfig()
+        self.assertEqual(d.profiler, None)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigBackoff(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(d.backoff, None)
+        cfg = file(self.daemonConfig).read()
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\nbackoff = 1m 1h\n'))
+        d.reloadConfig()
+        b = d.backoff
+        self.assertEqual((b.minimum, b.maximum), (60, 3600))
+        key = (self.dir + '/app1', self.dir + '/foo1.1', 'foo1.1')
+        self.assertTrue(d.getSynchronizer(key).ctx.backoff is b)
+        b.failed(('foo1.1', None, None))
+        b.failed(('foo1.2', None, None))
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\nbackoff = 2m 1h\n'))
+        self.writeDaemonRepoConfig('foo1.1', '[foo1.4]\n')
+        d.reloadConfig()
+        self.assertTrue(d.backoff.failures is b.failures)
+        self.assertEqual(d.backoff.minimum, 120)
+        self.assertEqual(b.failures.keys(), [('foo1.2', None, None)])
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigPollRate(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.assertEqual(d.pollrate, None)
+        cfg = file(self.daemonConfig).read()
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\npollfrequency = 1m\npollmaximum = 6h\n'))
+        d.reloadConfig()
+        p = d.pollrate
+        self.assertEqual((p.minimum, p.maximum), (60, 21600))
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\npollfrequency = 2m\npollmaximum = 1h\n'))
+        d.reloadConfig()
+        self.assertTrue(d.pollrate.nextPoll is p.nextPoll)
+        self.assertEqual((d.pollrate.minimum, d.pollrate.maximum),
+                         (120, 3600))
+        file(self.daemonConfig, 'w').write(cfg)
+        d.reloadConfig()
+        self.assertEqual(d.pollrate, None)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_profileOption(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False,
+                                self.pidFile, None, '${DDIR}/prof')
+        self.assertEqual(d.profiler.directory, self.dir + '/prof')
+        self.assertEqual(d.profiler.patterns, ['*'])
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigAppConfigChanged(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        self.writeDaemonRepoConfig('app2', '[global]\ngitdir = /git\n')
+        added, removed, changed = d.reloadConfig()
+        self.assertEqual(changed,
+                         set(((self.dir + '/app2', self.dir + '/bar', 'bar'),)))
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigError(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        repositories = d.repositories
+        d.report = mock.Mock()
+        self.writeDaemonRepoConfig('bar', 'not a config file')
+        self.assertEqual(d.reloadConfig(), (set(), set(), set()))
+        d.report.assert_called_once_with()
+        self.assertEqual(d.repositories, repositories)
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigUnsetVariable(self, cC):
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.report = mock.Mock()
+        k = lambda x: (self.dir + '/app1', self.dir + '/foo1.2', x)
+        text = '[foo1.2]\nprehook.git = ${BIGITR_UNSET_HOOKDIR}/h\n[foo1.3]\n'
+        self.writeDaemonRepoConfig('foo1.2', text)
+        d.reloadConfig()
+        # foo1.2 is compared but, unchanged, keeps its synchronizer;
+        # the unset variable fails only its hook, when it runs
+        self.writeDaemonRepoConfig('foo1.2', text + 'cvs.a = a\n')
+        added, removed, changed = d.reloadConfig()
+        d.report.assert_not_called()
+        self.assertEqual(changed, set((k('foo1.3'),)))
+
+    @mock.patch('bigitr.bigitrdaemon.Daemon.createContext')
+    def test_reloadConfigErrorKeepsServices(self, cC):
+        cfg = file(self.daemonConfig).read()
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\nbackoff = 1m 1h\nmaildigest = 1h\n'))
+        d = bigitrdaemon.Daemon(self.daemonConfig, False, self.pidFile)
+        d.report = mock.Mock()
+        oldCfg, oldDigest, oldBackoff = d.cfg, d.digest, d.backoff
+        file(self.daemonConfig, 'w').write(cfg.replace('[GLOBAL]\n',
+            '[GLOBAL]\nbackoff = 2m 1h\nmaildigest = 2h\n'
+            'pollfrequency = 1m\npollmaximum = 6h\nprofiledir = /prof\n'
+            'profile = *\n'))
+        with mock.patch('bigitr.pollrate.PollRate') as P:
+            P.side_effect = IOError
+            self.assertEqual(d.reloadConfig(), (set(), set(), set()))
+        d.report.assert_called_once_with()
+        self.assertTrue(d.cfg is oldCfg)
+        self.assertTrue(d.digest is oldDigest)
+        self.assertEqual(d.digest.interval, 3600)
+        self.assertTrue(d.backoff is oldBackoff)
+        self.assertEqual(d.backoff.minimum, 60)
+        self.assertEqual(d.pollrate, None)
+        self.assertEqual(d.profiler, None)
 
 @mock.patch('bigitr.bigitrdaemon.Daemon')
 class TestMain(testutils.TestCase):
@@ -385,26 +1080,30 @@ class TestMain(testutils.TestCase):
             del os.environ['BIGITR_DAEMON_CONFIG']
         if 'BIGITR_DAEMON_PIDFILE' in os.environ:
             del os.environ['BIGITR_DAEMON_PIDFILE']
+        if 'BIGITR_DAEMON_STATUSFILE' in os.environ:
+            del os.environ['BIGITR_DAEMON_STATUSFILE']
         bigitrdaemon.main(['/foo'])
         D.assert_called_once_with(
-            '/foo', '~/.bigitrd', True, '~/.bigitrd-pid')
+            '~/.bigitrd', True, '~/.bigitrd-pid', '~/.bigitrd-status', None)
         D().run.assert_called_once_with()
 
     def test_emptyArgsWithEnvironment(self, D):
         os.environ['BIGITR_DAEMON_CONFIG'] = '/b'
         os.environ['BIGITR_DAEMON_PIDFILE'] = '/b-p'
+        os.environ['BIGITR_DAEMON_STATUSFILE'] = '/b-s'
         try:
             bigitrdaemon.main(['/foo'])
-            D.assert_called_once_with('/foo', '/b', True, '/b-p')
+            D.assert_called_once_with('/b', True, '/b-p', '/b-s', None)
             D().run.assert_called_once_with()
 
         finally:
             os.unsetenv('BIGITR_DAEMON_CONFIG')
             os.unsetenv('BIGITR_DAEMON_PIDFILE')
+            os.unsetenv('BIGITR_DAEMON_STATUSFILE')
 
     @staticmethod
     def assertNonDefaultArgs(D):
-        D.assert_called_once_with('/foo', '/b', False, '/b-p')
+        D.assert_called_once_with('/b', False, '/b-p', '/b-s', None)
         D().run.assert_called_once_with()
 
     def test_ArgsHelp(self, D):
@@ -414,13 +1113,28 @@ class TestMain(testutils.TestCase):
         D.assert_not_called()
 
     def test_Args(self, D):
-        bigitrdaemon.main(['/foo', '--config', '/b', '--nodaemon', '--pidfile', '/b-p'])
+        bigitrdaemon.main(['/foo', '--config', '/b', '--nodaemon', '--pidfile', '/b-p',
+                           '--statusfile', '/b-s'])
         self.assertNonDefaultArgs(D)
 
     def test_ArgsShort(self, D):
-        bigitrdaemon.main(['/foo', '-c', '/b', '-n', '-p', '/b-p'])
+        bigitrdaemon.main(['/foo', '-c', '/b', '-n', '-p', '/b-p', '-s', '/b-s'])
         self.assertNonDefaultArgs(D)
 
+    @mock.patch('bigitr.bigitrdaemon.requestRetry')
+    def test_ArgsRetry(self, rR, D):
+        bigitrdaemon.main(['/foo', '-p', '/b-p', '--retry', 'one', 'two'])
+        rR.assert_called_once_with('/b-p', ['one', 'two'])
+        D.assert_not_called()
+        rR.reset_mock()
+        bigitrdaemon.main(['/foo', '-p', '/b-p', '--retry'])
+        rR.assert_called_once_with('/b-p', [])
+
+    def test_ArgsProfile(self, D):
+        bigitrdaemon.main(['/foo', '--profile', '/prof'])
+        self.assertEqual(D.call_args[0][4], '/prof')
+
     def test_ArgsLong(self, D):
-        bigitrdaemon.main(['/foo', '--config', '/b', '--no-daemon', '--pid-file', '/b-p'])
+        bigitrdaemon.main(['/foo', '--config', '/b', '--no-daemon', '--pid-file', '/b-p',
+                           '--status-file', '/b-s'])
         self.assertNonDefaultArgs(D)
@@ -101,3 +101,12 @@ class TestConfig(testutils.TestCase):
         badcfg = StringIO('[foo]\nbar = baz\n')
         cfg = config.Config(badcfg)
         self.assertRaises(ValueError, cfg.requireAbsolutePaths, 'bar', 'blah')
+
+    def test_parseByteSpec(self):
+        self.assertEqual(self.cfg._parseByteSpec('10'), 10)
+        self.assertEqual(self.cfg._parseByteSpec('10b'), 10)
+        self.assertEqual(self.cfg._parseByteSpec('2k'), 2048)
+        self.assertEqual(self.cfg._parseByteSpec(' 3 MB '), 3 * 1024 ** 2)
+        self.assertEqual(self.cfg._parseByteSpec('1g'), 1024 ** 3)
+        self.assertRaises(ValueError, self.cfg._parseByteSpec, 'lots')
+
@@ -0,0 +1,103 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+import tempfile
+import testutils
+
+from bigitr import configcache
+from bigitr import repositorymap
+
+class TestConfigCache(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.snapshot = self.dir + '/snapshot'
+        self.repoConfig = self.dir + '/repo'
+        file(self.repoConfig, 'w').write('[repo]\ncvs.a = a\n')
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def test_getCached(self):
+        cache = configcache.ConfigCache()
+        factory = mock.Mock()
+        parsed = cache.get(self.repoConfig, factory)
+        factory.assert_called_once_with(self.repoConfig)
+        self.assertTrue(parsed is factory.return_value)
+        self.assertTrue(cache.get(self.repoConfig, factory) is parsed)
+        self.assertEqual(factory.call_count, 1)
+
+    def test_getChanged(self):
+        cache = configcache.ConfigCache()
+        factory = mock.Mock()
+        cache.get(self.repoConfig, factory)
+        file(self.repoConfig, 'a').write('cvs.b = b\n')
+        cache.get(self.repoConfig, factory)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_getExtraKey(self):
+        cache = configcache.ConfigCache()
+        factory = mock.Mock()
+        cache.get(self.repoConfig, factory, ('a@b',))
+        cache.get(self.repoConfig, factory, ('a@b',))
+        self.assertEqual(factory.call_count, 1)
+        cache.get(self.repoConfig, factory)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_prune(self):
+        cache = configcache.ConfigCache()
+        cache.get(self.repoConfig, mock.Mock())
+        cache.dirty = False
+        cache.prune([self.repoConfig])
+        self.assertFalse(cache.dirty)
+        cache.prune([])
+        self.assertEqual(cache.entries, {})
+        self.assertTrue(cache.dirty)
+
+    def test_saveLoad(self):
+        cache = configcache.ConfigCache(self.snapshot)
+        cfg = cache.get(self.repoConfig, repositorymap.RepositoryConfig)
+        self.assertEqual(cfg.getImportBranchMaps('repo'), [('a', 'cvs-a')])
+        self.assertNotEqual(cfg.specs, {})
+        cache.save()
+        self.assertFalse(cache.dirty)
+
+        cache = configcache.ConfigCache(self.snapshot)
+        factory = mock.Mock()
+        cfg = cache.get(self.repoConfig, factory)
+        factory.assert_not_called()
+        # compiled specs are not persisted
+        self.assertEqual(cfg.specs, {})
+        self.assertEqual(cfg.getImportBranchMaps('repo'), [('a', 'cvs-a')])
+
+    def test_saveNotDirty(self):
+        cache = configcache.ConfigCache(self.snapshot)
+        cache.save()
+        self.assertFalse(os.path.exists(self.snapshot))
+
+    def test_loadDamaged(self):
+        file(self.snapshot, 'w').write('garbage')
+        cache = configcache.ConfigCache(self.snapshot)
+        self.assertEqual(cache.entries, {})
+
+    def test_loadOtherVersion(self):
+        cache = configcache.ConfigCache(self.snapshot)
+        cache.get(self.repoConfig, repositorymap.RepositoryConfig)
+        cache.save()
+        with mock.patch.object(configcache.ConfigCache, 'VERSION', 0):
+            cache = configcache.ConfigCache(self.snapshot)
+            self.assertEqual(cache.entries, {})
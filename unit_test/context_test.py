@@ -53,6 +53,16 @@ class TestLoggingShell(testutils.TestCase):
     def test_RepoConfig(self):
         self.assertEqual(self.ctx.getRepositories(), set(('dir/repo',)))
 
+    def test_AppConfigPrecedence(self):
+        # both inherit get from Config; AppConfig wins
+        self.assertEqual(self.ctx._dispatch['getMailFrom'], self.ctx._ac)
+        self.assertEqual(self.ctx._dispatch['getEmail'], self.ctx._rm)
+        self.assertEqual(self.ctx._dispatch['get'], self.ctx._ac)
+
+    def test_dispatchIsLateBound(self):
+        self.ctx._ac.set('global', 'logdir', '/otherlogs')
+        self.assertEqual(self.ctx.getLogDir(), '/otherlogs')
+
     def test_AttributeError(self):
         def raiseAttributeError():
             self.ctx.doesNotExist()
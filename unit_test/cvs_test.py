@@ -75,6 +75,11 @@ class TestCVS(testutils.TestCase):
         file(fdir+'/dir/metoo', 'w')
         files = self.cvs.listContentFiles()
         self.assertEqual(files, ['includeme', 'dir/metoo'])
+        prune = mock.Mock(return_value=True)
+        files = self.cvs.listContentFiles(prune=prune)
+        self.assertEqual(files, ['includeme'])
+        # CVS administrative directories are never offered for pruning
+        prune.assert_called_once_with('dir')
 
     def test_export(self):
         with mock.patch('bigitr.git.shell.run'):
@@ -84,6 +89,36 @@ class TestCVS(testutils.TestCase):
             self.assertEqual(os.environ['CVSROOT'],
                 self.ctx.getCVSRoot('repo'))
 
+    def test_exportMirror(self):
+        self.ctx._rm.set('repo', 'cvsmirror', '/mirror')
+        c = cvs.CVS(self.ctx, 'repo', 'brnch')
+        with mock.patch('bigitr.git.shell.run'):
+            c.export('targetdir')
+            self.assertEqual(os.environ['CVSROOT'], ':local:/mirror')
+            # commits still go to the real repository
+            c.setEnvironment()
+            self.assertEqual(os.environ['CVSROOT'], 'asdf')
+
+    def test_refreshMirror(self):
+        cvs.refreshMirror(self.ctx, 'repo')
+        self.ctx._rm.set('repo', 'cvsmirror', self.dir + '/mirror')
+        self.ctx._rm.set('repo', 'cvsmirrorsource', 'host:/cvs')
+        with mock.patch('bigitr.cvs.shell.run') as r:
+            cvs.refreshMirror(self.ctx, 'repo')
+            r.assert_has_calls([
+                mock.call(mock.ANY,
+                    'cvs', '-d', ':local:%s/mirror' %self.dir, 'init'),
+                mock.call(mock.ANY, 'rsync', '--archive', '--delete',
+                    '--exclude=#cvs.*', '--exclude=,*', 'host:/cvs/Some/Loc/',
+                    '%s/mirror/Some/Loc/' %self.dir)])
+            self.assertEqual(r.call_count, 2)
+            self.assertTrue(os.path.isdir(self.dir + '/mirror/Some/Loc'))
+            os.makedirs(self.dir + '/mirror/CVSROOT')
+            r.reset_mock()
+            cvs.refreshMirror(self.ctx, 'repo')
+            self.assertEqual(r.call_args[0][1], 'rsync')
+            self.assertEqual(r.call_count, 1)
+
     def test_checkout(self):
         with mock.patch('bigitr.git.shell.run'):
             with mock.patch.multiple('os', getcwd=mock.DEFAULT,
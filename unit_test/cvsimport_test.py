@@ -20,7 +20,7 @@ from StringIO import StringIO
 import tempfile
 import testutils
 
-from bigitr import cvsimport, context
+from bigitr import backoff, cvsimport, context
 
 class CVSImportTest(testutils.TestCase):
     def setUp(self):
@@ -64,11 +64,68 @@ class CVSImportTest(testutils.TestCase):
                  mock.call('repo2', mock.ANY, mock.ANY, 'b1', 'cvs-b1'),
                  mock.call('repo2', mock.ANY, mock.ANY, 'b2', 'cvs-b2')])
 
+    @mock.patch('bigitr.cvs.refreshMirror')
+    def test_importBranchesRefreshesMirror(self, rM):
+        with mock.patch.object(self.imp, 'importcvs'):
+            self.imp.importBranches('repo2', self.Git)
+            rM.assert_called_once_with(self.ctx, 'repo2')
+            self.assertEqual(self.imp.importcvs.call_count, 2)
+
+    @mock.patch('bigitr.cvs.refreshMirror')
+    def test_importBranchesNoneImportedNoRefresh(self, rM):
+        with mock.patch.object(self.imp, 'importcvs'):
+            self.imp.importBranches('repo', self.Git, 'nonesuch')
+            self.ctx.backoff = mock.Mock()
+            self.ctx.backoff.ready.return_value = False
+            self.imp.importBranches('repo', self.Git)
+            rM.assert_not_called()
+            self.imp.importcvs.assert_not_called()
+
+    @mock.patch('bigitr.cvs.refreshMirror')
+    def test_importBranchesRefreshError(self, rM):
+        rM.side_effect = [ZeroDivisionError, None]
+        self.ctx.getImportError = mock.Mock(return_value='warn')
+        self.imp.err = mock.Mock()
+        self.ctx.backoff = mock.Mock()
+        self.ctx.backoff.ready.return_value = True
+        with mock.patch.object(self.imp, 'importcvs'):
+            self.imp.importBranches('repo2', self.Git)
+            # reported as the failure of the first branch; the next
+            # branch refreshes the mirror again before importing
+            self.imp.err.assert_called_once_with('repo2', 'warn')
+            self.ctx.backoff.failed.assert_called_once_with(
+                ('repo2', 'import', 'b1'))
+            self.assertEqual(rM.call_count, 2)
+            self.imp.importcvs.assert_called_once_with(
+                'repo2', self.Git, mock.ANY, 'b2', 'cvs-b2')
+
     def test_importBranchesError(self):
+        with mock.patch.object(self.imp, 'importcvs'):
+            self.imp.importcvs.side_effect = lambda *x: 1/0
+            Git = mock.Mock()
+            self.assertRaises(ZeroDivisionError,
+                self.imp.importBranches, 'repo', Git)
+            Git.markDirty.assert_called_once_with()
+
+    @mock.patch('time.time')
+    def test_importBranchesBackoff(self, t):
+        self.ctx.backoff = backoff.Backoff(60, 3600)
+        t.return_value = 1000
         with mock.patch.object(self.imp, 'importcvs'):
             self.imp.importcvs.side_effect = lambda *x: 1/0
             self.assertRaises(ZeroDivisionError,
-                self.imp.importBranches, 'repo', mock.Mock())
+                self.imp.importBranches, 'repo2', self.Git, 'b2')
+            self.assertEqual(self.ctx.backoff.failures,
+                             {('repo2', 'import', 'b2'): (1, 1060)})
+            self.imp.importcvs.reset_mock()
+            self.imp.importcvs.side_effect = None
+            t.return_value = 1059
+            self.imp.importBranches('repo2', self.Git)
+            self.imp.importcvs.assert_called_once_with(
+                'repo2', self.Git, mock.ANY, 'b1', 'cvs-b1')
+            t.return_value = 1060
+            self.imp.importBranches('repo2', self.Git, 'b2')
+            self.assertEqual(self.ctx.backoff.failures, {})
 
     @mock.patch('bigitr.ignore.Ignore.parse')
     @mock.patch('bigitr.gitmerge.Merger')
@@ -84,12 +141,15 @@ class CVSImportTest(testutils.TestCase):
         self.Git.branches.return_value = ['b1', 'master']
         self.Git.listContentFiles.return_value = ['a']
         at.return_value = 'TIME'
+        self.ctx.pollrate = mock.Mock()
         self.imp.importcvs('repo2', self.Git, self.CVS, 'b1', 'cvs-b1')
+        self.ctx.pollrate.changed.assert_called_once_with('repo2')
 
         # spot test the most important things, but not everything
         self.Git.initializeGitRepository.assert_called()
         self.Git.checkoutNewImportBranch.assert_called_once_with('cvs-b1')
         self.Git.pristine.assert_called_once_with()
+        self.Git.markDirty.assert_called_once_with()
         cF.assert_has_calls([
             mock.call('/cvsdir/repo2/Loc', '/gitdir/repo2', mock.ANY),
             mock.call('/skel', '/gitdir/repo2', mock.ANY),
@@ -108,9 +168,11 @@ class CVSImportTest(testutils.TestCase):
         self.Git.infoStatus.reset_mock()
         self.Git.commit.reset_mock()
         self.Git.status.side_effect = [True, False]
+        self.ctx.pollrate.reset_mock()
         self.imp.importcvs('repo2', self.Git, self.CVS, 'b1', 'cvs-b1')
         self.Git.infoStatus.assert_called_once_with()
         self.Git.commit.assert_not_called()
+        self.ctx.pollrate.changed.assert_not_called()
 
         self.Git.infoStatus.reset_mock()
         self.Git.commit.reset_mock()
@@ -53,10 +53,15 @@ email = other@other blah@blah
         self.assertEqual(3600, self.cfg.getPollFrequency())
 
     def test_getFullSyncFrequency(self):
-        self.assertEqual(86000, self.cfg.getFullSyncFrequency())
+        self.assertEqual(86400, self.cfg.getFullSyncFrequency())
         self.cfg.set('GLOBAL', 'syncfrequency', '1h')
         self.assertEqual(3600, self.cfg.getFullSyncFrequency())
 
+    def test_getConfigCache(self):
+        self.assertEqual(None, self.cfg.getConfigCache())
+        self.cfg.set('GLOBAL', 'configcache', '/cache')
+        self.assertEqual('/cache', self.cfg.getConfigCache())
+
     def test_getEmail(self):
         self.assertEqual(None, self.cfg.getEmail())
         self.cfg.set('GLOBAL', 'email', 'here@here')
@@ -77,6 +82,53 @@ email = other@other blah@blah
         self.cfg.set('GLOBAL', 'smarthost', 'foo')
         self.assertEqual('foo', self.cfg.getSmartHost())
 
+    def test_getMailSpool(self):
+        self.assertEqual(None, self.cfg.getMailSpool())
+        self.cfg.set('GLOBAL', 'mailspool', '/spool')
+        self.assertEqual('/spool', self.cfg.getMailSpool())
+
+    def test_getMailDigest(self):
+        self.assertEqual(None, self.cfg.getMailDigest())
+        self.cfg.set('GLOBAL', 'maildigest', '6h')
+        self.assertEqual(21600, self.cfg.getMailDigest())
+
+    def test_getDigestState(self):
+        self.assertEqual(None, self.cfg.getDigestState())
+        self.cfg.set('GLOBAL', 'digeststate', '/state')
+        self.assertEqual('/state', self.cfg.getDigestState())
+
+    def test_getMetricsFile(self):
+        self.assertEqual(None, self.cfg.getMetricsFile())
+        self.cfg.set('GLOBAL', 'metricsfile', '/bigitr.prom')
+        self.assertEqual('/bigitr.prom', self.cfg.getMetricsFile())
+
+    def test_getBackoff(self):
+        self.assertEqual(None, self.cfg.getBackoff())
+        self.assertEqual(None, self.cfg.getBackoffState())
+        self.cfg.set('GLOBAL', 'backoff', '5m')
+        self.assertEqual((300, 86400), self.cfg.getBackoff())
+        self.cfg.set('GLOBAL', 'backoff', '1m 2h')
+        self.assertEqual((60, 7200), self.cfg.getBackoff())
+        self.cfg.set('GLOBAL', 'backoffstate', '/state')
+        self.assertEqual('/state', self.cfg.getBackoffState())
+
+    def test_getPollMaximum(self):
+        self.assertEqual(None, self.cfg.getPollMaximum())
+        self.assertEqual(None, self.cfg.getPollState())
+        self.cfg.set('GLOBAL', 'pollmaximum', '6h')
+        self.assertEqual(21600, self.cfg.getPollMaximum())
+        self.cfg.set('GLOBAL', 'pollstate', '/state')
+        self.assertEqual('/state', self.cfg.getPollState())
+
+    def test_getProfile(self):
+        self.assertEqual(None, self.cfg.getProfileDir())
+        self.assertEqual([], self.cfg.getProfileRepositories())
+        self.cfg.set('GLOBAL', 'profiledir', '/prof')
+        self.cfg.set('GLOBAL', 'profile', 'one path/two')
+        self.assertEqual('/prof', self.cfg.getProfileDir())
+        self.assertEqual(['one', 'path/two'],
+                         self.cfg.getProfileRepositories())
+
     def test_getApplicationContexts(self):
         self.assertEqual(set(('foo', 'bar')), self.cfg.getApplicationContexts())
 
@@ -110,4 +162,6 @@ email = other@other blah@blah
         self.assertEqual(3661, self.cfg._parseTimeSpec('1h 1m 1s'))
         self.assertEqual(3661, self.cfg._parseTimeSpec('1h 1m 1s '))
         self.assertEqual(3661, self.cfg._parseTimeSpec(' 1h 1m 1s '))
+        self.assertEqual(86400, self.cfg._parseTimeSpec('1d'))
+        self.assertEqual(90061, self.cfg._parseTimeSpec('1d1h1m1s'))
 
@@ -0,0 +1,171 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+import tempfile
+
+import testutils
+
+from bigitr import digest
+
+CONNECT = ('cvs -Q -d :pserver:cvs.example.com:/cvs export -kk'
+           ' -r HEAD -d %s module/%s')
+REFUSED = ('cvs [export aborted]: connect to cvs.example.com(10.1.1.%d):2401'
+           ' failed: Connection refused\n')
+
+class TestFunctions(testutils.TestCase):
+    def test_errorSignature(self):
+        self.assertEqual(
+            digest.errorSignature('warning\n' + REFUSED %1 + '\n\n', 'r1'),
+            'cvs [export aborted]: connect to cvs.example.com(#.#.#.#):#'
+            ' failed: Connection refused')
+        self.assertEqual(
+            digest.errorSignature(REFUSED %1, 'r1'),
+            digest.errorSignature(REFUSED %2, 'r2'))
+        self.assertEqual(
+            digest.errorSignature("fatal: 'r1' does not appear", 'r1'),
+            "fatal: '<repository>' does not appear")
+        self.assertEqual(digest.errorSignature('', 'r1'), '')
+        self.assertEqual(digest.errorSignature(None, 'r1'), '')
+
+
+class TestDigest(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.stateFile = self.dir + '/state'
+        self.digest = digest.Digest(3600, self.stateFile)
+        self.recipients = ['b@here', 'a@here']
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def recordRefused(self, repo, i, recipients=None):
+        self.digest.record('smarthost', 'from@here',
+                           recipients or self.recipients, 'path/' + repo,
+                           [(CONNECT %(repo, repo), 1, REFUSED %i)],
+                           ('/log/%s.log' %repo, '/log/%s.err' %repo))
+
+    @mock.patch('bigitr.mail.deliver')
+    def test_groupAcrossRepositories(self, deliver):
+        for i, repo in enumerate(('r1', 'r2', 'r3')):
+            self.recordRefused(repo, i)
+        self.assertEqual(self.digest.flush(now=1000), 1)
+        deliver.assert_called_once_with(
+            None, 'smarthost', 'from@here', ['a@here', 'b@here'], mock.ANY)
+        msg = deliver.call_args[0][4]
+        self.assertTrue(
+            'Subject: bigitr error digest: 1 failure in 3 repositories\n'
+            in msg)
+        self.assertTrue('cvs export exited 1 in 3 repositories:\n' in msg)
+        self.assertTrue('(#.#.#.#):# failed: Connection refused\n' in msg)
+        for repo in ('r1', 'r2', 'r3'):
+            self.assertTrue('  path/%s\n    /log/%s.log\n    /log/%s.err\n'
+                            %(repo, repo, repo) in msg)
+        self.assertTrue('Error output from path/r1:\n    cvs [export aborted]'
+                        in msg)
+        self.assertEqual(self.digest.pending, {})
+
+    @mock.patch('bigitr.mail.deliver')
+    def test_messagePerRecipientSet(self, deliver):
+        self.recordRefused('r1', 1)
+        self.recordRefused('r2', 1, recipients=['c@here'])
+        self.recordRefused('r3', 1, recipients=['a@here', 'b@here'])
+        self.assertEqual(self.digest.flush(spool='spool', now=1000), 2)
+        self.assertEqual(
+            sorted(x[0][3] for x in deliver.call_args_list),
+            [['a@here', 'b@here'], ['c@here']])
+        self.assertEqual(deliver.call_args[0][0], 'spool')
+
+    @mock.patch('bigitr.mail.deliver')
+    def test_suppressRepeats(self, deliver):
+        self.recordRefused('r1', 1)
+        self.assertEqual(self.digest.flush(now=1000), 1)
+
+        # same failure again, within the interval
+        self.recordRefused('r1', 2)
+        self.assertEqual(self.digest.flush(now=2000), 0)
+
+        # spread to another repository
+        self.recordRefused('r1', 1)
+        self.recordRefused('r2', 1)
+        self.assertEqual(self.digest.flush(now=2500), 1)
+        self.recordRefused('r2', 1)
+        self.assertEqual(self.digest.flush(now=2600), 0)
+
+        # a different failure is reported alongside the ongoing one
+        self.recordRefused('r1', 1)
+        self.digest.record('smarthost', 'from@here', self.recipients,
+                           'path/r2', [('git push origin b', 1,
+                                        'error: failed to push\n')], ())
+        self.assertEqual(self.digest.flush(now=2700), 1)
+        msg = deliver.call_args[0][4]
+        self.assertTrue('git push exited 1 in 1 repository:\n' in msg)
+        self.assertFalse('cvs export' in msg)
+        self.assertTrue('1 earlier reported failure is still occurring.\n'
+                        in msg)
+
+        # the interval has passed
+        self.recordRefused('r1', 1)
+        self.assertEqual(self.digest.flush(now=2500 + 3600), 1)
+
+    @mock.patch('bigitr.mail.deliver')
+    def test_suppressAcrossEmptyFlush(self, deliver):
+        self.recordRefused('r1', 1)
+        self.assertEqual(self.digest.flush(now=1000), 1)
+        # a pass without the failure, such as a poll
+        self.assertEqual(self.digest.flush(now=1100), 0)
+        self.recordRefused('r1', 1)
+        self.assertEqual(self.digest.flush(now=1200), 0)
+        # forgotten once the interval has passed
+        self.assertEqual(self.digest.flush(now=1000 + 3600), 0)
+        self.assertEqual(self.digest.sent, {})
+        self.recordRefused('r1', 1)
+        self.assertEqual(self.digest.flush(now=1000 + 3601), 1)
+
+    @mock.patch('bigitr.mail.deliver')
+    def test_statePersisted(self, deliver):
+        self.recordRefused('r1', 1)
+        self.digest.flush(now=1000)
+        self.assertTrue(os.path.exists(self.stateFile))
+        self.assertFalse(os.path.exists(self.stateFile + '.tmp'))
+
+        d = digest.Digest(3600, self.stateFile)
+        self.assertEqual(d.sent, self.digest.sent)
+        self.digest = d
+        self.recordRefused('r1', 1)
+        self.assertEqual(d.flush(now=1100), 0)
+
+    def test_loadDamaged(self):
+        file(self.stateFile, 'w').write('garbage')
+        d = digest.Digest(3600, self.stateFile)
+        self.assertEqual(d.sent, {})
+
+    @mock.patch('bigitr.mail.deliver')
+    def test_noStateFile(self, deliver):
+        d = digest.Digest(3600)
+        d.record('s', 'f', ['t'], 'r', [('false', 1, '')], ())
+        self.assertEqual(d.flush(now=1), 1)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_recordKeepsTail(self):
+        errors = ''.join('line %d\n' %i for i in range(100))
+        self.digest.record('s', 'f', ['t'], 'r', [('false', 1, errors)], ())
+        groups = self.digest.pending[('s', 'f', ('t',))]
+        self.assertEqual(groups.keys(), [('false', 1, 'line #')])
+        kept = groups[('false', 1, 'line #')]['r'][0]
+        self.assertEqual(kept.split('\n'),
+                         ['line %d' %i for i in range(80, 100)])
@@ -20,7 +20,7 @@ import mock
 import sys
 import testutils
 
-from bigitr import errhandler, context, appconfig
+from bigitr import errhandler, context, appconfig, shell
 
 class TestErrors(testutils.TestCase):
     def setUp(self):
@@ -90,6 +90,43 @@ class TestErrors(testutils.TestCase):
                 self.ctx.logs['repo1'].writeError.call_args[0][0].startswith(
                     "Error for repository 'repo1':\nTraceback"))
 
+    def test_reportFailure(self):
+        self.ctx.mails['repo1'].addFailure = mock.Mock()
+        with mock.patch('sys.stderr'):
+            try:
+                self.inner()
+            except:
+                pass
+            self.err.report('repo1')
+        self.ctx.mails['repo1'].addFailure.assert_called_once_with(
+            'python', 'ZeroDivisionError', mock.ANY)
+        errmsg = self.ctx.mails['repo1'].addFailure.call_args[0][2]
+        self.assertTrue(errmsg.endswith('ZeroDivisionError: integer division'
+                                        ' or modulo by zero\n'))
+
+    def test_reportMetrics(self):
+        self.ctx.metrics = mock.Mock()
+        with mock.patch('sys.stderr'):
+            try:
+                self.inner()
+            except:
+                pass
+            self.err.report('repo1')
+        self.ctx.metrics.error.assert_called_once_with('repo1')
+
+    def test_reportCommandFailure(self):
+        self.ctx.mails['repo1'].addFailure = mock.Mock()
+        self.ctx.logs['repo1'].lastCommand = ('git fetch --all', 128)
+        self.ctx.logs['repo1'].lastError.return_value = 'fatal: no\n'
+        with mock.patch('sys.stderr'):
+            try:
+                raise shell.ErrorExitCode(128)
+            except:
+                pass
+            self.err.report('repo1')
+        self.ctx.mails['repo1'].addFailure.assert_called_once_with(
+            'git fetch --all', 128, 'fatal: no\n')
+
     def test_reportContinue(self):
         with mock.patch('sys.stderr') as e:
             self.ctx.logs['repo1'].writeError = mock.Mock()
@@ -54,13 +54,67 @@ class TestGit(testutils.TestCase):
             uri = '/path/to/repo'
             self.git.clone(uri)
             shell.run.assert_called_once_with(mock.ANY,
-                'git', 'clone', uri)
+                'git', 'clone',
+                '--config', 'core.untrackedCache=true',
+                '--config', 'index.version=4', uri)
+
+    def test_clonePartial(self):
+        with mock.patch('bigitr.git.shell.run'):
+            self.ctx._rm.set('repo', 'clonefilter', 'blob:none')
+            uri = '/path/to/repo'
+            self.git.clone(uri)
+            shell.run.assert_called_once_with(mock.ANY,
+                'git', 'clone',
+                '--config', 'core.untrackedCache=true',
+                '--config', 'index.version=4',
+                '--filter=blob:none', uri)
 
     def test_fetch(self):
         with mock.patch('bigitr.git.shell.run'):
             self.git.fetch()
             shell.run.assert_called_once_with(mock.ANY,
-                'git', 'fetch', '--all')
+                'git', 'fetch', 'origin')
+
+    def test_fetchRefspecs(self):
+        self.ctx._rm.set('repo', 'cvs.b1', 'b1')
+        self.ctx._rm.set('repo', 'git.master', 'trunk')
+        self.ctx._rm.set('repo', 'merge.cvs-b1', 'b1 master')
+        with mock.patch('bigitr.git.shell.run'):
+            self.git.fetch()
+            shell.run.assert_called_once_with(mock.ANY,
+                'git', 'fetch', 'origin',
+                '+refs/heads/b1*:refs/remotes/origin/b1*',
+                '+refs/heads/cvs-b1*:refs/remotes/origin/cvs-b1*',
+                '+refs/heads/export-master*:refs/remotes/origin/export-master*',
+                '+refs/heads/master*:refs/remotes/origin/master*')
+
+    def test_fetchOncePerPush(self):
+        with mock.patch('bigitr.git.shell.run'):
+            self.git.fetch()
+            self.git.fetch()
+            self.assertEqual(shell.run.call_count, 1)
+            self.git.push('origin', 'master', 'master')
+            self.git.fetch()
+            self.git.fetch()
+            self.assertEqual(shell.run.call_count, 3)
+            self.git.newBranch('b1')
+            self.git.fetch()
+            self.assertEqual(shell.run.call_count, 6)
+            self.ctx._rm.set('repo', 'deferpush', 'true')
+            self.git.push('origin', 'master', 'master')
+            self.git.fetch()
+            self.assertEqual(shell.run.call_count, 6)
+            with mock.patch('bigitr.git.shell.read') as r:
+                r.return_value = (0, '')
+                self.git.pushDeferred()
+            self.git.fetch()
+            self.assertEqual(shell.run.call_count, 7)
+
+    def test_fetchAfterClone(self):
+        with mock.patch('bigitr.git.shell.run'):
+            self.git.clone('/path/to/repo')
+            self.git.fetch()
+            self.assertEqual(shell.run.call_count, 1)
 
     def test_reset(self):
         with mock.patch('bigitr.git.shell.run'):
@@ -79,7 +133,10 @@ class TestGit(testutils.TestCase):
             shell.run.assert_called_once_with(mock.ANY,
                 'git', 'clean', '--force', '-x', '-d')
 
-    def test_pristine(self):
+    @mock.patch('__builtin__.file')
+    @mock.patch('os.path.exists')
+    def test_pristine(self, exists, f):
+        exists.return_value = False
         with mock.patch.multiple(self.git, statusIgnored=mock.DEFAULT,
                                         clean=mock.DEFAULT,
                                         refs=mock.DEFAULT,
@@ -87,21 +144,69 @@ class TestGit(testutils.TestCase):
             mockgit['statusIgnored'].return_value = True
             mockgit['refs'].return_value = [('ignore', 'HEAD')]
             self.git.pristine()
+            exists.assert_called_once_with('/git/repo/.git/bigitr-pristine')
             mockgit['statusIgnored'].assert_called_once_with()
             mockgit['clean'].assert_called_once_with()
             mockgit['refs'].assert_called_once_with()
             mockgit['reset'].assert_called_once_with()
+            f.assert_called_once_with('/git/repo/.git/bigitr-pristine', 'w')
+
+    @mock.patch('__builtin__.file')
+    @mock.patch('os.path.exists')
+    def test_pristineAlreadyPristine(self, exists, f):
+        exists.return_value = True
+        with mock.patch.multiple(self.git, statusIgnored=mock.DEFAULT,
+                                        clean=mock.DEFAULT) as mockgit:
+            self.git.pristine()
+            mockgit['statusIgnored'].assert_not_called()
+            mockgit['clean'].assert_not_called()
+            f.assert_not_called()
+
+    @mock.patch('__builtin__.file')
+    @mock.patch('os.path.exists')
+    def test_tuneClone(self, exists, f):
+        exists.return_value = False
+        with mock.patch('bigitr.git.shell.run'):
+            self.git.tuneClone()
+            exists.assert_called_once_with('/git/repo/.git/bigitr-tuned')
+            shell.run.assert_has_calls([
+                mock.call(mock.ANY, 'git', 'config', 'core.untrackedCache',
+                          'true'),
+                mock.call(mock.ANY, 'git', 'config', 'index.version', '4'),
+                mock.call(mock.ANY, 'git', 'update-index', '--index-version',
+                          '4')])
+            f.assert_called_once_with('/git/repo/.git/bigitr-tuned', 'w')
+            shell.run.reset_mock()
+            f.reset_mock()
+            exists.return_value = True
+            self.git.tuneClone()
+            self.assertEqual(shell.run.call_count, 0)
+            self.assertEqual(f.call_count, 0)
+
+    @mock.patch('os.remove')
+    @mock.patch('os.path.exists')
+    def test_markDirty(self, exists, remove):
+        exists.return_value = False
+        self.git.markDirty()
+        remove.assert_not_called()
+        exists.return_value = True
+        self.git.markDirty()
+        remove.assert_called_once_with('/git/repo/.git/bigitr-pristine')
+
+    def mockHead(self, f, head):
+        f.return_value.read.return_value = head
 
     def test_branches(self):
         with mock.patch('bigitr.git.shell.read') as r:
-            r.return_value = (0, '''
-* master
-  remotes/origin/HEAD -> origin/master
-  remotes/origin/master
-''')
+            r.return_value = (0, """\
+a44dfd94fd9de6c27f739274f2fae99ab83fa2f5 refs/heads/master
+fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/HEAD
+fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/master
+fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/tags/v1
+""")
             branches = self.git.branches()
             r.assert_called_once_with(mock.ANY,
-                'git', 'branch', '-a')
+                'git', 'for-each-ref', '--format=%(objectname) %(refname)')
             self.assertEquals(branches, set((
                 'master',
                 'remotes/origin/HEAD',
@@ -112,37 +217,31 @@ class TestGit(testutils.TestCase):
         with mock.patch('bigitr.git.shell.read') as r:
             r.return_value = (0, '')
             branches = self.git.branches()
-            r.assert_called_once_with(mock.ANY,
-                'git', 'branch', '-a')
             self.assertEquals(branches, set())
 
-    def test_branch(self):
-        with mock.patch('bigitr.git.shell.read') as r:
-            r.return_value = (0, 'master')
-            branch = self.git.branch()
-            r.assert_called_once_with(mock.ANY,
-                'git', 'symbolic-ref', '--short', '-q', 'HEAD')
-            self.assertEquals(branch, 'master')
+    @mock.patch('__builtin__.file')
+    def test_branch(self, f):
+        self.mockHead(f, 'ref: refs/heads/master\n')
+        self.assertEquals(self.git.branch(), 'master')
+        f.assert_called_once_with('/git/repo/.git/HEAD')
 
-    def test_branchOther(self):
-        with mock.patch('bigitr.git.shell.read') as r:
-            r.return_value = (0, 'other')
-            branch = self.git.branch()
-            r.assert_called_once_with(mock.ANY,
-                'git', 'symbolic-ref', '--short', '-q', 'HEAD')
-            self.assertEquals(branch, 'other')
+    @mock.patch('__builtin__.file')
+    def test_branchDetached(self, f):
+        self.mockHead(f, 'a44dfd94fd9de6c27f739274f2fae99ab83fa2f5\n')
+        self.assertEquals(self.git.branch(), '')
 
-    def test_refs(self):
+    @mock.patch('__builtin__.file')
+    def test_refs(self, f):
+        self.mockHead(f, 'ref: refs/heads/master\n')
         with mock.patch('bigitr.git.shell.read') as r:
-            r.return_value = (0, '''
+            r.return_value = (0, """\
 a44dfd94fd9de6c27f739274f2fae99ab83fa2f5 refs/heads/master
 fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/HEAD
 fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/master
-''')
+""")
             refs = self.git.refs()
-            r.assert_called_once_with(mock.ANY,
-                'git', 'show-ref', '--head', error=False)
             self.assertEquals(refs, [
+                ('a44dfd94fd9de6c27f739274f2fae99ab83fa2f5', 'HEAD'),
                 ('a44dfd94fd9de6c27f739274f2fae99ab83fa2f5',
                  'refs/heads/master'),
                 ('fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201',
@@ -150,15 +249,67 @@ fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/master
                 ('fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201',
                  'refs/remotes/origin/master')
             ])
+            # unborn branch
+            self.mockHead(f, 'ref: refs/heads/cvs-b1\n')
+            self.assertEquals(self.git.refs()[0][1], 'refs/heads/master')
+            # detached
+            self.mockHead(f, 'fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201\n')
+            self.assertEquals(self.git.refs()[0],
+                ('fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201', 'HEAD'))
+            r.assert_called_once_with(mock.ANY,
+                'git', 'for-each-ref', '--format=%(objectname) %(refname)')
 
-    def test_refsNone(self):
+    @mock.patch('__builtin__.file')
+    def test_refsNone(self, f):
+        self.mockHead(f, 'ref: refs/heads/master\n')
         with mock.patch('bigitr.git.shell.read') as r:
-            r.return_value = (1, '')
+            r.return_value = (0, '')
             refs = self.git.refs()
-            r.assert_called_once_with(mock.ANY,
-                'git', 'show-ref', '--head', error=False)
             self.assertEquals(refs, None)
 
+    def test_refSnapshot(self):
+        with mock.patch.multiple('bigitr.git.shell', run=mock.DEFAULT,
+                                 read=mock.DEFAULT):
+            shell.read.return_value = (0, 'a refs/heads/master\n')
+            self.assertEquals(self.git.refSnapshot(),
+                              [('a', 'refs/heads/master')])
+            self.git.branches()
+            self.assertEquals(shell.read.call_count, 1)
+            for method, args in (('fetch', ()),
+                                 ('reset', ()),
+                                 ('clone', ('/path/to/repo',)),
+                                 ('newBranch', ('b',)),
+                                 ('trackBranch', ('b',)),
+                                 ('checkoutTracking', ('b',)),
+                                 ('checkout', ('b',)),
+                                 ('mergeDefault', ('b', 'message')),
+                                 ('mergeFastForward', ('b',)),
+                                 ('mergeIgnore', ('b',)),
+                                 ('commit', ('message',)),
+                                 ('push', ('origin', 'b', 'b')),
+                                 ('runHooks', ([['hook']],))):
+                self.git.fetched = False
+                shell.read.reset_mock()
+                getattr(self.git, method)(*args)
+                self.git.branches()
+                self.git.refSnapshot()
+                self.assertEquals(shell.read.call_count, 1, method)
+            shell.read.reset_mock()
+            # neither of these change refs
+            self.git.status()
+            self.git.addAll()
+            self.git.refSnapshot()
+            self.assertEquals(shell.read.call_count, 1)
+
+    def test_refSnapshotFailure(self):
+        with mock.patch.multiple('bigitr.git.shell', run=mock.DEFAULT,
+                                 read=mock.DEFAULT):
+            shell.read.return_value = (0, 'a refs/heads/master\n')
+            self.git.refSnapshot()
+            shell.run.side_effect = shell.ErrorExitCode(1)
+            self.assertRaises(shell.ErrorExitCode,
+                              self.git.mergeFastForward, 'b')
+            self.assertEquals(self.git.snapshot, None)
 
     def test_newBranch(self):
         with mock.patch('bigitr.git.shell.run'):
@@ -291,7 +442,9 @@ fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/master
     def test_mergeDefaultFailure(self):
         with mock.patch('bigitr.git.shell.run'):
             shell.run.return_value = 1
-            rc = self.git.mergeDefault('brnch', 'msg')
+            with mock.patch.object(self.git, 'markDirty') as markDirty:
+                rc = self.git.mergeDefault('brnch', 'msg')
+                markDirty.assert_called_once_with()
             shell.run.assert_called_once_with(mock.ANY,
                 'git', 'merge', 'brnch', '-m', 'msg', error=False)
             self.assertEqual(rc, 1)
@@ -322,6 +475,66 @@ fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/master
             shell.run.assert_called_once_with(mock.ANY,
                 'git', 'push', 'origin', 'master:master')
 
+    def test_pushDeferred(self):
+        self.ctx._rm.set('repo', 'deferpush', 'true')
+        with mock.patch.multiple('bigitr.git.shell', run=mock.DEFAULT,
+                                 read=mock.DEFAULT):
+            self.git.pushDeferred()
+            shell.read.assert_not_called()
+            self.git.push('origin', 'cvs-b1', 'cvs-b1')
+            self.git.push('origin', 'b1', 'export-b1')
+            self.git.push('origin', 'master', 'master')
+            self.git.push('origin', 'b2', 'export-b1')
+            shell.run.assert_not_called()
+            self.assertTrue(self.git.isPushDeferred('master'))
+            self.assertFalse(self.git.isPushDeferred('b1'))
+            shell.read.return_value = (0, '')
+            self.git.pushDeferred()
+            shell.read.assert_called_once_with(mock.ANY,
+                'git', 'push', '--atomic', '--porcelain', 'origin',
+                'cvs-b1:cvs-b1', 'master:master', 'b2:export-b1',
+                error=False)
+            self.assertFalse(self.git.isPushDeferred('master'))
+            shell.read.reset_mock()
+            self.git.pushDeferred()
+            shell.read.assert_not_called()
+
+    def test_pushDeferredAfterError(self):
+        err = mock.Mock()
+        with mock.patch.object(self.git, 'pushDeferred') as pD:
+            self.git.pushDeferredAfterError(err)
+            pD.assert_called_once_with()
+            err.report.assert_not_called()
+            pD.side_effect = RuntimeError
+            self.git.pushDeferredAfterError(err)
+            err.report.assert_called_once_with('repo')
+
+    def test_pushDeferredFailure(self):
+        self.ctx._rm.set('repo', 'deferpush', 'true')
+        self.mocklog.thiserr = '/logs/repo/x.err'
+        self.git.log = self.mocklog
+        self.git.push('origin', 'cvs-b1', 'cvs-b1')
+        self.git.push('origin', 'master', 'master')
+        with mock.patch('bigitr.git.shell.read') as r:
+            r.return_value = (1,
+                'To git@host:repo\n'
+                '!\trefs/heads/cvs-b1:refs/heads/cvs-b1\t'
+                '[rejected] (atomic push failed)\n'
+                '!\trefs/heads/master:refs/heads/master\t'
+                '[rejected] (fetch first)\n'
+                'Done\n')
+            try:
+                self.git.pushDeferred()
+                self.fail('RuntimeError not raised')
+            except RuntimeError, e:
+                self.assertEqual(str(e), 'push to origin failed:\n'
+                    'cvs-b1: [rejected] (atomic push failed)\n'
+                    'master: [rejected] (fetch first)')
+            self.git.push('origin', 'master', 'master')
+            r.return_value = (128, '')
+            self.assertRaisesRegexp(RuntimeError, 'see /logs/repo/x.err',
+                                    self.git.pushDeferred)
+
     def test_logmessages(self):
         with mock.patch('bigitr.git.shell.read') as r:
             r.return_value = (0, 'a message\n')
@@ -406,9 +619,20 @@ fe9a5fbf7fe7ca3f6f08946187e2d1ce302c0201 refs/remotes/origin/master
     def test_initializeGitRepositoryAlreadyDone(self):
         with mock.patch('os.path.exists') as e:
             with mock.patch('os.chdir') as c:
-                e.return_value = True
-                self.git.initializeGitRepository()
-                c.assert_not_called()
+                with mock.patch('bigitr.git.Git.tuneClone') as tC:
+                    e.return_value = True
+                    self.git.initializeGitRepository()
+                    c.assert_called_once_with('/git/repo')
+                    tC.assert_called_once_with()
+
+    def test_runHooksMarksDirty(self):
+        with mock.patch('bigitr.git.shell.run'):
+            with mock.patch.object(self.git, 'markDirty') as markDirty:
+                self.git.runHooks([])
+                markDirty.assert_not_called()
+                self.git.runHooks([['hook']])
+                markDirty.assert_called_once_with()
+                shell.run.assert_called_once_with(mock.ANY, 'hook')
 
     def test_runImpPreHooks(self):
         with mock.patch('bigitr.git.shell.run'):
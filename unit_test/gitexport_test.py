@@ -20,7 +20,7 @@ from StringIO import StringIO
 import tempfile
 import testutils
 
-from bigitr import gitexport, context, shell, util
+from bigitr import backoff, gitexport, context, shell, util
 
 class GitExportTest(testutils.TestCase):
     def setUp(self):
@@ -65,6 +65,27 @@ class GitExportTest(testutils.TestCase):
             self.exp.exportgit.side_effect = lambda *x: 1/0
             self.assertRaises(ZeroDivisionError,
                 self.exp.exportBranches, 'repo', self.Git)
+            self.Git.markDirty.assert_called_once_with()
+
+    def test_exportBranchesBackoff(self):
+        self.ctx.backoff = backoff.Backoff(60, 3600)
+        with mock.patch.object(self.exp, 'exportgit'):
+            def fail(repository, Git, CVS, gitbranch, exportbranch):
+                if gitbranch == 'b1':
+                    1/0
+            self.exp.exportgit.side_effect = fail
+            self.assertRaises(ZeroDivisionError,
+                self.exp.exportBranches, 'repo2', self.Git)
+            self.assertEqual(self.ctx.backoff.failures.keys(),
+                             [('repo2', 'export', 'b1')])
+            self.exp.exportgit.reset_mock()
+            self.exp.exportBranches('repo2', self.Git)
+            self.exp.exportgit.assert_called_once_with(
+                'repo2', self.Git, mock.ANY, 'master', 'export-master')
+            self.ctx.backoff.retry('repo2')
+            self.exp.exportgit.side_effect = None
+            self.exp.exportBranches('repo2', self.Git)
+            self.assertEqual(self.ctx.backoff.failures, {})
 
     @mock.patch('bigitr.gitexport.Exporter.assertNoCVSMetaData')
     @mock.patch('bigitr.gitexport.Exporter.calculateFileSets')
@@ -78,7 +99,9 @@ class GitExportTest(testutils.TestCase):
         gGM.return_value = 'message'
         cFS.return_value = [set(('f',)), set(), set(('f',)), set(), set(), set()]
         self.CVS.branch = 'b1'
+        self.ctx.pollrate = mock.Mock()
         self.exp.exportgit('repo2', self.Git, self.CVS, 'b1', 'export-b1')
+        self.ctx.pollrate.changed.assert_called_once_with('repo2')
         cG.assert_called_with('repo2', self.Git, '/'.join((self.ctx.getGitDir(), 'repo2')))
         pGC.assert_called_with('repo2', self.Git, 'b1')
         gGM.assert_called_with(self.Git, pGC.return_value,
@@ -158,6 +181,7 @@ class GitExportTest(testutils.TestCase):
                 self.Git.clone.assert_called_once_with('git@host:repo')
                 cd.assert_has_calls([mock.call('/gitdir'),
                                      mock.call('/gitdir/repo')])
+                self.assertEqual(self.Git.tuneClone.call_count, 0)
 
     def test_cloneGitPopulated(self):
         with mock.patch('os.chdir') as cd:
@@ -166,6 +190,7 @@ class GitExportTest(testutils.TestCase):
                 self.exp.cloneGit('repo', self.Git, '/gitdir/repo')
                 self.Git.clone.assert_not_called()
                 cd.assert_called_once_with('/gitdir/repo')
+                self.Git.tuneClone.assert_called_once_with()
 
     def test_checkoutCVS(self):
         with mock.patch('os.makedirs') as md:
@@ -215,6 +240,7 @@ class GitExportTest(testutils.TestCase):
     def test_prepareGitClone(self, cd, rR, tb):
         bi = ['b1', 'master']
         self.Git.branches.return_value = bi
+        self.Git.isPushDeferred.return_value = False
         bo = self.exp.prepareGitClone('repo', self.Git, 'b1')
         self.assertEqual(bi, bo)
         self.Git.pristine.assert_called_once_with()
@@ -223,6 +249,13 @@ class GitExportTest(testutils.TestCase):
         self.Git.reset.assert_called_once_with('origin/b1')
         util.removeRecursive.assert_not_called()
         os.chdir.assert_not_called()
+        self.Git.pushDeferred.assert_not_called()
+
+        # commits waiting to be pushed must not be reset away
+        self.Git.isPushDeferred.return_value = True
+        self.exp.prepareGitClone('repo', self.Git, 'b1')
+        self.Git.isPushDeferred.assert_called_with('b1')
+        self.Git.pushDeferred.assert_called_once_with()
 
     def test_calculateFileSetsEmpty(self):
         self.CVS.listContentFiles.return_value = []
@@ -246,6 +279,20 @@ class GitExportTest(testutils.TestCase):
         self.assertEqual(DD, set())
         self.assertEqual(AD, set())
 
+    def test_calculateFileSetsPrune(self):
+        self.CVS.listContentFiles.return_value = []
+        self.Git.listContentFiles.return_value = ['a/b/c', 'd']
+        with mock.patch('bigitr.ignore.IgnoreTree.prune') as P:
+            P.return_value = True
+            self.exp.calculateFileSets(self.CVS, self.Git)
+            prune = self.CVS.listContentFiles.call_args[1]['prune']
+            # directories containing Git content are always walked
+            for d in ('a', 'a/b', 'd'):
+                self.assertFalse(prune(d))
+            P.assert_not_called()
+            self.assertTrue(prune('a/e'))
+            P.assert_called_once_with('a/e')
+
     def test_calculateFileSetsNewDirectory(self):
         self.CVS.listContentFiles.return_value = ['a/b', 'a/c']
         self.Git.listContentFiles.return_value = ['a/b', 'a/c', 'b/a']
@@ -20,7 +20,7 @@ from StringIO import StringIO
 import tempfile
 import testutils
 
-from bigitr import gitmerge, context
+from bigitr import backoff, gitmerge, context
 
 class GitMergeTest(testutils.TestCase):
     def setUp(self):
@@ -122,6 +122,21 @@ class GitMergeTest(testutils.TestCase):
             mb.side_effect = lambda x, y, z: raiseError()
             self.assertRaises(RuntimeError, self.mrg.mergeBranches, 'repo2', Git)
             mb.assert_called_once_with('repo2', mock.ANY, 'cvs-b1')
+            Git.markDirty.assert_called_once_with()
+
+    def test_mergeBranchesBackoff(self):
+        self.ctx.backoff = backoff.Backoff(60, 3600)
+        Git = mock.Mock()
+        with mock.patch('bigitr.gitmerge.Merger.mergeBranch') as mb:
+            mb.side_effect = lambda x, y, z: 1/0
+            self.assertRaises(ZeroDivisionError,
+                              self.mrg.mergeBranches, 'repo2', Git)
+            self.assertEqual(self.ctx.backoff.failures.keys(),
+                             [('repo2', 'merge', 'cvs-b1')])
+            mb.reset_mock()
+            mb.side_effect = None
+            self.mrg.mergeBranches('repo2', Git)
+            mb.assert_called_once_with('repo2', Git, 'cvs-b2')
 
     def test_mergeBranch(self):
         Git = mock.Mock()
@@ -47,32 +47,162 @@ class TestIgnore(testutils.TestCase):
         self.assertEquals(i.ignores, ['*.o', '/path/to/foo'])
         self.assertEquals(i.fileName, os.path.basename(self.ignorefile))
 
-    @mock.patch('os.write')
-    def test_match(self, write):
+    def test_init_blank(self):
+        file(self.ignorefile, 'w').write('*.o\n\n  \n')
         i = ignore.Ignore(self.log, self.ignorefile)
-        self.assertEquals(i.match('*.o', ['foo.c', 'foo.o']),
-            set(('foo.o',)))
-        write.assert_called_once_with(mock.ANY,
+        self.assertEquals(i.ignores, ['*.o'])
+        self.assertEquals(i.match('foo'), None)
+
+    def test_compile(self):
+        file(self.ignorefile, 'w').write(
+            'core\n*.o\n*.tar.gz\n/path/to/foo\n/path/*.c\n*~\n')
+        i = ignore.Ignore(self.log, self.ignorefile)
+        self.assertEquals(i.basenames, {'core': 0})
+        self.assertEquals(i.extensions, {'.o': 1})
+        self.assertEquals(i.paths, {'/path/to/foo': 3})
+        self.assertEquals([x for x, _ in i.basenameRE[1]], [2, 5])
+        self.assertEquals([x for x, _ in i.pathRE[1]], [4])
+
+    def test_match(self):
+        file(self.ignorefile, 'w').write(
+            'core\n*.o\n*.tar.gz\n/path/to/foo\n/path/*.c\n*~\n'
+            'a/*.o\n')
+        i = ignore.Ignore(self.log, self.ignorefile)
+        self.assertEquals(i.match('foo.c'), None)
+        self.assertEquals(i.match('dir/core'), 'core')
+        self.assertEquals(i.match('core.c'), None)
+        self.assertEquals(i.match('foo.o'), '*.o')
+        self.assertEquals(i.match('.o'), '*.o')
+        self.assertEquals(i.match('foo.oo'), None)
+        self.assertEquals(i.match('dir/foo.tar.gz'), '*.tar.gz')
+        self.assertEquals(i.match('/path/to/foo'), '/path/to/foo')
+        self.assertEquals(i.match('/path/to/foo/bar'), None)
+        self.assertEquals(i.match('/path/foo.c'), '/path/*.c')
+        self.assertEquals(i.match('/path/sub/foo.c'), '/path/*.c')
+        self.assertEquals(i.match('foo.c~'), '*~')
+        # the first matching pattern in the file is reported
+        self.assertEquals(i.match('a/foo.o'), '*.o')
+
+    def test_filterSingleWrite(self):
+        write = self.log.writeError
+        file(self.ignorefile, 'w').write('*.o\n')
+        i = ignore.Ignore(self.log, self.ignorefile)
+        self.assertEquals(i.filter(set(['foo.c', 'foo.o', 'bar.o'])),
+            set(('foo.c',)))
+        write.assert_called_once_with(
+            'ignore: *.o ignores file bar.o\n'
             'ignore: *.o ignores file foo.o\n')
         write.reset_mock()
-        self.assertEquals(i.match('/path/*.o', ['foo.o', '/path/foo.o']),
-            set(('/path/foo.o',)))
-        write.assert_called_once_with(mock.ANY,
-            'ignore: /path/*.o ignores file /path/foo.o\n')
+        self.assertEquals(i.filter(set(['foo.c'])), set(('foo.c',)))
+        write.assert_not_called()
+
+    def test_filterNoIgnoreFile(self):
+        i = ignore.Ignore(self.log, self.ignorefile)
+        paths = set(['foo.o'])
+        self.assertTrue(i.filter(paths) is paths)
 
     def test_filter(self):
         file(self.ignorefile, 'w').write('*.o\n/path/to/foo\n/dir/foo.o\n')
         logFile = self.logdir + '/log'
         self.log.stderr = os.open(logFile, os.O_CREAT|os.O_RDWR, 0700)
+        self.log.writeError.side_effect = lambda x: os.write(self.log.stderr, x)
         i = ignore.Ignore(self.log, self.ignorefile)
-        i.filter(['foo.c', 'foo.o',
+        self.assertEquals(i.filter(['foo.c', 'foo.o',
                   '/path/to/foo', '/path/to/bar',
                   '/dir/foo.c', '/dir/foo.o',
-        ])
+        ]), set(('foo.c', '/path/to/bar', '/dir/foo.c')))
         os.close(self.log.stderr)
         self.assertEquals(file(logFile).readlines(), [
-            'ignore: *.o ignores file foo.o\n',
             'ignore: *.o ignores file /dir/foo.o\n',
             'ignore: /path/to/foo ignores file /path/to/foo\n',
-            'ignore: /dir/foo.o ignores file /dir/foo.o\n',
+            'ignore: *.o ignores file foo.o\n',
         ])
+
+    def test_directoryPatterns(self):
+        file(self.ignorefile, 'w').write('build/\nsub/out/\n*.d/\n')
+        i = ignore.Ignore(self.log, self.ignorefile)
+        self.assertEquals(i.match('build'), None)
+        self.assertEquals(i.match('build', directory=True), 'build/')
+        self.assertEquals(i.match('a/build', directory=True), 'build/')
+        self.assertEquals(i.match('sub/out', directory=True), 'sub/out/')
+        self.assertEquals(i.match('x.d', directory=True), '*.d/')
+        self.assertEquals(i.match('x.d'), None)
+
+
+class TestIgnoreTree(testutils.TestCase):
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp(suffix='.bigitr')
+        self.log = mock.Mock()
+        self.logFile = self.logdir + '/log'
+        self.log.stderr = os.open(self.logFile, os.O_CREAT|os.O_RDWR, 0700)
+        self.log.writeError.side_effect = lambda x: os.write(self.log.stderr, x)
+        self.codedir = tempfile.mkdtemp(suffix='.bigitr')
+        os.makedirs(self.codedir + '/a/b')
+        file(self.codedir + '/.gitignore', 'w').write(
+            '*.o\nbuild/\n/top\n')
+        file(self.codedir + '/a/.gitignore', 'w').write(
+            '*.tmp\nb/gen/\n/local\n')
+        self.tree = ignore.IgnoreTree(self.log, self.codedir, '.gitignore')
+
+    def tearDown(self):
+        os.close(self.log.stderr)
+        self.removeRecursive(self.logdir)
+        self.removeRecursive(self.codedir)
+
+    def logLines(self):
+        return file(self.logFile).readlines()
+
+    def test_match(self):
+        self.assertEquals(self.tree.match('x.c'), None)
+        self.assertEquals(self.tree.match('a/b/x.o'), ('.gitignore', '*.o'))
+        self.assertEquals(self.tree.match('x.tmp'), None)
+        self.assertEquals(self.tree.match('a/b/x.tmp'),
+                          ('a/.gitignore', '*.tmp'))
+        # anchored patterns apply only in their own directory
+        self.assertEquals(self.tree.match('top'), ('.gitignore', '/top'))
+        self.assertEquals(self.tree.match('a/top'), None)
+        self.assertEquals(self.tree.match('a/local'),
+                          ('a/.gitignore', '/local'))
+        self.assertEquals(self.tree.match('a/b/local'), None)
+        # files inside ignored directories
+        self.assertEquals(self.tree.match('a/build/x.c'),
+                          ('.gitignore', 'build/'))
+        self.assertEquals(self.tree.match('a/b/gen/deep/x.c'),
+                          ('a/.gitignore', 'b/gen/'))
+        self.assertEquals(self.tree.match('b/gen/x.c'), None)
+        # a file named like a directory pattern is not ignored
+        self.assertEquals(self.tree.match('build'), None)
+
+    def test_cached(self):
+        self.tree.match('a/b/x.c')
+        self.assertEquals(sorted(self.tree.ignores), ['', 'a', 'a/b'])
+        self.assertEquals(self.tree.ignores['a/b'], None)
+        self.assertEquals(sorted(self.tree.directories), ['a', 'a/b'])
+        with mock.patch('bigitr.ignore.Ignore') as I:
+            self.tree.match('a/b/y.c')
+            I.assert_not_called()
+
+    def test_prune(self):
+        self.assertFalse(self.tree.prune('a'))
+        self.assertTrue(self.tree.prune('a/build'))
+        self.assertTrue(self.tree.prune('a/build/sub'))
+        self.assertEquals(self.logLines(), [
+            '.gitignore: build/ ignores directory a/build\n',
+            '.gitignore: build/ ignores directory a/build/sub\n',
+        ])
+
+    def test_filter(self):
+        self.assertEquals(self.tree.filter(set(
+            ['x.c', 'x.o', 'a/x.tmp', 'a/build/x.c', 'a/b/x.c'])),
+            set(('x.c', 'a/b/x.c')))
+        self.assertEquals(self.logLines(), [
+            '.gitignore: build/ ignores file a/build/x.c\n',
+            'a/.gitignore: *.tmp ignores file a/x.tmp\n',
+            '.gitignore: *.o ignores file x.o\n',
+        ])
+
+    def test_noIgnoreFiles(self):
+        tree = ignore.IgnoreTree(self.log, self.logdir, '.cvsignore')
+        self.assertEquals(tree.filter(set(['a/b.o', 'c'])),
+                          set(['a/b.o', 'c']))
+        self.assertEquals(self.logLines(), [])
@@ -15,11 +15,15 @@
 #
 
 from cStringIO import StringIO
+import gzip
+import mock
 import os
+import tarfile
 import tempfile
+import time
 import testutils
 
-from bigitr import log, context
+from bigitr import appconfig, log, context
 
 class TestLog(testutils.TestCase):
     def setUp(self):
@@ -40,40 +44,67 @@ logdir = %s''' %self.logdir)
     def test_Empty(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
+        # compressed logs are created only when written
+        self.assertEqual(os.listdir(thislog), [])
+
+    def test_EmptyNoCompress(self):
+        self.ctx._ac.set('global', 'compresslogs', 'false')
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.close()
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         for filename in files:
             self.assertEqual(os.stat('/'.join((thislog, filename))).st_size, 0)
         self.assertEqual(len(files), 2)
 
     def test_writeError(self):
+        self.ctx._ac.set('global', 'compresslogs', 'false')
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
         l.writeError('this is a test\n')
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         err = [x for x in files if x.endswith('.err')][0]
         self.assertTrue('this is a test\n' in
-                        open('/'.join((self.logdir, 'repo2', err))).read())
+                        open('/'.join((thislog, err))).read())
         l.close()
 
+    def test_writeCompressed(self):
+        self.ctx._ac.set('global', 'compresslevel', '1')
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        self.assertEqual(l.compressLevel, 1)
+        self.assertEqual(l.stdout, None)
+        l.writeOutput('out\n')
+        l.markStart()
+        l.writeOutput('more out\n')
+        l.writeError('err\n')
+        l.markStop()
+        l.writeOutput('after\n')
+        self.assertEqual(l.lastOutput(), ('more out\n', 'err\n'))
+        self.assertEqual(l.lastError(), 'err\n')
+        with mock.patch('bigitr.mail.Email.send') as send:
+            l.close()
+            send.assert_called_once_with(l.thislog, l.thiserr)
+        self.assertEqual(gzip.GzipFile(l.thislog).read(),
+                         'out\nmore out\nafter\n')
+        self.assertEqual(gzip.GzipFile(l.thiserr).read(), 'err\n')
+        self.assertEqual(os.stat(l.thiserr).st_mode & 0777, 0700)
+
     def test_OutputNoErrors(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
-        os.write(l.stdout, 'this is a test\n')
+        l.writeOutput('this is a test\n')
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len([x for x in files if x.endswith('.log.gz')]), 1)
-        self.assertEqual(len([x for x in files if x.endswith('.err')]), 1)
-        self.assertEqual(len(files), 2)
-        sizes = set(os.stat('/'.join((thislog, x))).st_size for x in files)
-        self.assertEqual(len(sizes), 2)
+        self.assertEqual(len(files), 1)
 
     def test_ErrorAndStandardOutput(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
-        os.write(l.stdout, 'this is a test of standard output\n')
-        os.write(l.stderr, 'this is a test of error output\n')
+        l.writeOutput('this is a test of standard output\n')
+        l.writeError('this is a test of error output\n')
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len([x for x in files if x.endswith('.err.gz')]), 1)
         self.assertEqual(len([x for x in files if x.endswith('.log.gz')]), 1)
@@ -84,10 +115,10 @@ logdir = %s''' %self.logdir)
     def test_ErrorAndStandardOutputNoCompress(self):
         self.ctx._ac.set('global', 'compresslogs', 'false')
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
-        os.write(l.stdout, 'this is a test of standard output\n')
-        os.write(l.stderr, 'this is a test of error output\n')
+        l.writeOutput('this is a test of standard output\n')
+        l.writeError('this is a test of error output\n')
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len([x for x in files if x.endswith('.gz')]), 0)
         self.assertEqual(len([x for x in files if x.endswith('.log')]), 1)
@@ -98,24 +129,260 @@ logdir = %s''' %self.logdir)
 
     def test_ErrorOutput(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
-        os.write(l.stderr, 'this is a test\n')
+        l.writeError('this is a test\n')
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len([x for x in files if x.endswith('.err.gz')]), 1)
-        self.assertEqual(len([x for x in files if x.endswith('.log')]), 1)
-        self.assertEqual(len(files), 2)
-        sizes = set(os.stat('/'.join((thislog, x))).st_size for x in files)
-        self.assertEqual(len(sizes), 2)
+        self.assertEqual(len(files), 1)
 
     def test_LogCache(self):
         c = log.LogCache(self.ctx)
         l1 = c['Path/To/Git/repo1']
         l2 = c['Path/To/Git/repo2']
-        self.assertEqual(os.path.basename(os.path.dirname(l1.thislog)),
-                         'repo1')
-        self.assertEqual(os.path.basename(os.path.dirname(l2.thislog)),
-                         'repo2')
+        self.assertTrue(l1.thislog.startswith(self.logdir + '/repo1/'))
+        self.assertTrue(l2.thislog.startswith(self.logdir + '/repo2/'))
         self.assertEqual(len(c), 2)
         l1.close()
         self.assertEqual(len(c), 1)
+
+    def test_sharded(self):
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        day = time.strptime(os.path.basename(l.thislog)[:8], '%Y%m%d')
+        self.assertEqual(os.path.dirname(l.thislog), '/'.join(
+            (self.logdir, 'repo2', time.strftime('%Y/%m/%d', day))))
+        l.close()
+
+
+    def test_lastOutputFromMemory(self):
+        self.ctx._ac.set('global', 'compresslogs', 'false')
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.markStart()
+        l.writeOutput('out\n')
+        l.writeError('err\n')
+        l.markStop()
+        os.remove(l.thislog)
+        os.remove(l.thiserr)
+        self.assertEqual(l.lastOutput(), ('out\n', 'err\n'))
+        self.assertEqual(l.lastError(), 'err\n')
+        l.writeError('later\n')
+        self.assertEqual(l.lastError(), 'err\n')
+        with mock.patch('bigitr.mail.Email.send'):
+            l.close()
+
+    @mock.patch('bigitr.log.TAIL_LIMIT', 4)
+    def test_lastOutputBounded(self):
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.markStart()
+        l.writeOutput('12345678')
+        l.markStop()
+        self.assertEqual(l.lastOutput(), ('[4 bytes omitted]\n5678', ''))
+        l.close()
+
+    def test_lastCommand(self):
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        self.assertEqual(l.lastCommand, (None, None))
+        l.markStart('git fetch --all')
+        self.assertEqual(l.lastCommand, (None, None))
+        l.markStop(128)
+        self.assertEqual(l.lastCommand, ('git fetch --all', 128))
+        l.close()
+
+    def test_commandMetrics(self):
+        self.ctx.metrics = mock.Mock()
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.markStart()
+        l.markStop(0)
+        self.ctx.metrics.command.assert_not_called()
+        l.markStart('git fetch --all')
+        l.markStop(0)
+        self.ctx.metrics.command.assert_called_once_with(
+            'Path/To/Git/repo2', 'git fetch --all')
+        l.close()
+
+    @mock.patch('time.time')
+    def test_commandProfiler(self, t):
+        self.ctx.profiler = mock.Mock()
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.markStart()
+        l.markStop(0)
+        self.ctx.profiler.command.assert_not_called()
+        t.side_effect = [100, 102.5]
+        l.markStart('git fetch --all')
+        l.markStop(0)
+        self.ctx.profiler.command.assert_called_once_with(
+            'Path/To/Git/repo2', 'git fetch --all', 2.5)
+        l.close()
+
+    def test_mailLastOutput(self):
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.markStart('git fetch --all')
+        l.writeOutput('out\n')
+        l.writeError('err\n')
+        l.markStop(128)
+        with mock.patch.object(self.ctx, 'mails') as mails:
+            l.mailLastOutput('Unexpected exit code 128')
+            m = mails['Path/To/Git/repo2']
+            m.addOutput.assert_called_once_with(
+                'Unexpected exit code 128', 'out\n', 'err\n')
+            m.addFailure.assert_called_once_with(
+                'git fetch --all', 128, 'err\n')
+        l.close()
+
+    def test_closeDigest(self):
+        self.ctx.digest = mock.Mock()
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.writeError('err\n')
+        with mock.patch.object(self.ctx, 'mails') as mails:
+            m = mails['Path/To/Git/repo2']
+            m.failures = [('false', 1, 'err\n')]
+            l.close()
+            m.addToDigest.assert_called_once_with(
+                self.ctx.digest, (l.thislog, l.thiserr))
+            m.send.assert_not_called()
+
+    def test_closeDigestNoFailures(self):
+        self.ctx.digest = mock.Mock()
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        l.writeError('err\n')
+        with mock.patch('bigitr.mail.Email.send') as send:
+            l.close()
+            send.assert_called_once_with(l.thislog, l.thiserr)
+
+
+class TestLogRetention(testutils.TestCase):
+    # 2014-03-10 12:00 local time
+    now = time.mktime((2014, 3, 10, 12, 0, 0, 0, 0, -1))
+
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp(suffix='.bigitr')
+        self.repoLogDir = self.logdir + '/repo'
+        os.makedirs(self.repoLogDir)
+        self.cfg = appconfig.AppConfig(StringIO(
+            '[global]\nlogdir = %s\n' %self.logdir))
+
+    def tearDown(self):
+        self.removeRecursive(self.logdir)
+
+    def makeRun(self, when, size=10, legacy=False):
+        t = time.localtime(when)
+        d = self.repoLogDir
+        if not legacy:
+            d = '/'.join((d, time.strftime('%Y/%m/%d', t)))
+        if not os.path.exists(d):
+            os.makedirs(d)
+        base = '/'.join((d, time.strftime('%Y%m%d-%H:%M:%S', t)))
+        for name in (base + '.log.gz', base + '.err.gz'):
+            file(name, 'w').write('x' * size)
+            os.utime(name, (when, when))
+        return base
+
+    def listLogs(self):
+        return sorted(x[len(self.repoLogDir) + 1:]
+                      for x in self.walk(self.repoLogDir))
+
+    @staticmethod
+    def walk(path):
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                yield '/'.join((root, f))
+
+    def retention(self, **options):
+        for key, value in options.items():
+            self.cfg.set('global', key, value)
+        return log.LogRetention(self.cfg)
+
+    def test_inactive(self):
+        r = self.retention()
+        self.assertFalse(r.active())
+        self.assertEqual(r.repositoryLogDirs(), [self.repoLogDir])
+        self.makeRun(self.now - 86400 * 400)
+        self.assertEqual(r.clean(self.repoLogDir, self.now), 0)
+        self.assertEqual(len(self.listLogs()), 2)
+
+    def test_maxAge(self):
+        r = self.retention(logmaxage='1h')
+        self.assertTrue(r.active())
+        self.makeRun(self.now - 7200)
+        self.makeRun(self.now - 60)
+        self.assertEqual(r.clean(self.repoLogDir, self.now), 2)
+        self.assertEqual(self.listLogs(), [
+            '2014/03/10/20140310-11:59:00.err.gz',
+            '2014/03/10/20140310-11:59:00.log.gz'])
+
+    def test_maxRuns(self):
+        r = self.retention(logmaxruns='2')
+        for i in range(4):
+            self.makeRun(self.now - 86400 * i)
+        self.assertEqual(r.clean(self.repoLogDir, self.now), 4)
+        self.assertEqual(self.listLogs(), [
+            '2014/03/09/20140309-12:00:00.err.gz',
+            '2014/03/09/20140309-12:00:00.log.gz',
+            '2014/03/10/20140310-12:00:00.err.gz',
+            '2014/03/10/20140310-12:00:00.log.gz'])
+        # emptied day directories are removed
+        self.assertEqual(sorted(os.listdir(self.repoLogDir + '/2014/03')),
+                         ['09', '10'])
+
+    def test_maxBytes(self):
+        r = self.retention(logmaxbytes='50')
+        for i in range(4):
+            self.makeRun(self.now - 60 * i, size=10)
+        r.clean(self.repoLogDir, self.now)
+        self.assertEqual(len(self.listLogs()), 4)
+
+    def test_shardLegacy(self):
+        r = self.retention(logmaxruns='10')
+        self.makeRun(self.now - 86400, legacy=True)
+        r.clean(self.repoLogDir, self.now)
+        self.assertEqual(self.listLogs(), [
+            '2014/03/09/20140309-12:00:00.err.gz',
+            '2014/03/09/20140309-12:00:00.log.gz'])
+
+    def test_archive(self):
+        r = self.retention(logarchive='true', logmaxruns='3')
+        self.makeRun(self.now - 86400 - 60)
+        self.makeRun(self.now - 86400)
+        self.makeRun(self.now)
+        self.assertEqual(r.clean(self.repoLogDir, self.now), 0)
+        self.assertEqual(self.listLogs(), [
+            '2014/03/09-2.tar',
+            '2014/03/10/20140310-12:00:00.err.gz',
+            '2014/03/10/20140310-12:00:00.log.gz'])
+        archive = self.repoLogDir + '/2014/03/09-2.tar'
+        self.assertEqual(os.stat(archive).st_mtime, self.now - 86400)
+        self.assertEqual(sorted(tarfile.open(archive).getnames()), [
+            '20140309-11:59:00.err.gz', '20140309-11:59:00.log.gz',
+            '20140309-12:00:00.err.gz', '20140309-12:00:00.log.gz'])
+
+        # a late run for an archived day is added to its archive, and
+        # archived runs count toward the limits
+        self.makeRun(self.now - 86400 + 60)
+        self.assertEqual(r.clean(self.repoLogDir, self.now), 1)
+        self.assertEqual(self.listLogs(), [
+            '2014/03/10/20140310-12:00:00.err.gz',
+            '2014/03/10/20140310-12:00:00.log.gz'])
+
+
+class TestRingBuffer(testutils.TestCase):
+    def test_underLimit(self):
+        r = log.RingBuffer(10)
+        self.assertEqual(r.getvalue(), '')
+        r.write('abc')
+        r.write('def')
+        self.assertEqual(r.getvalue(), 'abcdef')
+        self.assertEqual(r.omitted(), 0)
+
+    def test_overLimit(self):
+        r = log.RingBuffer(4)
+        r.write('abc')
+        r.write('def')
+        r.write('g')
+        # whole chunks are dropped as soon as they are not needed
+        self.assertEqual(list(r.chunks), ['def', 'g'])
+        self.assertEqual(r.getvalue(), '[3 bytes omitted]\ndefg')
+        r.write('hi')
+        self.assertEqual(r.getvalue(), '[5 bytes omitted]\nfghi')
+        self.assertEqual(r.value(), 'fghi')
+        self.assertEqual(r.omitted(), 5)
+
@@ -17,11 +17,14 @@
 from cStringIO import StringIO
 
 import asyncore
+import gzip
 import mock
 import os
 import signal
 import smtpd
+import socket
 import tempfile
+import time
 
 import testutils
 
@@ -57,6 +60,20 @@ email = re@cip1 re@cip2
         if not self.pid:
             FakeSMTPServer(self.logdir, ('localhost', 16294), ('localhost', 0))
             asyncore.loop()
+        # wait for the server to listen before talking to it
+        for i in range(100):
+            try:
+                socket.create_connection(('localhost', 16294)).close()
+                return
+            except socket.error:
+                time.sleep(0.05)
+
+    def writeLogs(self, out='all\noutput\n', err='all\nerrors\n'):
+        logName = self.logdir + '/all.log'
+        errName = self.logdir + '/all.err'
+        file(logName, 'w').write(out)
+        file(errName, 'w').write(err)
+        return logName, errName
 
     def tearDown(self):
         if self.pid:
@@ -99,7 +116,7 @@ email = re@cip1 re@cip2
         self.assertFalse('filename="all_output.txt"' in s)
 
         with mock.patch('bigitr.mail.Email._send'):
-            m.send('all\noutput', 'all\nerrors')
+            m.send(*self.writeLogs())
             self.assertEqual(len(m.msg.get_payload()), 5)
             s = m.msg.as_string()
             self.assertTrue('filename="all_errors.txt"' in s)
@@ -110,7 +127,7 @@ email = re@cip1 re@cip2
             server = s.return_value
             m = self.ctx.mails['repo1']
             self.assertEqual(self.ctx.mails.keys(), ['repo1'])
-            m.send('all\noutput', 'all\nerrors')
+            m.send(*self.writeLogs())
             server.sendmail.assert_not_called()
             server.quit.assert_not_called()
             self.assertEqual(self.ctx.mails.keys(), [])
@@ -121,19 +138,108 @@ email = re@cip1 re@cip2
             m = self.ctx.mails['repo1']
             self.assertEqual(self.ctx.mails.keys(), ['repo1'])
             m.addOutput('badcommand', 'bad\noutput', 'bad\nerrors')
-            m.send('all\noutput', 'all\nerrors')
+            m.send(*self.writeLogs())
             server.sendmail.assert_called_with(
                 'send@er', ['re@cip1', 're@cip2'], mock.ANY)
             server.quit.assert_called_with()
             self.assertEqual(self.ctx.mails.keys(), [])
 
+    def test__sendSpool(self):
+        with mock.patch('smtplib.SMTP') as s:
+            self.ctx.spool = mock.Mock()
+            m = self.ctx.mails['repo1']
+            m.addOutput('badcommand', 'bad\noutput', 'bad\nerrors')
+            m.send(*self.writeLogs())
+            s.assert_not_called()
+            self.ctx.spool.add.assert_called_once_with(
+                'localhost:16294', 'send@er', ['re@cip1', 're@cip2'],
+                mock.ANY)
+            msg = self.ctx.spool.add.call_args[0][3]
+            self.assertTrue('\n\nbad\nerrors\n' in msg)
+
+    def test_truncate(self):
+        self.assertEqual(mail.truncate(StringIO('0123456789'), 10),
+                         '0123456789')
+        self.assertEqual(mail.truncate(StringIO('0123456789'), 4),
+                         '01\n[6 bytes omitted]\n89')
+        self.assertEqual(mail.truncate(StringIO('0123456789'), 5),
+                         '01\n[5 bytes omitted]\n789')
+        self.assertEqual(mail.truncate(StringIO(''), 4), '')
+        with mock.patch('bigitr.mail.CHUNK', 3):
+            self.assertEqual(mail.truncate(StringIO('0123456789' * 10), 6),
+                             '012\n[94 bytes omitted]\n789')
+
+    def test_addAttachmentTruncated(self):
+        self.ctx._ac.set('global', 'mailmaxbytes', '1k')
+        m = self.ctx.mails['repo1']
+        m.addAttachment('a' * 1024, 'fits')
+        m.addAttachment('b' * 1000 + 'c' * 1000, 'cut')
+        fits, cut = m.msg.get_payload()
+        self.assertEqual(fits.get_payload(), 'a' * 1024)
+        self.assertEqual(cut.get_payload(),
+                         'b' * 512 + '\n[976 bytes omitted]\n' + 'c' * 512)
+
+    def test_addAttachmentCompressed(self):
+        m = self.ctx.mails['repo1']
+        text = 'x' * (mail.COMPRESS_THRESHOLD + 1)
+        m.addAttachment(text, 'big output')
+        m.addAttachment(text[1:], 'small output')
+        big, small = m.msg.get_payload()
+        self.assertEqual(big.get_content_type(), 'application/gzip')
+        self.assertEqual(big.get_filename(), 'big_output.txt.gz')
+        self.assertEqual(
+            gzip.GzipFile(fileobj=StringIO(big.get_payload(decode=True))
+                          ).read(), text)
+        self.assertEqual(small.get_content_type(), 'text/plain')
+        self.assertEqual(small.get_filename(), 'small_output.txt')
+
+    def test_addLogAttachment(self):
+        self.ctx._ac.set('global', 'mailmaxbytes', '10')
+        m = self.ctx.mails['repo1']
+        logName = self.logdir + '/run.log.gz'
+        gzo = gzip.GzipFile(logName, 'wb')
+        gzo.write('0123456789' * 100)
+        gzo.close()
+        m.addLogAttachment(logName, 'all output')
+        m.addLogAttachment(self.logdir + '/missing.err', 'all errors')
+        out, err = m.msg.get_payload()
+        self.assertEqual(out.get_payload(),
+                         '01234\n[990 bytes omitted]\n56789')
+        self.assertEqual(err.get_payload(), '')
+
+    @mock.patch('bigitr.mail.Email.addLogAttachment')
+    def test_sendStreamsLogs(self, addLogAttachment):
+        m = self.ctx.mails['repo1']
+        m.addAttachment('e', 'error')
+        with mock.patch('bigitr.mail.Email._send'):
+            m.send('/log', '/err')
+        self.assertEqual(addLogAttachment.call_args_list, [
+            mock.call('/err', 'all errors'),
+            mock.call('/log', 'all output')])
+
+    def test_addToDigest(self):
+        m = self.ctx.mails['repo1']
+        m.addFailure('false', 1, 'err\n')
+        self.assertEqual(m.failures, [('false', 1, 'err\n')])
+        d = mock.Mock()
+        m.addToDigest(d, ('a.log', 'a.err'))
+        d.record.assert_called_once_with(
+            'localhost:16294', 'send@er', ['re@cip1', 're@cip2'], 'repo1',
+            [('false', 1, 'err\n')], ('a.log', 'a.err'))
+        self.assertEqual(self.ctx.mails.keys(), [])
+
+    def test_addFailureNoRecipient(self):
+        m = self.ctx.mails['repo2']
+        m.addFailure('false', 1, 'err\n')
+        self.assertEqual(m.failures, [])
+
     def test__send_through(self):
         self.startSendmail()
         msgName = self.logdir + '/data'
         self.assertFalse(os.path.exists(msgName))
         m = self.ctx.mails['repo1']
         m.addOutput('badcommand', 'bad\noutput', 'bad\nerrors')
-        m.send('all\noutput', 'all\nerrors')
+        m.send(*self.writeLogs())
         self.assertTrue(os.path.exists(msgName))
         msg = file(msgName).read()
         self.assertTrue('\nSubject: repo1: bigitr error report\n' in msg)
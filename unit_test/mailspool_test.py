@@ -0,0 +1,263 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import asyncore
+import mock
+import os
+import signal
+import smtpd
+import smtplib
+import socket
+import tempfile
+import time
+
+import testutils
+
+from bigitr import mailspool
+
+PORT = 16295
+SMARTHOST = 'localhost:%d' %PORT
+
+class CountingSMTPServer(smtpd.SMTPServer):
+    'stores each message and the number of connections accepted'
+    def __init__(self, dir, *args, **kwargs):
+        self.basedir = dir
+        self.connections = 0
+        self.messages = 0
+        smtpd.SMTPServer.__init__(self, *args, **kwargs)
+
+    def handle_accept(self):
+        self.connections += 1
+        file(self.basedir + '/connections', 'w').write(
+            str(self.connections))
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.messages += 1
+        file('%s/message%d' %(self.basedir, self.messages), 'w').write(data)
+
+
+class TestSpool(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.spool = mailspool.Spool(self.dir + '/spool')
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def test_init(self):
+        self.assertTrue(os.path.isdir(self.dir + '/spool'))
+        self.assertTrue(os.path.isdir(self.dir + '/spool/failed'))
+        self.assertEqual(self.spool.entries(), [])
+        self.assertFalse(self.spool.queued.isSet())
+
+    def test_add(self):
+        name = self.spool.add('smarthost', 'from@here', ('to@there',), 'msg')
+        self.assertTrue(self.spool.queued.isSet())
+        self.assertEqual(self.spool.entries(), [name])
+        self.assertEqual(self.spool.load(name),
+                         ('smarthost', 'from@here', ['to@there'], 'msg'))
+        self.assertFalse(os.path.exists(name + '.tmp'))
+
+    def test_entriesOrdered(self):
+        names = [self.spool.add('s', 'f', ['t'], str(i)) for i in range(3)]
+        file(self.dir + '/spool/partial.tmp', 'w')
+        self.assertEqual(self.spool.entries(), names)
+
+    def test_removeAndFail(self):
+        one = self.spool.add('s', 'f', ['t'], '1')
+        two = self.spool.add('s', 'f', ['t'], '2')
+        self.spool.remove(one)
+        self.spool.fail(two)
+        self.assertEqual(self.spool.entries(), [])
+        self.assertEqual(os.listdir(self.dir + '/spool/failed'),
+                         [os.path.basename(two)])
+
+
+class TestSender(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.spool = mailspool.Spool(self.dir + '/spool')
+        self.sender = mailspool.Sender(self.spool)
+        self.pid = None
+
+    def tearDown(self):
+        self.sender.close()
+        if self.pid:
+            os.kill(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+        self.removeRecursive(self.dir)
+
+    def startServer(self):
+        self.pid = os.fork()
+        if not self.pid:
+            CountingSMTPServer(self.dir, ('localhost', PORT),
+                               ('localhost', 0))
+            asyncore.loop()
+        for i in range(100):
+            try:
+                socket.create_connection(('localhost', PORT)).close()
+                break
+            except socket.error:
+                time.sleep(0.05)
+        # the probe above counts as a connection
+        for i in range(100):
+            if os.path.exists(self.dir + '/connections'):
+                break
+            time.sleep(0.05)
+        self.probes = self.connections()
+
+    def connections(self):
+        return int(file(self.dir + '/connections').read())
+
+    def waitForMessages(self, count):
+        name = '%s/message%d' %(self.dir, count)
+        for i in range(100):
+            if os.path.exists(name):
+                return
+            time.sleep(0.05)
+
+    def test_deliverReusesSession(self):
+        self.startServer()
+        for i in range(5):
+            self.spool.add(SMARTHOST, 'f@here', ['t@there'],
+                           'Subject: %d\n\nbody %d\n' %(i, i))
+        self.assertEqual(self.sender.deliver(), None)
+        self.assertEqual(self.spool.entries(), [])
+        self.waitForMessages(5)
+        for i in range(5):
+            msg = file('%s/message%d' %(self.dir, i + 1)).read()
+            self.assertTrue('body %d' %i in msg)
+        self.assertEqual(self.connections() - self.probes, 1)
+        self.assertEqual(self.sender.sessions.keys(), [SMARTHOST])
+
+        # a later pass still uses the same session
+        self.spool.add(SMARTHOST, 'f@here', ['t@there'], 'Subject: 5\n\n')
+        self.sender.deliver()
+        self.waitForMessages(6)
+        self.assertEqual(self.connections() - self.probes, 1)
+
+    def test_deliverUnreachable(self):
+        name = self.spool.add(SMARTHOST, 'f@here', ['t@there'], 'msg')
+        self.assertEqual(self.sender.deliver(now=1000), 1001)
+        self.assertEqual(self.spool.entries(), [name])
+        self.assertEqual(self.sender.sessions, {})
+        self.assertEqual(self.sender.backoff, {SMARTHOST: (1001, 1)})
+
+        # deferred until the backoff expires
+        with mock.patch('smtplib.SMTP') as S:
+            self.assertEqual(self.sender.deliver(now=1000.5), 1001)
+            S.assert_not_called()
+        self.assertEqual(self.sender.deliver(now=1001), 1003)
+        self.assertEqual(self.sender.deliver(now=1003), 1007)
+        self.sender.backoff[SMARTHOST] = (2000, 500)
+        self.assertEqual(self.sender.deliver(now=2000), 2600)
+
+        # success clears the backoff
+        self.startServer()
+        self.assertEqual(self.sender.deliver(now=2600), None)
+        self.assertEqual(self.sender.backoff, {})
+        self.assertEqual(self.spool.entries(), [])
+
+    @mock.patch('smtplib.SMTP')
+    def test_deliverOtherHostNotDeferred(self, S):
+        self.spool.add('bad', 'f', ['t'], 'msg1')
+        self.spool.add('good', 'f', ['t'], 'msg2')
+        self.sender.backoff['bad'] = (1010, 10)
+        self.assertEqual(self.sender.deliver(now=1000), 1010)
+        S.assert_called_once_with('good')
+        S().sendmail.assert_called_once_with('f', ['t'], 'msg2')
+        self.assertEqual(len(self.spool.entries()), 1)
+
+    @mock.patch('smtplib.SMTP')
+    def test_deliverReconnects(self, S):
+        self.spool.add('host', 'f', ['t'], 'msg')
+        stale = mock.Mock()
+        stale.sendmail.side_effect = smtplib.SMTPServerDisconnected
+        self.sender.sessions['host'] = stale
+        self.sender.deliver(now=1000)
+        S().sendmail.assert_called_once_with('f', ['t'], 'msg')
+        self.assertEqual(self.sender.sessions, {'host': S()})
+        self.assertEqual(self.spool.entries(), [])
+
+    @mock.patch('smtplib.SMTP')
+    def test_deliverPermanentFailure(self, S):
+        name = self.spool.add('host', 'f', ['t'], 'msg')
+        S().sendmail.side_effect = smtplib.SMTPRecipientsRefused(
+            {'t': (550, 'no such user')})
+        self.assertEqual(self.sender.deliver(now=1000), None)
+        self.assertEqual(self.spool.entries(), [])
+        self.assertEqual(os.listdir(self.dir + '/spool/failed'),
+                         [os.path.basename(name)])
+
+    @mock.patch('smtplib.SMTP')
+    def test_deliverTemporaryFailure(self, S):
+        name = self.spool.add('host', 'f', ['t'], 'msg')
+        S().sendmail.side_effect = smtplib.SMTPSenderRefused(
+            451, 'try later', 'f')
+        self.assertEqual(self.sender.deliver(now=1000), 1001)
+        self.assertEqual(self.spool.entries(), [name])
+
+    def test_deliverDamaged(self):
+        file(self.dir + '/spool/damaged', 'w').write('not a pickle')
+        self.sender.deliver()
+        self.assertEqual(os.listdir(self.dir + '/spool/failed'), ['damaged'])
+
+    def test_closeIdle(self):
+        s = mock.Mock()
+        self.sender.sessions['host'] = s
+        self.sender.lastUsed['host'] = 1000
+        self.sender.closeIdle(1000 + self.sender.IDLE - 1)
+        s.quit.assert_not_called()
+        self.sender.closeIdle(1000 + self.sender.IDLE)
+        s.quit.assert_called_once_with()
+        self.assertEqual(self.sender.sessions, {})
+        self.assertEqual(self.sender.lastUsed, {})
+
+    def test_closeBrokenSession(self):
+        s = mock.Mock()
+        s.quit.side_effect = socket.error
+        self.sender.sessions['host'] = s
+        self.sender.close()
+        s.close.assert_called_once_with()
+        self.assertEqual(self.sender.sessions, {})
+
+
+class TestSenderThread(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.spool = mailspool.Spool(self.dir + '/spool')
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    @mock.patch('smtplib.SMTP')
+    def test_run(self, S):
+        t = mailspool.SenderThread(self.spool)
+        self.assertTrue(t.daemon)
+        t.start()
+        try:
+            self.spool.add('host', 'f', ['t'], 'msg')
+            for i in range(100):
+                if not self.spool.entries():
+                    break
+                time.sleep(0.01)
+            self.assertEqual(self.spool.entries(), [])
+            S().sendmail.assert_called_once_with('f', ['t'], 'msg')
+        finally:
+            t.stop(5)
+        self.assertFalse(t.isAlive())
+        S().quit.assert_called_once_with()
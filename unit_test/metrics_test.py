@@ -0,0 +1,154 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+import tempfile
+
+import testutils
+
+from bigitr import metrics
+
+class TestFunctions(testutils.TestCase):
+    @mock.patch('time.time')
+    def test_timed(self, t):
+        ctx = mock.Mock()
+        t.side_effect = [100, 102.5]
+        with metrics.timed(ctx, 'repo', 'export'):
+            pass
+        ctx.metrics.observe.assert_called_once_with('repo', 'export', 2.5)
+
+    @mock.patch('time.time')
+    def test_timedException(self, t):
+        ctx = mock.Mock()
+        t.side_effect = [100, 101]
+        def fail():
+            with metrics.timed(ctx, 'repo', 'export'):
+                raise IOError
+        self.assertRaises(IOError, fail)
+        ctx.metrics.observe.assert_called_once_with('repo', 'export', 1)
+
+    def test_timedNoMetrics(self):
+        ctx = mock.Mock()
+        ctx.metrics = None
+        with metrics.timed(ctx, 'repo', 'export'):
+            pass
+
+    def test_copied(self):
+        ctx = mock.Mock()
+        metrics.copied(ctx, 'repo', 'import', 10)
+        ctx.metrics.copy.assert_called_once_with('repo', 'import', 10)
+        ctx.metrics = None
+        metrics.copied(ctx, 'repo', 'import', 10)
+
+    def test_labels(self):
+        self.assertEqual(metrics.labels(b='x"y', a='1\\2\n'),
+                         '{a="1\\\\2\\n",b="x\\"y"}')
+
+
+class TestMetrics(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.fileName = self.dir + '/bigitr.prom'
+        self.m = metrics.Metrics(self.fileName)
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def test_observe(self):
+        self.m.observe('r', 'sync', 3)
+        self.m.observe('r', 'sync', 100)
+        self.m.observe('r', 'sync', 20000)
+        text = self.m.format()
+        name = 'bigitr_repository_duration_seconds'
+        for le, count in (('1', 0), ('5', 1), ('15', 1), ('60', 1),
+                          ('300', 2), ('14400', 2), ('+Inf', 3)):
+            self.assertTrue('%s_bucket{le="%s",phase="sync",repository="r"}'
+                            ' %d\n' %(name, le, count) in text)
+        self.assertTrue('%s_sum{phase="sync",repository="r"} 20103.000\n'
+                        %name in text)
+        self.assertTrue('%s_count{phase="sync",repository="r"} 3\n'
+                        %name in text)
+        self.assertTrue('# TYPE %s histogram\n' %name in text)
+
+    def test_runs(self):
+        self.m.startRun('r')
+        self.m.finishRun('r', now=1000)
+        self.assertEqual(self.m.lastSuccess, {'r': 1000})
+        self.assertEqual(self.m.failures, {'r': 0})
+        for now in (1100, 1200):
+            self.m.startRun('r')
+            self.m.error('r')
+            self.m.error('r')
+            self.m.finishRun('r', now=now)
+        self.assertEqual(self.m.lastSuccess, {'r': 1000})
+        self.assertEqual(self.m.failures, {'r': 2})
+        self.assertEqual(self.m.errors, {})
+        text = self.m.format()
+        self.assertTrue('bigitr_repository_last_success_timestamp_seconds'
+                        '{repository="r"} 1000.000\n' in text)
+        self.assertTrue('bigitr_repository_consecutive_failures'
+                        '{repository="r"} 2\n' in text)
+        self.m.startRun('r')
+        self.m.finishRun('r', now=1300)
+        self.assertEqual(self.m.failures, {'r': 0})
+
+    def test_countersAndGauges(self):
+        self.m.command('r', 'cvs -Q -d :pserver:h:/cvs export -r b m')
+        self.m.command('r', 'cvs -Q -d :pserver:h:/cvs export -r c m')
+        self.m.command('r', 'git fetch --all')
+        self.m.copy('r', 'import', 100)
+        self.m.copy('r', 'import', 50)
+        self.m.setBacklog(3, 10)
+        text = self.m.format()
+        self.assertTrue('bigitr_commands_total{command="cvs export",'
+                        'repository="r"} 2\n' in text)
+        self.assertTrue('bigitr_commands_total{command="git fetch",'
+                        'repository="r"} 1\n' in text)
+        self.assertTrue('bigitr_copied_bytes_total{direction="import",'
+                        'repository="r"} 150\n' in text)
+        self.assertTrue('\nbigitr_repositories 10\n' in text)
+        self.assertTrue('\nbigitr_backlog_repositories 3\n' in text)
+
+    def test_forget(self):
+        for r in ('r1', 'r2'):
+            self.m.observe(r, 'sync', 1)
+            self.m.startRun(r)
+            self.m.finishRun(r)
+            self.m.command(r, 'git fetch')
+            self.m.copy(r, 'export', 1)
+        self.m.forget(['r1'])
+        text = self.m.format()
+        self.assertFalse('"r1"' in text)
+        self.assertTrue('"r2"' in text)
+
+    def test_save(self):
+        self.m.save(now=1000)
+        self.assertTrue(os.path.exists(self.fileName))
+        self.assertFalse(os.path.exists(self.fileName + '.tmp'))
+        self.assertEqual(file(self.fileName).read(), self.m.format())
+
+        self.m.setBacklog(5, 5)
+        self.m.save(now=1000 + self.m.INTERVAL - 1)
+        self.assertTrue('backlog_repositories 0\n'
+                        in file(self.fileName).read())
+        self.m.save(now=1000 + self.m.INTERVAL - 1, force=True)
+        self.assertTrue('backlog_repositories 5\n'
+                        in file(self.fileName).read())
+        self.m.setBacklog(4, 5)
+        self.m.save(now=1000 + 2 * self.m.INTERVAL)
+        self.assertTrue('backlog_repositories 4\n'
+                        in file(self.fileName).read())
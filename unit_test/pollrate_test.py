@@ -0,0 +1,101 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+import tempfile
+
+import testutils
+
+from bigitr import pollrate
+from bigitr import util
+
+class TestFunctions(testutils.TestCase):
+    def test_changed(self):
+        ctx = mock.Mock()
+        pollrate.changed(ctx, 'repo')
+        ctx.pollrate.changed.assert_called_once_with('repo')
+        ctx.pollrate = None
+        pollrate.changed(ctx, 'repo')
+
+
+class TestPollRate(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.stateFile = self.dir + '/state'
+        self.p = pollrate.PollRate(300, 3600, self.stateFile)
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def test_interval(self):
+        self.assertEqual(self.p.interval('repo', 1000), 300)
+        self.p.changed('repo', now=1000)
+        self.assertEqual(self.p.interval('repo', 1000), 300)
+        self.assertEqual(self.p.interval('repo', 5000), 1000)
+        self.assertEqual(self.p.interval('repo', 100000), 3600)
+
+    def test_schedule(self):
+        self.assertTrue(self.p.ready('repo', 0))
+        # first seen at 1000; not yet known to change
+        self.p.finished('repo', 1000)
+        self.assertFalse(self.p.ready('repo', 1299))
+        self.assertTrue(self.p.ready('repo', 1300))
+        # dormant, so polled less and less often
+        self.p.finished('repo', 5000)
+        self.assertFalse(self.p.ready('repo', 5999))
+        self.assertTrue(self.p.ready('repo', 6000))
+        self.p.finished('repo', 100000)
+        self.assertEqual(self.p.nextPoll['repo'], 103600)
+        # a change makes it hot again
+        self.p.changed('repo', now=100010)
+        self.p.finished('repo', 103600)
+        self.assertEqual(self.p.nextPoll['repo'], 104497.5)
+        self.p.changed('repo', now=103610)
+        self.p.finished('repo', 103600)
+        self.assertEqual(self.p.nextPoll['repo'], 103900)
+
+    def test_forget(self):
+        self.p.finished('r1', 1000)
+        self.p.finished('r2', 1000)
+        self.p.forget(['r1', 'r3'])
+        self.assertEqual(self.p.nextPoll.keys(), ['r2'])
+        self.assertEqual(self.p.lastChange.keys(), ['r2'])
+        self.assertTrue(os.path.exists(self.stateFile))
+
+    def test_saveLoad(self):
+        self.p.changed('repo', now=900)
+        self.p.finished('repo', 1000)
+        self.assertFalse(os.path.exists(self.stateFile))
+        self.p.save()
+        self.assertFalse(os.path.exists(self.stateFile + '.tmp'))
+        p = pollrate.PollRate(300, 3600, self.stateFile)
+        self.assertEqual(p.lastChange, {'repo': 900})
+        self.assertEqual(p.nextPoll, {'repo': 1300})
+
+    def test_loadDamaged(self):
+        file(self.stateFile, 'w').write('garbage')
+        p = pollrate.PollRate(300, 3600, self.stateFile)
+        self.assertEqual(p.nextPoll, {})
+        p = pollrate.PollRate(300, 3600)
+        p.finished('repo', 1000)
+        p.save()
+
+    def test_loadWrongShape(self):
+        for state in (None, ({}, None), ['a', 'b'], ({}, {}, {})):
+            util.saveState(self.stateFile, pollrate.PollRate.VERSION, state)
+            p = pollrate.PollRate(300, 3600, self.stateFile)
+            self.assertEqual((p.lastChange, p.nextPoll), ({}, {}))
@@ -0,0 +1,108 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+import pstats
+import tempfile
+
+import testutils
+
+from bigitr import profiler
+
+def busy():
+    return sum(range(1000))
+
+class TestProfiler(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.ctx = mock.Mock()
+        self.ctx.profiler = profiler.Profiler(self.dir + '/prof')
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def files(self, repoName='repo'):
+        return sorted(os.listdir('/'.join((self.dir, 'prof', repoName))))
+
+    def test_noProfiler(self):
+        self.ctx.profiler = None
+        with profiler.phase(self.ctx, 'path/repo', 'sync'):
+            pass
+        self.assertFalse(os.path.exists(self.dir + '/prof'))
+
+    def test_wanted(self):
+        p = profiler.Profiler(self.dir, ['path/one', 'tw*'])
+        self.assertTrue(p.wanted('path/one'))
+        self.assertFalse(p.wanted('other/one'))
+        self.assertTrue(p.wanted('path/two'))
+        self.assertFalse(p.wanted('path/three'))
+        self.ctx.profiler = p
+        with profiler.phase(self.ctx, 'path/three', 'sync'):
+            pass
+        self.assertFalse(os.path.exists(self.dir + '/three'))
+
+    def test_phase(self):
+        with profiler.phase(self.ctx, 'path/repo', 'export'):
+            busy()
+            self.ctx.profiler.command('path/repo',
+                                      'cvs -Q -d /cvsroot commit -m x', 2.5)
+            self.ctx.profiler.command('path/repo',
+                                      'cvs -Q -d /cvsroot commit -m y', 1.5)
+            self.ctx.profiler.command('path/other', 'git fetch', 1)
+        self.assertEqual(self.ctx.profiler.stack, [])
+        files = self.files()
+        self.assertEqual(len(files), 2)
+        self.assertTrue(files[0].endswith('.export.prof'))
+        self.assertTrue(files[1].endswith('.export.txt'))
+        base = '/'.join((self.dir, 'prof', 'repo', files[0][:-5]))
+        stats = pstats.Stats(base + '.prof')
+        self.assertTrue([x for x in stats.stats if x[2] == 'busy'])
+        report = file(base + '.txt').read()
+        self.assertTrue(report.startswith(
+            'repository: path/repo\nphase: export\n'))
+        self.assertTrue('\nchild process cpu seconds: ' in report)
+        self.assertTrue('\n      2      4.000      2.500  cvs commit\n'
+                        in report)
+        self.assertFalse('git fetch' in report)
+        self.assertTrue('busy' in report)
+
+    def test_nested(self):
+        p = self.ctx.profiler
+        with profiler.phase(self.ctx, 'path/repo', 'sync'):
+            outer = p.stack[0]
+            with profiler.phase(self.ctx, 'path/repo', 'import'):
+                inner = p.stack[1]
+                self.assertEqual(outer.running, None)
+                busy()
+                p.command('path/repo', 'git fetch', 1)
+            self.assertNotEqual(outer.running, None)
+        self.assertEqual(inner.commands, {'git fetch': [1, 1, 1]})
+        self.assertEqual(outer.commands, {})
+        outerFuncs = [x[2] for x in pstats.Stats(outer.profile).stats]
+        self.assertFalse('busy' in outerFuncs)
+        files = self.files()
+        self.assertEqual([x.split('.', 1)[1] for x in files],
+                         ['import.prof', 'import.txt',
+                          'sync.prof', 'sync.txt'])
+
+    def test_exception(self):
+        def fail():
+            with profiler.phase(self.ctx, 'path/repo', 'merge'):
+                raise IOError
+        self.assertRaises(IOError, fail)
+        self.assertEqual(self.ctx.profiler.stack, [])
+        self.assertEqual(len(self.files()), 2)
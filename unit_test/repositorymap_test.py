@@ -73,6 +73,49 @@ prehook.cvs.cvs-a2 = cvsa2prehook "quoted arg"
         os.remove(self.cf)
         os.remove(self.bad)
 
+    def test_getSpecCached(self):
+        spec = self.cfg.getSpec('Path/To/Git/repository')
+        self.assertTrue(spec is self.cfg.getSpec('Path/To/Git/repository'))
+        self.assertRaises(AttributeError, setattr, spec, 'other', 1)
+        self.assertEqual(spec.cvsRoot, ':pserver:usr@servername:/path')
+        self.assertEqual(spec.hooks['prehook.git'], ('gitprehook', 'arg'))
+
+    def test_getSpecEnvironmentExpandedAtCompile(self):
+        spec = self.cfg.getSpec('Path/To/Git/repo2')
+        os.environ['TESTCVSUSER'] = 'other'
+        self.assertEqual(self.cfg.getCVSRoot('Path/To/Git/repo2'),
+                         ':pserver:usr@server2:/path')
+
+    def test_getSpecInvalidatedBySet(self):
+        spec = self.cfg.getSpec('Path/To/Git/repo2')
+        other = self.cfg.getSpec('Path/To/Git/repository')
+        self.cfg.set('Path/To/Git/repo2', 'cvs.b', 'b')
+        self.assertFalse(spec is self.cfg.getSpec('Path/To/Git/repo2'))
+        self.assertTrue(other is self.cfg.getSpec('Path/To/Git/repository'))
+        self.assertEqual(self.cfg.getImportBranchMaps('Path/To/Git/repo2'),
+                         [('b', 'cvs-b')])
+        self.cfg.remove_option('Path/To/Git/repo2', 'cvs.b')
+        self.assertEqual(self.cfg.getImportBranchMaps('Path/To/Git/repo2'),
+                         [])
+
+    def test_getSpecInvalidatedByGlobalSet(self):
+        self.cfg.getSpec('Path/To/Git/repo2')
+        self.cfg.getSpec('Path/To/Git/repository')
+        self.cfg.set('GLOBAL', 'email', 'a@b')
+        self.assertEqual(self.cfg.specs, {})
+        self.assertEqual(self.cfg.getEmail('Path/To/Git/repo2'), ['a@b'])
+
+    def test_missingRequiredOptions(self):
+        self.cfg.remove_option('GLOBAL', 'gitroot')
+        self.cfg.remove_option('GLOBAL', 'cvsroot')
+        self.cfg.remove_option('Path/To/Git/repo2', 'cvspath')
+        self.assertRaises(ConfigParser.NoOptionError,
+                          self.cfg.getGitRef, 'Path/To/Git/repo2')
+        self.assertRaises(ConfigParser.NoOptionError,
+                          self.cfg.getCVSRoot, 'Path/To/Git/repo2')
+        self.assertRaises(ConfigParser.NoOptionError,
+                          self.cfg.getCVSPath, 'Path/To/Git/repo2')
+
     def test_getGlobalFallback(self):
         self.assertEqual(self.cfg.getGlobalFallback('Path/To/Git/repository', 'gitroot'),
                          'git@host')
@@ -91,6 +134,14 @@ prehook.cvs.cvs-a2 = cvsa2prehook "quoted arg"
         self.assertEqual(self.cfg.getRepositoryName('Path/To/Git/repo2'),
             'repo2')
 
+    def test_matchesRepository(self):
+        matches = self.cfg.matchesRepository
+        self.assertTrue(matches('path/repo', 'repo'))
+        self.assertTrue(matches('path/repo', 'path/repo'))
+        self.assertTrue(matches('path/repo', 'r*'))
+        self.assertTrue(matches('path/repo', '*'))
+        self.assertFalse(matches('path/repo', 'path'))
+
     def test_getRepositoryByName(self):
         self.assertEqual(self.cfg.getRepositoryByName('Path/To/Git/repo2'),
             'Path/To/Git/repo2')
@@ -124,6 +175,38 @@ prehook.cvs.cvs-a2 = cvsa2prehook "quoted arg"
         self.assertEqual(self.cfg.getGitRef('Path/To/Git/repository'),
                          '/foo/Path/To/Git/repository')
 
+    def test_getCloneArguments(self):
+        self.assertEqual(self.cfg.getCloneArguments('Path/To/Git/repository'),
+                         [])
+        self.cfg.set('GLOBAL', 'clonefilter', 'blob:none')
+        self.cfg.set('Path/To/Git/repository', 'cloneshallowsince', '1 year ago')
+        self.assertEqual(self.cfg.getCloneArguments('Path/To/Git/repository'),
+                         ['--filter=blob:none', '--shallow-since=1 year ago'])
+        self.assertEqual(self.cfg.getCloneArguments('Path/To/Git/repo2'),
+                         ['--filter=blob:none'])
+
+    def test_getCVSMirror(self):
+        self.assertEqual(self.cfg.getCVSMirror('Path/To/Git/repository'), None)
+        self.cfg.set('GLOBAL', 'cvsmirror', '/mirror')
+        self.cfg.set('GLOBAL', 'cvsmirrorsource', 'host:/cvs')
+        self.assertEqual(self.cfg.getCVSMirror('Path/To/Git/repository'),
+                         '/mirror')
+        self.assertEqual(
+            self.cfg.getCVSMirrorSource('Path/To/Git/repository'), 'host:/cvs')
+        self.cfg.remove_option('GLOBAL', 'cvsmirrorsource')
+        self.assertRaises(ConfigParser.NoOptionError,
+            self.cfg.getCVSMirrorSource, 'Path/To/Git/repository')
+
+    def test_getDeferPush(self):
+        self.assertFalse(self.cfg.getDeferPush('Path/To/Git/repository'))
+        self.cfg.set('GLOBAL', 'deferpush', 'true')
+        self.cfg.set('Path/To/Git/repo2', 'deferpush', 'no')
+        self.assertTrue(self.cfg.getDeferPush('Path/To/Git/repository'))
+        self.assertFalse(self.cfg.getDeferPush('Path/To/Git/repo2'))
+        self.cfg.set('GLOBAL', 'deferpush', 'maybe')
+        self.assertRaises(ValueError,
+            self.cfg.getDeferPush, 'Path/To/Git/repository')
+
     def test_getCVSPath(self):
         self.assertEqual(self.cfg.getCVSPath('Path/To/Git/repository'),
                          'Path/To/CVS/directory')
@@ -168,6 +251,14 @@ prehook.cvs.cvs-a2 = cvsa2prehook "quoted arg"
                          {'cvs-a2': set(('a2', 'master')),
                           'cvs-a1': set(('a1',))})
 
+    def test_getMergeBranchMapsCopy(self):
+        m = self.cfg.getMergeBranchMaps('Path/To/Git/repository')
+        m['cvs-a1'].add('other')
+        del m['cvs-a2']
+        self.assertEqual(self.cfg.getMergeBranchMaps('Path/To/Git/repository'),
+                         {'cvs-a2': set(('a2', 'master')),
+                          'cvs-a1': set(('a1',))})
+
     def test_getMergeBranchMapsEmpty(self):
         self.assertEqual(self.cfg.getMergeBranchMaps('Path/To/Git/repo2'),
                          {})
@@ -258,3 +349,7 @@ email = foo@bar
     def test_requireSkeletonAbsolutePaths(self):
         badcfg = StringIO('[foo]\nskeleton = baz\n')
         self.assertRaises(ValueError, repositorymap.RepositoryConfig, badcfg)
+
+    def test_requireCVSMirrorAbsolutePaths(self):
+        badcfg = StringIO('[foo]\ncvsmirror = baz\n')
+        self.assertRaises(ValueError, repositorymap.RepositoryConfig, badcfg)
@@ -54,7 +54,7 @@ logdir = %s
         self.assertEqual(l.lastError(), '')
         self.assertEqual(retcode, 0)
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         for filename in files:
             filename = '/'.join((thislog, filename))
@@ -68,13 +68,13 @@ logdir = %s
 
     def test_OutputNoErrors(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
-        os.write(l.stdout, 'this is a test\n')
+        l.writeOutput('this is a test\n')
         s = shell.LoggingShell(l, 'true')
         retcode = s.finish()
         self.assertEqual(retcode, 0)
         self.assertEqual(l.lastOutput(), ('', ''))
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         for filename in files:
             fileName = '/'.join((thislog, filename))
@@ -91,14 +91,14 @@ logdir = %s
 
     def test_ErrorAndStandardOutput(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
-        os.write(l.stdout, 'this is a test of standard output\n')
+        l.writeOutput('this is a test of standard output\n')
         # warning of bad exit code will write to stderr
         s = shell.LoggingShell(l, 'false', error=False)
         retcode = s.finish()
         self.assertEqual(retcode, 1)
         self.assertEqual(l.lastOutput(), ('', ''))
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len([x for x in files if x.endswith('.err.gz')]), 1)
         self.assertEqual(len([x for x in files if x.endswith('.log.gz')]), 1)
@@ -115,7 +115,7 @@ logdir = %s
         retcode = s.finish()
         self.assertEqual(retcode, 1)
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len(files), 2)
         for filename in files:
@@ -139,6 +139,7 @@ logdir = %s
     def test_runRaiseError(self):
         l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
         self.assertRaises(shell.ErrorExitCode, shell.run, l, 'false')
+        self.assertEqual(l.lastCommand, ('false', 1))
         l.close()
         self.assertTrue(self.logdata.getvalue().startswith('\n'))
         self.logdata.truncate(0)
@@ -155,7 +156,7 @@ logdir = %s
         retcode = shell.run(l, 'false', error=False)
         self.assertEqual(retcode, 1)
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         for filename in files:
             fileName = '/'.join((thislog, filename))
@@ -174,7 +175,7 @@ logdir = %s
         self.assertEqual(output, 'foo\n')
         self.assertEqual(l.lastOutput(), ('', ''))
         l.close()
-        thislog = '/'.join((self.logdir, 'repo2'))
+        thislog = os.path.dirname(l.thislog)
         files = os.listdir(thislog)
         self.assertEqual(len(files), 2)
         for filename in files:
@@ -203,3 +204,41 @@ logdir = %s
         self.ctx.mails['Path/To/Git/repo2'].addOutput = ao
         l.mailLastOutput('broke')
         ao.assert_called_with('broke', 'bar\nbaz\n', 'foo\n')
+
+    def test_pumpLargeOutput(self):
+        # more than a pipe buffer on both streams at once
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        script = ('awk \'BEGIN { for (i = 0; i < 100000; i++) {'
+                  ' print "out"; print "err" > "/dev/stderr" } }\'')
+        retcode = shell.run(l, 'sh', '-c', script)
+        self.assertEqual(retcode, 0)
+        out, err = l.lastOutput()
+        self.assertEqual(out, 'out\n' * 100000)
+        self.assertEqual(err, 'err\n' * 100000)
+        retcode, output = shell.read(l, 'sh', '-c', script)
+        self.assertEqual(output, 'out\n' * 100000)
+        self.assertEqual(l.lastOutput(), ('', 'err\n' * 100000))
+        l.close()
+        self.assertEqual(gzip.GzipFile(l.thiserr).read().count('err\n'),
+                         200000)
+
+    def test_noCompressPiped(self):
+        self.ctx._ac.set('global', 'compresslogs', 'false')
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        retcode = shell.run(l, 'sh', '-c', 'echo out; echo err >&2')
+        self.assertEqual(retcode, 0)
+        self.assertEqual(l.lastOutput(), ('out\n', 'err\n'))
+        l.close()
+        self.assertTrue('\nout\n' in file(l.thislog).read())
+        self.assertTrue('\nerr\n' in file(l.thiserr).read())
+
+    def test_reportStatus(self):
+        self.ctx.status = mock.Mock()
+        l = log.Log(self.ctx, 'Path/To/Git/repo2', None)
+        s = shell.LoggingShell(l, 'echo', 'foo')
+        self.ctx.status.setCommand.assert_called_once_with(
+            'Path/To/Git/repo2', 'echo foo', s.pid)
+        s.finish()
+        self.ctx.status.setCommand.assert_called_with(
+            'Path/To/Git/repo2', None, None)
+        l.close()
@@ -0,0 +1,150 @@
+#
+# Copyright 2014 SAS Institute
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import os
+from cStringIO import StringIO
+import tempfile
+
+import testutils
+
+from bigitr import status
+
+class TestFunctions(testutils.TestCase):
+    def test_phase(self):
+        ctx = mock.Mock()
+        ctx.status.setPhase.return_value = 'previous'
+        with status.phase(ctx, 'repo', 'export', 'master'):
+            ctx.status.setPhase.assert_called_once_with(
+                'repo', 'export', 'master')
+            ctx.status.restorePhase.assert_not_called()
+        ctx.status.restorePhase.assert_called_once_with('repo', 'previous')
+
+    def test_phaseException(self):
+        ctx = mock.Mock()
+        def fail():
+            with status.phase(ctx, 'repo', 'hooks'):
+                raise IOError
+        self.assertRaises(IOError, fail)
+        ctx.status.restorePhase.assert_called_once_with(
+            'repo', ctx.status.setPhase.return_value)
+
+    def test_noStatus(self):
+        ctx = mock.Mock()
+        ctx.status = None
+        with status.phase(ctx, 'repo', 'export'):
+            pass
+        status.command(ctx, 'repo', 'git fetch', 1)
+
+    def test_elapsed(self):
+        self.assertEqual(status.elapsed(-1), '0s')
+        self.assertEqual(status.elapsed(59.9), '59s')
+        self.assertEqual(status.elapsed(61), '1m01s')
+        self.assertEqual(status.elapsed(3725), '1h02m05s')
+
+
+class TestStatus(testutils.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(suffix='.bigitr')
+        self.fileName = self.dir + '/status'
+        self.s = status.Status(self.fileName)
+
+    def tearDown(self):
+        self.removeRecursive(self.dir)
+
+    def job(self):
+        return status.read(self.fileName)['jobs'][0]
+
+    def test_jobs(self):
+        self.s.setState('sync')
+        self.assertEqual(status.read(self.fileName)['jobs'], [])
+        self.s.startJob('path/repo')
+        job = self.job()
+        self.assertEqual(job['repository'], 'path/repo')
+        self.assertEqual(job['pid'], os.getpid())
+        self.assertEqual(job['phase'], None)
+
+        previous = self.s.setPhase('path/repo', 'import', 'b1')
+        self.s.setCommand('path/repo', 'cvs export', 1234)
+        job = self.job()
+        self.assertEqual((job['phase'], job['branch']), ('import', 'b1'))
+        self.assertEqual((job['command'], job['pid']), ('cvs export', 1234))
+
+        inner = self.s.setPhase('path/repo', 'merge', 'master')
+        self.s.setCommand('path/repo', None, None)
+        self.assertEqual(self.job()['branch'], 'master')
+        self.s.restorePhase('path/repo', inner)
+        job = self.job()
+        self.assertEqual((job['phase'], job['branch']), ('import', 'b1'))
+        self.assertEqual((job['command'], job['pid']), (None, os.getpid()))
+        self.s.restorePhase('path/repo', previous)
+        self.assertEqual(self.job()['phase'], None)
+
+        self.s.finishJob('path/repo')
+        self.assertEqual(status.read(self.fileName)['jobs'], [])
+        # restoring after the job is finished does not recreate it
+        self.s.restorePhase('path/repo', previous)
+        self.assertEqual(self.s.jobs, {})
+
+    def test_save(self):
+        self.s.setState('sleep', 30)
+        self.assertFalse(os.path.exists(self.fileName + '.tmp'))
+        d = status.read(self.fileName)
+        self.assertEqual(d['version'], status.VERSION)
+        self.assertEqual(d['state'], 'sleep')
+        self.assertEqual(d['wake'], d['stateStarted'] + 30)
+        self.s.remove()
+        self.assertEqual(status.read(self.fileName), None)
+        self.s.remove()
+
+    def test_saveFailure(self):
+        self.s.fileName = self.dir + '/missing/status'
+        self.s.setState('sync')
+
+    @mock.patch('bigitr.util.kill')
+    def test_format(self, kill):
+        kill.return_value = True
+        d = {'pid': 10, 'state': 'sync', 'stateStarted': 1000, 'wake': None,
+             'updated': 1000,
+             'jobs': [{'repository': 'path/repo', 'branch': 'b1',
+                       'phase': 'export', 'phaseStarted': 1050,
+                       'started': 1000, 'command': 'cvs commit',
+                       'commandStarted': 1090, 'pid': 11}]}
+        self.assertEqual(status.format(d, now=1100),
+            'bigitrd pid 10: sync for 1m40s\n'
+            'REPOSITORY  BRANCH  PHASE       ELAPSED  PID  COMMAND\n'
+            'path/repo   b1      export 50s  1m40s    11   cvs commit (10s)\n')
+        kill.assert_called_once_with(10, 0)
+
+    @mock.patch('bigitr.util.kill')
+    def test_formatStale(self, kill):
+        kill.return_value = False
+        d = {'pid': 10, 'state': 'sleep', 'stateStarted': 1000,
+             'wake': 1300, 'updated': 1000, 'jobs': []}
+        self.assertEqual(status.format(d, now=1100),
+            'bigitrd pid 10: sleep for 1m40s, next pass in 3m20s\n'
+            '(not running; status last updated 1m40s ago)\n')
+
+    def test_main(self):
+        out = StringIO()
+        self.assertEqual(status.main(self.fileName, out), 1)
+        self.assertEqual(out.getvalue(),
+            'bigitrd is not running: no status in %s\n' %self.fileName)
+        self.s.setState('poll')
+        out = StringIO()
+        self.assertEqual(status.main(self.fileName, out), 0)
+        self.assertTrue(out.getvalue().startswith(
+            'bigitrd pid %d: poll for ' %os.getpid()))
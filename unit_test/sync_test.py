@@ -50,6 +50,14 @@ class TestSync(testutils.TestCase):
             mock.call('repo', Git)])
         self.sync.exp.exportBranches.assert_called_once_with('repo', Git)
 
+    def test_synchronizeMetrics(self):
+        Git = git.Git(self.ctx, 'repo')
+        self.ctx.metrics = mock.Mock()
+        self.sync.synchronize('repo', Git)
+        self.assertEqual(
+            [x[0][:2] for x in self.ctx.metrics.observe.call_args_list],
+            [('repo', 'preimport'), ('repo', 'export'), ('repo', 'import')])
+
     def test_synchronizeNoPreImport(self):
         Git = git.Git(self.ctx, 'repo')
         self.ctx.getExportPreImport = mock.Mock()
@@ -106,3 +114,18 @@ class TestSync(testutils.TestCase):
             mock.call('repo', mock.ANY),
             mock.call('repo2', mock.ANY)])
         self.ctx.logs['repo'].mailLastOutput.assert_called_once_with(mock.ANY)
+
+    @mock.patch('bigitr.git.Git.pushDeferred')
+    def test_synchronizeAllWithPushErrorAfterCommandError(self, pD):
+        def raiseAnError(repo, Git):
+            if repo == 'repo':
+                raise shell.ErrorExitCode(1)
+
+        self.sync.exp.exportBranches.side_effect = raiseAnError
+        pD.side_effect = [RuntimeError('push failed'), None]
+        self.sync.synchronizeAll()
+        # the command failure is still mailed and reported, then the push
+        self.ctx.logs['repo'].mailLastOutput.assert_called_once_with(mock.ANY)
+        self.assertEqual(self.sync.err.report.call_args_list,
+                         [mock.call('repo'), mock.call('repo')])
+        self.assertEqual(pD.call_count, 2)
@@ -42,7 +42,8 @@ class TestUtil(testutils.TestCase):
         self.assertEqual(os.stat(path).st_mode & 0777, self.weirdMode)
 
     def test_copyFiles(self):
-        util.copyFiles(self.s, self.t, ['/a', '/b', '/dir/metoo'])
+        self.assertEqual(
+            util.copyFiles(self.s, self.t, ['/a', '/b', '/dir/metoo']), 7)
         self.assertTrue(os.path.exists(self.t + '/a'))
         self.assertTrue(os.path.exists(self.t + '/b'))
         self.assertTrue(os.path.exists(self.t + '/dir/metoo'))
@@ -64,6 +65,17 @@ class TestUtil(testutils.TestCase):
         self.assertEqual(sorted(util.listFiles(self.s)),
                          ['a', 'b', 'dir/metoo'])
 
+    def test_listFilesPrune(self):
+        os.makedirs(self.s+'/dir/sub')
+        file(self.s+'/dir/sub/c', 'w').write('c')
+        prune = mock.Mock(side_effect=lambda x: x == 'dir')
+        self.assertEqual(sorted(util.listFiles(self.s, prune=prune)),
+                         ['a', 'b'])
+        prune.assert_called_once_with('dir')
+        prune = mock.Mock(side_effect=lambda x: x == 'dir/sub')
+        self.assertEqual(sorted(util.listFiles(self.s, prune=prune)),
+                         ['a', 'b', 'dir/metoo'])
+
     def test_saveDir(self):
         O = object()
         @util.saveDir
@@ -93,3 +105,36 @@ class TestUtil(testutils.TestCase):
 
     def test_killDoesNotExist(self):
         self.assertFalse(util.kill(123456789, 0)) # 32K is max pid
+
+    def test_commandName(self):
+        self.assertEqual(util.commandName(
+            'cvs -Q -d :pserver:cvs.example.com:/cvs export -kk -r HEAD a'),
+            'cvs export')
+        self.assertEqual(util.commandName('/usr/bin/git push origin b'),
+                         'git push')
+        self.assertEqual(util.commandName('git -c a.b=c fetch --all'),
+                         'git fetch')
+        self.assertEqual(util.commandName('hook'), 'hook')
+        self.assertEqual(util.commandName(''), '')
+
+    def test_saveLoadState(self):
+        stateFile = self.d + '/state'
+        self.assertEqual(util.loadState(stateFile, 1), None)
+        self.assertEqual(util.loadState(None, 1), None)
+        util.saveState(stateFile, 1, {'a': 1})
+        self.assertFalse(os.path.exists(stateFile + '.tmp'))
+        self.assertEqual(util.loadState(stateFile, 1), {'a': 1})
+        # saved by another version
+        self.assertEqual(util.loadState(stateFile, 2), None)
+
+    def test_loadStateDamaged(self):
+        stateFile = self.d + '/state'
+        file(stateFile, 'w').write('garbage')
+        self.assertEqual(util.loadState(stateFile, 1), None)
+
+    def test_replaceFile(self):
+        name = self.d + '/replaced'
+        util.replaceFile(name, 'one')
+        util.replaceFile(name, 'two')
+        self.assertEqual(file(name).read(), 'two')
+        self.assertFalse(os.path.exists(name + '.tmp'))